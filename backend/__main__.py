@@ -0,0 +1,226 @@
+"""
+    Headless command line interface: generate schemas and SQL for many tables without Streamlit
+
+    python -m backend --input descriptions/ --output out/ --db-name Postgres
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import tomllib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from backend.core import Core
+from backend import prompts
+from backend.sql_pipeline import build_dependency_levels, get_table_dependencies
+from utils.colored_console_formatter import ColoredConsoleFormatter
+
+logger : logging.Logger = logging.getLogger()
+
+MANIFEST_FILE = '.manifest.json'
+
+def read_table_descriptions(input_path : str) -> dict[str, str]:
+    """
+        Read table descriptions from directory (one *.txt file per table) or JSONL file with name and description
+    """
+    descriptions = {}
+    if os.path.isdir(input_path):
+        for file_name in sorted(os.listdir(input_path)):
+            name, ext = os.path.splitext(file_name)
+            if ext.lower() not in ('.txt', '.md'):
+                continue
+            with open(os.path.join(input_path, file_name), encoding='utf-8') as f:
+                descriptions[name] = f.read().strip()
+        return descriptions
+
+    with open(input_path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            name = item.get('name') or f"table_{line_number}"
+            descriptions[name] = item['description'].strip()
+    return descriptions
+
+def read_secrets(secrets_path : str) -> dict[str, Any]:
+    """
+        Read secrets in Streamlit secrets.toml format
+    """
+    if not os.path.exists(secrets_path):
+        logger.error(f"Secrets file {secrets_path} not found")
+        return {}
+    with open(secrets_path, 'rb') as f:
+        return tomllib.load(f)
+
+def get_input_hash(description : str, args : argparse.Namespace, rules : str, script_definition : str) -> str:
+    """
+        Hash of everything that affects generated output of the table
+    """
+    key = json.dumps([description, args.db_name, rules, script_definition, args.prisma, prompts.PROMPT_VERSION])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def read_text_file(path : str) -> str:
+    """
+        Read optional text file
+    """
+    if not path:
+        return None
+    with open(path, encoding='utf-8') as f:
+        return f.read().strip()
+
+def write_text_file(path : str, text : str):
+    """
+        Write text file
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text or '')
+
+def get_output_files(name : str, args : argparse.Namespace) -> list[str]:
+    """
+        Output files the table must have to be skipped on resume
+    """
+    extensions = ['.xml', '.sql', '.prisma'] if args.prisma else ['.xml', '.sql']
+    return [os.path.join(args.output, f"{name}{ext}") for ext in extensions]
+
+def build_migration_script(output_path : str, names : list[str]) -> str:
+    """
+        Ordered script of all generated tables from output files, so resumed run keeps tables generated before
+    """
+    scripts = {}
+    dependencies = {}
+    for name in names:
+        schema_path, sql_path = os.path.join(output_path, f"{name}.xml"), os.path.join(output_path, f"{name}.sql")
+        if not os.path.exists(schema_path) or not os.path.exists(sql_path):
+            continue
+        try:
+            table_name, table_dependencies = get_table_dependencies(read_text_file(schema_path))
+        except Exception as error: # pylint: disable=W0718
+            logger.error(f"{name}: could not parse table schema: {error}")
+            continue
+        if not table_name:
+            continue
+        scripts[table_name] = read_text_file(sql_path)
+        dependencies[table_name] = table_dependencies
+    levels = build_dependency_levels(dependencies)
+    return "\n\n".join(f"-- {table_name}\n{scripts[table_name]}" for level in levels for table_name in level)
+
+def generate_tables(args : argparse.Namespace, descriptions : dict[str, str], pending : list[str], skipped_tables : list[str], input_hashes : dict[str, str], manifest : dict[str, Any], rules : str, script_definition : str) -> int:
+    """
+        Generate output files of pending tables, generated tables are added to manifest. Returns number of failed tables.
+    """
+    core = Core(read_secrets(args.secrets))
+
+    schema_results, _ = core.generate_sql_schema_batch(args.db_name, [descriptions[name] for name in pending], rules, " ".join(skipped_tables), args.concurrency)
+    failed = 0
+    generated = {}
+    for name, schema_result in zip(pending, schema_results):
+        if schema_result.error:
+            logger.error(f"{name}: {schema_result.error}")
+            failed += 1
+            continue
+        write_text_file(os.path.join(args.output, f"{name}.xml"), schema_result.table_schema)
+        generated[schema_result.table_name] = name
+    trimmed_tables = list(core.trimmed_tables)
+
+    if args.prisma:
+        with ThreadPoolExecutor(max_workers=args.concurrency or core.llm_backend._MAX_CONCURRENCY) as executor: # pylint: disable=W0212
+            futures = {
+                name : executor.submit(core.generate_prisma_schema, args.db_name, descriptions[name], rules, " ".join(skipped_tables))
+                for name in generated.values()
+            }
+            for name, future in futures.items():
+                try:
+                    prisma_schema, _ = future.result()
+                except Exception as error: # pylint: disable=W0718
+                    # table without Prisma output is generated again on resume
+                    logger.error(f"{name}: could not generate Prisma schema: {error}")
+                    failed += 1
+                    continue
+                write_text_file(os.path.join(args.output, f"{name}.prisma"), prisma_schema)
+
+    sql_result, _ = core.generate_sql_pipeline(
+        args.db_name,
+        [schema_result.table_schema for schema_result in schema_results if not schema_result.error],
+        script_definition,
+        " ".join(skipped_tables),
+        args.concurrency
+    )
+    for error in sql_result.errors:
+        logger.warning(error)
+    trimmed_tables.extend(t for t in core.trimmed_tables if t not in trimmed_tables)
+
+    for table_name, table_result in sql_result.tables.items():
+        name = generated.get(table_name)
+        if name is None:
+            continue
+        if table_result.error:
+            failed += 1
+            continue
+        write_text_file(os.path.join(args.output, f"{name}.sql"), table_result.sql_script)
+        manifest[name] = {"hash" : input_hashes[name], "table_name" : table_name}
+
+    if trimmed_tables:
+        logger.warning(f"Existed tables not included into prompts by token budget: {', '.join(trimmed_tables)}")
+    logger.info(f"LLM used tokens: {core.tokens_total_used}")
+    return failed
+
+def main(argv : list[str] = None) -> int:
+    """
+        CLI entry point
+    """
+    parser = argparse.ArgumentParser(prog='python -m backend', description='Generate table schemas and SQL scripts from table descriptions')
+    parser.add_argument('--input', required=True, help='directory with *.txt table descriptions or JSONL file with "name" and "description"')
+    parser.add_argument('--output', required=True, help='output directory')
+    parser.add_argument('--db-name', default='Postgres', help='database name used in prompts')
+    parser.add_argument('--rules', help='file with table rules for schema generation')
+    parser.add_argument('--script-definition', help='file with script definition for SQL generation')
+    parser.add_argument('--secrets', default=os.path.join('.streamlit', 'secrets.toml'), help='secrets file')
+    parser.add_argument('--concurrency', type=int, default=None, help='max concurrent LLM calls')
+    parser.add_argument('--prisma', action='store_true', help='generate Prisma schema too')
+    parser.add_argument('--force', action='store_true', help='regenerate all tables, ignore unchanged inputs')
+    parser.add_argument('--verbose', action='store_true', help='debug logging')
+    args = parser.parse_args(argv)
+
+    if not logger.handlers:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(ColoredConsoleFormatter())
+        logger.addHandler(stream_handler)
+    logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
+    rules = read_text_file(args.rules) or prompts.GENERATE_SCHEMA_DEFAULT_RULES
+    script_definition = read_text_file(args.script_definition) or prompts.GENERATE_SQL_DEFAULT_CRUD
+
+    descriptions = read_table_descriptions(args.input)
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = os.path.join(args.output, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path) and not args.force:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    # skip tables with unchanged input and existing output
+    input_hashes = {name : get_input_hash(description, args, rules, script_definition) for name, description in descriptions.items()}
+    pending = [
+        name for name in descriptions
+        if manifest.get(name, {}).get('hash') != input_hashes[name] or not all(os.path.exists(path) for path in get_output_files(name, args))
+    ]
+    skipped_tables = [manifest[name]['table_name'] for name in descriptions if name not in pending]
+    logger.info(f"Tables: {len(descriptions)}, to generate: {len(pending)}, unchanged: {len(skipped_tables)}")
+    if pending:
+        failed = generate_tables(args, descriptions, pending, skipped_tables, input_hashes, manifest, rules, script_definition)
+    else:
+        failed = 0
+
+    # ordered script of all tables: unchanged ones from previous runs and generated in this run
+    write_text_file(os.path.join(args.output, 'migration.sql'), build_migration_script(args.output, [name for name in descriptions if manifest.get(name, {}).get('hash') == input_hashes[name]]))
+    write_text_file(manifest_path, json.dumps(manifest, indent=2))
+    logger.info(f"Done. Failed: {failed}")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
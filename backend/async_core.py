@@ -0,0 +1,50 @@
+"""
+    Async Core module
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import logging
+from backend.core_base import CoreBase
+
+logger : logging.Logger = logging.getLogger()
+
+class AsyncCore(CoreBase):
+    """
+        Async core class for back-end, to be used from asyncio services
+    """
+
+    async def generate_sql_schema(self, db_name : str, table_description : str, table_rules : str, existed_tables_str : str) -> str :
+        """
+            Generate SQL schema for a table
+        """
+        logger.info("Generate SQL schema...")
+        existed_tables = self.get_existed_tables(existed_tables_str)
+        with self.track_trimmed_tables():
+            table_schema, table_name, tokens_used = await self.llm_backend.agenerate_sql_schema(db_name, table_description, table_rules, existed_tables)
+        self.add_schema_result(table_schema, table_name, tokens_used)
+
+        return table_schema, tokens_used
+
+    async def generate_prisma_schema(self, db_name : str, table_description : str, table_rules : str, existed_tables_str : str) -> str :
+        """
+            Generate Prisma schema for a table
+        """
+        logger.info("Generate Prisma schema...")
+        existed_tables = self.get_existed_tables(existed_tables_str)
+        with self.track_trimmed_tables():
+            table_schema, table_name, tokens_used = await self.llm_backend.agenerate_prisma_schema(db_name, table_description, table_rules, existed_tables)
+        self.add_schema_result(table_schema, table_name, tokens_used)
+
+        return table_schema, tokens_used
+
+    async def generate_sql(self, db_name : str, table_schema : str, script_definition : str, existed_tables_str : str) -> str:
+        """
+            Generate sql for a table
+        """
+        logger.info("Generate_sql...")
+        existed_tables = self.get_existed_tables(existed_tables_str)
+        with self.track_trimmed_tables():
+            new_tables, table_sql, local_errors, tokens_used = await self.llm_backend.agenerate_sql(db_name, table_schema, script_definition, existed_tables)
+        self.add_sql_result(table_sql, new_tables, local_errors, tokens_used)
+
+        return table_sql, tokens_used
@@ -0,0 +1,377 @@
+"""
+    Catalog of existed tables loaded from a live database
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+try:
+    import sqlalchemy
+except ImportError:
+    sqlalchemy = None
+
+from backend.schema_model import TableSchema, FieldSchema, ForeignKeyRef
+
+logger : logging.Logger = logging.getLogger()
+
+@dataclass
+class ColumnInfo:
+    """
+        Table column
+    """
+    name : str
+    type : str
+    nullable : bool = True
+
+@dataclass
+class ForeignKeyInfo:
+    """
+        Foreign key of table
+    """
+    columns : list[str]
+    referred_table : str
+    referred_columns : list[str]
+
+@dataclass
+class TableInfo:
+    """
+        Table metadata
+    """
+    name : str
+    columns : list[ColumnInfo] = field(default_factory=list)
+    primary_key : list[str] = field(default_factory=list)
+    foreign_keys : list[ForeignKeyInfo] = field(default_factory=list)
+    unique_constraints : list[list[str]] = field(default_factory=list)
+    fingerprint : str = None
+
+def get_fingerprint(table : TableInfo) -> str:
+    """
+        Fingerprint of table structure: columns, primary key, foreign keys and unique constraints
+    """
+    structure = [
+        [(c.name, c.type, c.nullable) for c in table.columns],
+        table.primary_key,
+        sorted((fk.columns, fk.referred_table, fk.referred_columns) for fk in table.foreign_keys),
+        sorted(table.unique_constraints)
+    ]
+    return hashlib.sha1(json.dumps(structure).encode('utf-8')).hexdigest()
+
+def get_change_signals(rows : list[tuple]) -> dict[str, str]:
+    """
+        Hash of metadata rows of each table, rows start with table name
+    """
+    rows_by_table = {}
+    for row in rows:
+        rows_by_table.setdefault(row[0], []).append([str(v) for v in row[1:]])
+    return {t : hashlib.sha1(json.dumps(sorted(r)).encode('utf-8')).hexdigest() for t, r in rows_by_table.items()}
+
+_SQLITE_SIGNALS_QUERY = "SELECT tbl_name, type, name, sql FROM sqlite_master WHERE type IN ('table', 'index') AND tbl_name NOT LIKE 'sqlite_%'"
+
+# one query per metadata kind for all tables instead of several inspector queries per table
+_INFORMATION_SCHEMA_SIGNALS_QUERIES = [
+    "SELECT table_name, column_name, data_type, is_nullable, ordinal_position FROM information_schema.columns WHERE table_schema = :schema",
+    "SELECT table_name, constraint_name, constraint_type FROM information_schema.table_constraints WHERE table_schema = :schema",
+    "SELECT table_name, constraint_name, column_name, ordinal_position FROM information_schema.key_column_usage WHERE table_schema = :schema"
+]
+_INFORMATION_SCHEMA_DIALECTS = {'postgresql', 'mysql', 'mariadb', 'mssql', 'duckdb'}
+
+class SQLiteCatalogLoader:
+    """
+        Load metadata of SQLite database with standard sqlite3 module
+    """
+
+    def __init__(self, database_path : str):
+        self.database_path = database_path
+
+    def get_schema_version(self) -> Any:
+        """
+            Value that changes on any schema change
+        """
+        with sqlite3.connect(self.database_path) as connection:
+            return connection.execute("PRAGMA schema_version").fetchone()[0]
+
+    def get_change_signals(self) -> dict[str, str]:
+        """
+            Cheap value of each table that changes with its structure: SQL of table and its indexes from sqlite_master
+        """
+        with sqlite3.connect(self.database_path) as connection:
+            return get_change_signals(list(connection.execute(_SQLITE_SIGNALS_QUERY)))
+
+    def get_fingerprints(self) -> dict[str, str]:
+        """
+            Fingerprint of each table
+        """
+        with sqlite3.connect(self.database_path) as connection:
+            table_names = [r[0] for r in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+            return {table_name : self.read_table(connection, table_name).fingerprint for table_name in table_names}
+
+    def load_table(self, table_name : str) -> TableInfo:
+        """
+            Load table metadata
+        """
+        with sqlite3.connect(self.database_path) as connection:
+            return self.read_table(connection, table_name)
+
+    def read_table(self, connection : sqlite3.Connection, table_name : str) -> TableInfo:
+        """
+            Table metadata with fingerprint
+        """
+        rows = list(connection.execute(f'PRAGMA table_info("{table_name}")'))
+        foreign_keys = {}
+        for row in connection.execute(f'PRAGMA foreign_key_list("{table_name}")'):
+            fk_id, _, referred_table, column, referred_column = row[:5]
+            fk = foreign_keys.setdefault(fk_id, ForeignKeyInfo([], referred_table, []))
+            fk.columns.append(column)
+            fk.referred_columns.append(referred_column)
+        unique_constraints = []
+        for _, index_name, unique, origin, *_ in connection.execute(f'PRAGMA index_list("{table_name}")'):
+            if unique and origin != 'pk':
+                unique_constraints.append([r[2] for r in sorted(connection.execute(f'PRAGMA index_info("{index_name}")'))])
+        columns = [ColumnInfo(r[1], r[2], not r[3]) for r in rows]
+        primary_key = [r[1] for r in sorted(rows, key=lambda r: r[5]) if r[5]]
+        table = TableInfo(table_name, columns, primary_key, list(foreign_keys.values()), unique_constraints)
+        table.fingerprint = get_fingerprint(table)
+        return table
+
+class SqlAlchemyCatalogLoader:
+    """
+        Load metadata of any database supported by SQLAlchemy (Postgres, MySQL, SQL Server, DuckDB...)
+    """
+
+    def __init__(self, database_url : str, schema : str = None):
+        self.engine = sqlalchemy.create_engine(database_url)
+        self.schema = schema
+
+    def get_schema_version(self) -> Any:
+        """
+            No cheap schema version in general case
+        """
+        return None
+
+    def get_change_signals(self) -> dict[str, str]:
+        """
+            Cheap value of each table that changes with its structure: sqlite_master for SQLite,
+            columns and constraints from information_schema for other known dialects.
+            None if dialect has no such source, fingerprints of all tables are used then.
+        """
+        dialect_name = self.engine.dialect.name
+        with self.engine.connect() as connection:
+            if dialect_name == 'sqlite':
+                return get_change_signals(list(connection.exec_driver_sql(_SQLITE_SIGNALS_QUERY)))
+            if dialect_name not in _INFORMATION_SCHEMA_DIALECTS:
+                return None
+            schema = self.schema or sqlalchemy.inspect(connection).default_schema_name
+            rows = []
+            for query in _INFORMATION_SCHEMA_SIGNALS_QUERIES:
+                rows.extend(connection.execute(sqlalchemy.text(query), {"schema" : schema}))
+            return get_change_signals(rows)
+
+    def get_fingerprints(self) -> dict[str, str]:
+        """
+            Fingerprint of each table
+        """
+        inspector = sqlalchemy.inspect(self.engine)
+        return {table_name : self.read_table(inspector, table_name).fingerprint for table_name in inspector.get_table_names(schema=self.schema)}
+
+    def load_table(self, table_name : str) -> TableInfo:
+        """
+            Load table metadata
+        """
+        return self.read_table(sqlalchemy.inspect(self.engine), table_name)
+
+    def read_table(self, inspector : Any, table_name : str) -> TableInfo:
+        """
+            Table metadata with fingerprint
+        """
+        columns = [ColumnInfo(c['name'], str(c['type']), bool(c.get('nullable', True))) for c in inspector.get_columns(table_name, schema=self.schema)]
+        primary_key = inspector.get_pk_constraint(table_name, schema=self.schema).get('constrained_columns') or []
+        foreign_keys = [
+            ForeignKeyInfo(fk['constrained_columns'], fk['referred_table'], fk['referred_columns'])
+            for fk in inspector.get_foreign_keys(table_name, schema=self.schema)
+        ]
+        unique_constraints = [list(u['column_names']) for u in inspector.get_unique_constraints(table_name, schema=self.schema)]
+        table = TableInfo(table_name, columns, primary_key, foreign_keys, unique_constraints)
+        table.fingerprint = get_fingerprint(table)
+        return table
+
+class DatabaseCatalog:
+    """
+        In-memory index of tables with fast lookup by table and column name.
+        Refresh reloads only tables whose cheap change signal has changed, periodic refresh runs in background thread.
+    """
+
+    def __init__(self, loader : Any, refresh_seconds : float = 60):
+        self.loader = loader
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.refresh_thread : threading.Thread = None
+        self.tables : dict[str, TableInfo] = {}
+        self.tables_lower : dict[str, str] = {}
+        self.column_index : dict[str, set[str]] = {}
+        self.change_signals : dict[str, str] = {}
+        self.schema_version = None
+        self.refreshed_at = 0.0
+
+    @classmethod
+    def from_url(cls, database_url : str, schema : str = None, refresh_seconds : float = 60) -> 'DatabaseCatalog':
+        """
+            Create catalog for SQLAlchemy URL, plain sqlite:/// URL works without SQLAlchemy
+        """
+        if sqlalchemy is None:
+            if not database_url.startswith('sqlite:///'):
+                raise ValueError('SQLAlchemy is required for non-SQLite databases')
+            return cls(SQLiteCatalogLoader(database_url[len('sqlite:///'):]), refresh_seconds)
+        return cls(SqlAlchemyCatalogLoader(database_url, schema), refresh_seconds)
+
+    def refresh(self) -> list[str]:
+        """
+            Reload tables with changed signal, returns names of changed, added and removed tables.
+            Database is read without index lock, so lookups are not blocked while refresh is running.
+        """
+        with self.refresh_lock:
+            self.refreshed_at = time.time()
+            schema_version = self.loader.get_schema_version()
+            if schema_version is not None and schema_version == self.schema_version:
+                return []
+
+            change_signals = self.loader.get_change_signals()
+            if change_signals is None:
+                change_signals = self.loader.get_fingerprints()
+            loaded = [self.loader.load_table(t) for t, signal in change_signals.items() if self.change_signals.get(t) != signal]
+
+            with self.lock:
+                changed = [t for t in self.tables if t not in change_signals]
+                for table_name in changed:
+                    self.remove_table(table_name)
+                for table in loaded:
+                    old_table = self.tables.get(table.name)
+                    # signal can change without change of structure (index rebuilt, table recreated as is)
+                    if old_table is not None and old_table.fingerprint == table.fingerprint:
+                        continue
+                    if old_table is not None:
+                        self.remove_table(table.name)
+                    self.add_table(table)
+                    changed.append(table.name)
+
+            self.change_signals = change_signals
+            self.schema_version = schema_version
+            if changed:
+                logger.info(f"Catalog refreshed: {len(self.tables)} tables, changed {len(changed)}")
+            return changed
+
+    def refresh_safe(self):
+        """
+            Refresh, errors are logged
+        """
+        try:
+            self.refresh()
+        except Exception as error: # pylint: disable=W0718
+            logger.error(f"Could not refresh catalog: {error}")
+
+    def refresh_if_due(self):
+        """
+            Refresh if refresh interval has passed: the first load is done synchronously,
+            later refreshes run in background thread and lookups use current tables meanwhile
+        """
+        if time.time() - self.refreshed_at < self.refresh_seconds:
+            return
+        if self.refreshed_at == 0.0:
+            self.refresh_safe()
+            return
+        with self.lock:
+            if self.refresh_thread is not None and self.refresh_thread.is_alive():
+                return
+            self.refresh_thread = threading.Thread(target=self.refresh_safe, name='catalog-refresh', daemon=True)
+            self.refresh_thread.start()
+
+    def add_table(self, table : TableInfo):
+        """
+            Add table to index, lock must be held
+        """
+        self.tables[table.name] = table
+        self.tables_lower[table.name.lower()] = table.name
+        for column in table.columns:
+            self.column_index.setdefault(column.name.lower(), set()).add(table.name)
+
+    def remove_table(self, table_name : str):
+        """
+            Remove table from index, lock must be held
+        """
+        table = self.tables.pop(table_name)
+        self.tables_lower.pop(table_name.lower(), None)
+        for column in table.columns:
+            tables = self.column_index.get(column.name.lower())
+            if tables:
+                tables.discard(table_name)
+                if not tables:
+                    del self.column_index[column.name.lower()]
+
+    def table_names(self) -> list[str]:
+        """
+            Names of all tables
+        """
+        with self.lock:
+            return list(self.tables)
+
+    def has_table(self, table_name : str) -> bool:
+        """
+            Check table exists (case-insensitive)
+        """
+        with self.lock:
+            return table_name.lower() in self.tables_lower
+
+    def get_table(self, table_name : str) -> TableInfo:
+        """
+            Table metadata by name (case-insensitive), None if not found
+        """
+        with self.lock:
+            name = self.tables_lower.get(table_name.lower())
+            return self.tables.get(name) if name else None
+
+    def get_table_schema(self, table_name : str) -> TableSchema:
+        """
+            Table as schema model (columns, primary, foreign and unique keys), None if not found
+        """
+        table = self.get_table(table_name)
+        if table is None:
+            return None
+        foreign_keys = {c : ForeignKeyRef(fk.referred_table, rc) for fk in table.foreign_keys for c, rc in zip(fk.columns, fk.referred_columns)}
+        unique_columns = {u[0] for u in table.unique_constraints if len(u) == 1}
+        fields = [
+            FieldSchema(c.name, c.type, primary_key=c.name in table.primary_key, not_null=not c.nullable and c.name not in table.primary_key, unique=c.name in unique_columns, foreign_key=foreign_keys.get(c.name))
+            for c in table.columns
+        ]
+        return TableSchema(table.name, fields, [tuple(u) for u in table.unique_constraints if len(u) > 1])
+
+    def find_tables_by_column(self, column_name : str) -> set[str]:
+        """
+            Tables with the column
+        """
+        with self.lock:
+            return set(self.column_index.get(column_name.lower(), ()))
+
+_shared_catalogs : dict[str, DatabaseCatalog] = {}
+_shared_catalogs_lock = threading.Lock()
+
+def get_shared_catalog(all_secrets : dict[str, Any]) -> DatabaseCatalog:
+    """
+        Process-wide catalog from [catalog] section of secrets (DATABASE_URL, SCHEMA, REFRESH_SECONDS), None if not configured
+    """
+    catalog_secrets = all_secrets.get('catalog') if all_secrets else None
+    if not catalog_secrets or not catalog_secrets.get('DATABASE_URL'):
+        return None
+    database_url = catalog_secrets['DATABASE_URL']
+    with _shared_catalogs_lock:
+        catalog = _shared_catalogs.get(database_url)
+        if catalog is None:
+            catalog = DatabaseCatalog.from_url(database_url, catalog_secrets.get('SCHEMA'), float(catalog_secrets.get('REFRESH_SECONDS', 60)))
+            _shared_catalogs[database_url] = catalog
+    return catalog
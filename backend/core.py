@@ -4,45 +4,59 @@
 # pylint: disable=C0301,C0103,C0303,C0411,W1203
 
 import logging
-from typing import Any
-from backend.llm_core import LLMCore 
+from backend.core_base import CoreBase
+from backend.llm_core import TableSchemaResult, SqlStream
+from backend.sql_pipeline import SqlPipeline, SqlPipelineResult
+from backend.incremental_sql import IncrementalSqlGenerator, IncrementalSqlResult, get_generation_context
+from backend.procedures import ProcedureGenerator, ProceduresResult
+from backend.schema_model import parse_table_schemas
+from backend.ddl_generator import generate_prisma_model
+from backend.sql_transpiler import SqlTranspiler, DialectSqlResult
 
 logger : logging.Logger = logging.getLogger()
 
-class Core:
+class Core(CoreBase):
     """
         Core class for back-end
     """
 
-    llm_backend = None
-
-    def __init__(self, all_secrets : dict[str, Any]):
-        logger.info("Core init")
-        self.llm_backend = LLMCore(all_secrets)
-
     def generate_sql_schema(self, db_name : str, table_description : str, table_rules : str, existed_tables_str : str) -> str :
         """
             Generate SQL schema for a table
         """
         logger.info("Generate SQL schema...")
-        existed_tables = existed_tables_str.split()
-        table_schema, table_name, tokens_used = self.llm_backend.generate_sql_schema(db_name, table_description, table_rules, existed_tables)
-        logger.debug(f"table_schema: {table_schema}")
-        logger.debug(f"table_name: {table_name}")
-        logger.debug(f"LLM used tokens: {tokens_used}")
+        existed_tables = self.get_existed_tables(existed_tables_str)
+        with self.track_trimmed_tables():
+            table_schema, table_name, tokens_used = self.llm_backend.generate_sql_schema(db_name, table_description, table_rules, existed_tables)
+        self.add_schema_result(table_schema, table_name, tokens_used)
 
         return table_schema, tokens_used
+
+    def generate_sql_schema_batch(self, db_name : str, table_descriptions : list[str], table_rules : str, existed_tables_str : str, max_concurrency : int = None) -> tuple[list[TableSchemaResult], int]:
+        """
+            Generate SQL schemas for many tables concurrently
+        """
+        logger.info(f"Generate SQL schema batch for {len(table_descriptions)} tables...")
+        existed_tables = self.get_existed_tables(existed_tables_str)
+        with self.track_trimmed_tables():
+            results = self.llm_backend.generate_sql_schema_batch(db_name, table_descriptions, table_rules, existed_tables, max_concurrency)
+        tokens_used = sum(r.tokens_used for r in results)
+        errors = [r for r in results if r.error]
+        logger.debug(f"Generated schemas: {len(results) - len(errors)}, errors: {len(errors)}")
+        logger.debug(f"LLM used tokens: {tokens_used}")
+        self.tokens_total_used += tokens_used
+
+        return results, tokens_used
     
     def generate_prisma_schema(self, db_name : str, table_description : str, table_rules : str, existed_tables_str : str) -> str :
         """
             Generate Prisma schema for a table
         """
         logger.info("Generate Prisma schema...")
-        existed_tables = existed_tables_str.split()
-        table_schema, table_name, tokens_used = self.llm_backend.generate_prisma_schema(db_name, table_description, table_rules, existed_tables)
-        logger.debug(f"table_schema: {table_schema}")
-        logger.debug(f"table_name: {table_name}")
-        logger.debug(f"LLM used tokens: {tokens_used}")
+        existed_tables = self.get_existed_tables(existed_tables_str)
+        with self.track_trimmed_tables():
+            table_schema, table_name, tokens_used = self.llm_backend.generate_prisma_schema(db_name, table_description, table_rules, existed_tables)
+        self.add_schema_result(table_schema, table_name, tokens_used)
 
         return table_schema, tokens_used
 
@@ -51,11 +65,101 @@ class Core:
             Generate sql for a table
         """
         logger.info("Generate_sql...")
-        existed_tables = existed_tables_str.split()
-        new_tables, table_sql, local_errors, tokens_used = self.llm_backend.generate_sql(db_name, table_schema, script_definition, existed_tables)
-        logger.debug(f"Table sql: {table_sql}")
-        logger.debug(f"New tables: {new_tables}")
-        logger.debug(f"Local errors: {local_errors}")
-        logger.debug(f"LLM used tokens: {tokens_used}")
+        existed_tables = self.get_existed_tables(existed_tables_str)
+        with self.track_trimmed_tables():
+            new_tables, table_sql, local_errors, tokens_used = self.llm_backend.generate_sql(db_name, table_schema, script_definition, existed_tables)
+        self.add_sql_result(table_sql, new_tables, local_errors, tokens_used)
 
         return table_sql, tokens_used
+
+    def generate_sql_stream(self, db_name : str, table_schema : str, script_definition : str, existed_tables_str : str) -> SqlStream:
+        """
+            Generate sql for a table in streaming mode, iterate result to get sql text chunks
+        """
+        logger.info("Generate_sql stream...")
+        existed_tables = self.get_existed_tables(existed_tables_str)
+        with self.track_trimmed_tables():
+            return self.llm_backend.generate_sql_stream(db_name, table_schema, script_definition, existed_tables)
+
+    def generate_sql_pipeline(self, db_name : str, table_schemas : list[str], script_definition : str, existed_tables_str : str, max_concurrency : int = None) -> tuple[SqlPipelineResult, int]:
+        """
+            Generate one ordered sql script for many tables following foreign key dependencies
+        """
+        logger.info(f"Generate SQL pipeline for {len(table_schemas)} tables...")
+        existed_tables = self.get_existed_tables(existed_tables_str)
+        with self.track_trimmed_tables():
+            result = SqlPipeline(self.llm_backend).run(db_name, table_schemas, script_definition, existed_tables, max_concurrency)
+        logger.debug(f"Levels: {result.levels}")
+        logger.debug(f"Errors: {result.errors}")
+        logger.debug(f"LLM used tokens: {result.tokens_used}")
+        self.tokens_total_used += result.tokens_used
+
+        return result, result.tokens_used
+
+    def get_sql_generation_context(self, db_name : str, script_definition : str, existed_tables_str : str) -> str:
+        """
+            Context of sql generation to pass to the next incremental generation
+        """
+        return get_generation_context(db_name, script_definition, self.get_existed_tables(existed_tables_str))
+
+    def generate_sql_incremental(self, db_name : str, old_table_schema : str, table_schema : str, old_sql_script : str, script_definition : str, existed_tables_str : str, old_context : str = None, force : bool = False) -> tuple[IncrementalSqlResult, int]:
+        """
+            Regenerate only sql affected by changes of table schema since previous generation with the same context
+        """
+        logger.info("Generate SQL incrementally...")
+        existed_tables = self.get_existed_tables(existed_tables_str)
+        with self.track_trimmed_tables():
+            result = IncrementalSqlGenerator(self.llm_backend).run(db_name, old_table_schema, table_schema, old_sql_script, script_definition, existed_tables, old_context, force)
+        logger.debug(f"Regenerated: {result.regenerated}")
+        logger.debug(f"Migration: {result.migration_script}")
+        logger.debug(f"LLM used tokens: {result.tokens_used}")
+        self.tokens_total_used += result.tokens_used
+
+        return result, result.tokens_used
+
+    def generate_prisma_from_schema(self, table_schemas : str) -> str:
+        """
+            Prisma models for tables of schema XML, generated locally without LLM
+        """
+        tables = parse_table_schemas(table_schemas) if table_schemas and table_schemas.strip() else []
+        return "\n\n".join(generate_prisma_model(t) for t in tables if t is not None and t.name)
+
+    def get_catalog_table_names(self) -> list[str]:
+        """
+            Names of tables from database catalog, empty if catalog is not configured
+        """
+        if self.catalog is None:
+            return []
+        self.catalog.refresh_if_due()
+        return sorted(self.catalog.table_names())
+
+    def generate_procedures(self, db_name : str, table_schemas : str, catalog_tables : list[str], procedure_spec : str, existed_tables_str : str, max_concurrency : int = None) -> tuple[ProceduresResult, int]:
+        """
+            Generate procedures for tables from schemas text (several XML tables or Prisma models) and tables from catalog
+        """
+        existed_tables = self.get_existed_tables(existed_tables_str)
+        tables = parse_table_schemas(table_schemas) if table_schemas and table_schemas.strip() else []
+        if self.catalog is not None:
+            tables.extend(self.catalog.get_table_schema(t) for t in catalog_tables or [])
+        logger.info(f"Generate procedures for {len(tables)} tables...")
+        with self.track_trimmed_tables():
+            result = ProcedureGenerator(self.llm_backend).run(db_name, tables, procedure_spec, existed_tables, max_concurrency)
+        logger.debug(f"Errors: {result.errors}")
+        logger.debug(f"LLM used tokens: {result.tokens_used}")
+        self.tokens_total_used += result.tokens_used
+
+        return result, result.tokens_used
+
+    def transpile_sql(self, db_name : str, sql_script : str, target_db_names : list[str]) -> tuple[list[DialectSqlResult], int]:
+        """
+            Translate script generated for one database to other databases,
+            only statements that sqlglot can't translate are sent to LLM
+        """
+        target_db_names = [t for t in dict.fromkeys(t.strip() for t in target_db_names) if t and t.lower() != db_name.lower()]
+        logger.info(f"Transpile SQL from {db_name} to {target_db_names}...")
+        results = SqlTranspiler(self.llm_backend).run(db_name, sql_script, target_db_names)
+        tokens_used = sum(r.tokens_used for r in results)
+        logger.debug(f"LLM used tokens: {tokens_used}")
+        self.tokens_total_used += tokens_used
+
+        return results, tokens_used
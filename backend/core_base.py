@@ -0,0 +1,73 @@
+"""
+    Session state and helpers shared by Core and AsyncCore
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import logging
+from contextlib import contextmanager
+from typing import Any, Iterator
+from backend import prompt_budget
+from backend.catalog import DatabaseCatalog, get_shared_catalog
+from backend.llm_core import LLMCore, get_shared_llm_core
+
+logger : logging.Logger = logging.getLogger()
+
+class CoreBase:
+    """
+        Base class of back-end facades: shared LLM backend and catalog, own token counter of the session
+    """
+
+    llm_backend : LLMCore = None
+    tokens_total_used : int = 0
+    catalog : DatabaseCatalog = None
+    trimmed_tables : list[str] = None
+
+    def __init__(self, all_secrets : dict[str, Any]):
+        logger.info(f"{type(self).__name__} init")
+        # LLM backend is shared by all sessions, session keeps only own token counter
+        self.llm_backend = get_shared_llm_core(all_secrets)
+        self.tokens_total_used = 0
+        self.catalog = get_shared_catalog(all_secrets)
+        # existed tables trimmed from prompts of the last generation by token budget
+        self.trimmed_tables = []
+
+    def get_existed_tables(self, existed_tables_str : str) -> list[str]:
+        """
+            Existed tables entered by user and tables from database catalog (if configured)
+        """
+        existed_tables = existed_tables_str.split()
+        if self.catalog is not None:
+            self.catalog.refresh_if_due()
+            entered_tables = set(existed_tables)
+            existed_tables.extend(t for t in self.catalog.table_names() if t not in entered_tables)
+        return existed_tables
+
+    @contextmanager
+    def track_trimmed_tables(self) -> Iterator[None]:
+        """
+            Keep existed tables trimmed from prompts of the generation, so UI and CLI can report them
+        """
+        with prompt_budget.track_trimmed_tables() as trimmed_tables:
+            try:
+                yield
+            finally:
+                self.trimmed_tables = trimmed_tables
+
+    def add_schema_result(self, table_schema : str, table_name : str, tokens_used : int):
+        """
+            Log generated schema and count used tokens
+        """
+        logger.debug(f"table_schema: {table_schema}")
+        logger.debug(f"table_name: {table_name}")
+        logger.debug(f"LLM used tokens: {tokens_used}")
+        self.tokens_total_used += tokens_used
+
+    def add_sql_result(self, table_sql : str, new_tables : list[str], local_errors : list[str], tokens_used : int):
+        """
+            Log generated sql and count used tokens
+        """
+        logger.debug(f"Table sql: {table_sql}")
+        logger.debug(f"New tables: {new_tables}")
+        logger.debug(f"Local errors: {local_errors}")
+        logger.debug(f"LLM used tokens: {tokens_used}")
+        self.tokens_total_used += tokens_used
@@ -0,0 +1,240 @@
+"""
+    Deterministic generation of table DDL and Prisma model from table schema, without LLM
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import logging
+import re
+
+from backend.schema_model import FieldSchema, TableSchema
+from backend.sql_validator import get_sqlglot_dialect
+
+logger : logging.Logger = logging.getLogger()
+
+_TYPE_RE = re.compile(r'^\s*([A-Za-z][A-Za-z0-9_ ]*?)\s*(\((.*)\))?\s*$')
+
+_SERIAL_TYPES = {
+    'SMALLSERIAL' : 'SMALLINT',
+    'SERIAL'      : 'INT',
+    'BIGSERIAL'   : 'BIGINT'
+}
+
+# auto increment column definition per dialect, {type} is integer type of serial
+_AUTO_INCREMENT = {
+    'postgres'  : None, # SERIAL types are native
+    'redshift'  : '{type} IDENTITY(1,1)',
+    'mysql'     : '{type} AUTO_INCREMENT',
+    'tsql'      : '{type} IDENTITY(1,1)',
+    'sqlite'    : 'INTEGER', # INTEGER PRIMARY KEY is alias of rowid
+    'oracle'    : 'NUMBER GENERATED BY DEFAULT AS IDENTITY',
+    'snowflake' : '{type} AUTOINCREMENT',
+    'duckdb'    : '{type}'
+}
+
+# generic types (e.g. from Prisma schema) that the database names differently
+_DIALECT_TYPES = {
+    'postgres' : {'BLOB' : 'BYTEA', 'DATETIME' : 'TIMESTAMP', 'DOUBLE' : 'DOUBLE PRECISION'},
+    'redshift' : {'BLOB' : 'VARBYTE', 'DATETIME' : 'TIMESTAMP', 'JSON' : 'SUPER'},
+    'mysql'    : {'TIMESTAMPTZ' : 'TIMESTAMP', 'BYTEA' : 'BLOB', 'JSONB' : 'JSON'},
+    'tsql'     : {'BOOLEAN' : 'BIT', 'TEXT' : 'NVARCHAR(MAX)', 'TIMESTAMP' : 'DATETIME2', 'TIMESTAMPTZ' : 'DATETIMEOFFSET', 'JSON' : 'NVARCHAR(MAX)', 'JSONB' : 'NVARCHAR(MAX)', 'BLOB' : 'VARBINARY(MAX)', 'BYTEA' : 'VARBINARY(MAX)', 'DOUBLE' : 'FLOAT'},
+    'sqlite'   : {},
+    'oracle'   : {'BOOLEAN' : 'NUMBER(1)', 'TEXT' : 'CLOB', 'JSON' : 'CLOB', 'JSONB' : 'CLOB', 'BYTEA' : 'BLOB', 'DATETIME' : 'TIMESTAMP', 'DOUBLE' : 'BINARY_DOUBLE', 'BIGINT' : 'NUMBER(19)'},
+    'snowflake': {'JSON' : 'VARIANT', 'JSONB' : 'VARIANT', 'BYTEA' : 'BINARY', 'BLOB' : 'BINARY'},
+    'duckdb'   : {'DATETIME' : 'TIMESTAMP', 'BYTEA' : 'BLOB', 'JSONB' : 'JSON'}
+}
+
+_BOOLEAN_AS_NUMBER = ('tsql', 'oracle')
+
+_PRISMA_TYPES = {
+    'Int'      : ('INT', 'INTEGER', 'SMALLINT', 'TINYINT', 'MEDIUMINT', 'SERIAL', 'SMALLSERIAL'),
+    'BigInt'   : ('BIGINT', 'BIGSERIAL'),
+    'String'   : ('VARCHAR', 'CHAR', 'NVARCHAR', 'NCHAR', 'VARCHAR2', 'NVARCHAR2', 'TEXT', 'NTEXT', 'CLOB', 'UUID', 'UNIQUEIDENTIFIER', 'CHARACTER VARYING'),
+    'Boolean'  : ('BOOLEAN', 'BOOL', 'BIT'),
+    'DateTime' : ('TIMESTAMP', 'TIMESTAMPTZ', 'DATETIME', 'DATETIME2', 'DATETIMEOFFSET', 'DATE', 'TIME'),
+    'Float'    : ('FLOAT', 'REAL', 'DOUBLE', 'DOUBLE PRECISION', 'BINARY_DOUBLE'),
+    'Decimal'  : ('DECIMAL', 'NUMERIC', 'MONEY', 'NUMBER'),
+    'Json'     : ('JSON', 'JSONB'),
+    'Bytes'    : ('BLOB', 'BYTEA', 'BINARY', 'VARBINARY')
+}
+_PRISMA_TYPE_BY_SQL_TYPE = {sql_type : prisma_type for prisma_type, sql_types in _PRISMA_TYPES.items() for sql_type in sql_types}
+
+# SQL types with arguments kept as Prisma native type attribute
+_PRISMA_NATIVE_TYPES = {
+    'VARCHAR'  : 'VarChar',
+    'CHAR'     : 'Char',
+    'NVARCHAR' : 'NVarChar',
+    'DECIMAL'  : 'Decimal',
+    'NUMERIC'  : 'Decimal'
+}
+
+def split_type(sql_type : str) -> tuple[str, str]:
+    """
+        Upper case type name and arguments: VARCHAR(100) -> VARCHAR, 100
+    """
+    type_match = _TYPE_RE.match(sql_type or '')
+    if type_match is None:
+        return (sql_type or '').strip().upper(), None
+    return re.sub(r'\s+', ' ', type_match.group(1)).upper(), type_match.group(3)
+
+def is_supported_database(db_name : str) -> bool:
+    """
+        DDL of the database can be generated locally
+    """
+    return get_sqlglot_dialect(db_name) in _AUTO_INCREMENT
+
+def is_auto_increment(field : FieldSchema) -> bool:
+    """
+        Field has SERIAL type
+    """
+    return split_type(field.type)[0] in _SERIAL_TYPES
+
+def get_column_type(field : FieldSchema, dialect : str) -> str:
+    """
+        Column type for the dialect, generic types are mapped to types of the database
+    """
+    type_name, arguments = split_type(field.type)
+    if type_name in _SERIAL_TYPES and _AUTO_INCREMENT[dialect] is not None:
+        return _AUTO_INCREMENT[dialect].format(type=_SERIAL_TYPES[type_name])
+    if arguments is None and type_name in _DIALECT_TYPES[dialect]:
+        return _DIALECT_TYPES[dialect][type_name]
+    return field.type or 'TEXT'
+
+def get_default_value(field : FieldSchema, dialect : str) -> str:
+    """
+        Default value for the dialect, booleans are numbers in SQL Server and Oracle
+    """
+    default = field.default
+    if dialect in _BOOLEAN_AS_NUMBER and default.lower() in ('true', 'false'):
+        return '1' if default.lower() == 'true' else '0'
+    return default
+
+def get_column_definition(field : FieldSchema, dialect : str, inline_primary_key : bool) -> str:
+    """
+        Column definition of CREATE TABLE
+    """
+    definition = f"{field.name} {get_column_type(field, dialect)}"
+    if inline_primary_key:
+        definition += " PRIMARY KEY AUTOINCREMENT" if dialect == 'sqlite' and is_auto_increment(field) else " PRIMARY KEY"
+    elif field.not_null:
+        definition += " NOT NULL"
+    if field.default is not None and not is_auto_increment(field):
+        definition += f" DEFAULT {get_default_value(field, dialect)}"
+    return definition
+
+def generate_table_sql(table : TableSchema, db_name : str) -> str:
+    """
+        CREATE TABLE with named primary key, unique and foreign key constraints and indexes of foreign keys.
+        Raises ValueError if the database is not supported.
+    """
+    dialect = get_sqlglot_dialect(db_name)
+    if dialect not in _AUTO_INCREMENT:
+        raise ValueError(f"DDL generation is not supported for {db_name}")
+
+    primary_key = table.primary_key
+    # SQLite allows AUTOINCREMENT only in column definition of single primary key
+    inline_primary_key = len(primary_key) == 1 and dialect == 'sqlite'
+    lines = [get_column_definition(f, dialect, inline_primary_key and f.primary_key) for f in table.fields]
+    if primary_key and not inline_primary_key:
+        lines.append(f"CONSTRAINT pk_{table.name} PRIMARY KEY ({', '.join(primary_key)})")
+    for field in table.fields:
+        if field.unique and not field.primary_key:
+            lines.append(f"CONSTRAINT uq_{table.name}_{field.name} UNIQUE ({field.name})")
+    for columns in table.unique_constraints:
+        lines.append(f"CONSTRAINT uq_{table.name}_{'_'.join(columns)} UNIQUE ({', '.join(columns)})")
+    for field in table.foreign_keys:
+        lines.append(f"CONSTRAINT fk_{table.name}_{field.name} FOREIGN KEY ({field.name}) REFERENCES {field.foreign_key}")
+    columns_sql = ",\n    ".join(lines)
+    statements = [f"-- Create table\nCREATE TABLE {table.name} (\n    {columns_sql}\n);"]
+
+    # foreign keys are not indexed automatically, except when column is first in primary key or unique
+    indexed = {c[0].lower() for c in [primary_key] + table.unique_constraints if c} | {f.name.lower() for f in table.fields if f.unique}
+    indexes = [f"CREATE INDEX ix_{table.name}_{f.name} ON {table.name} ({f.name});" for f in table.foreign_keys if f.name.lower() not in indexed]
+    if indexes:
+        statements.append("-- Indexes of foreign keys\n" + "\n".join(indexes))
+    return "\n\n".join(statements)
+
+def get_prisma_type(field : FieldSchema) -> tuple[str, str]:
+    """
+        Prisma scalar type and native type attribute of the field
+    """
+    type_name, arguments = split_type(field.type)
+    prisma_type = _PRISMA_TYPE_BY_SQL_TYPE.get(type_name)
+    if prisma_type is None:
+        return f'Unsupported("{field.type}")', None
+    if type_name == 'NUMBER' and arguments and ',' not in arguments:
+        # Oracle NUMBER(n) is integer
+        prisma_type = 'Int' if int(arguments.strip() or 0) <= 9 else 'BigInt'
+    native_type = _PRISMA_NATIVE_TYPES.get(type_name)
+    if native_type and arguments and prisma_type != 'Int':
+        return prisma_type, f"@db.{native_type}({', '.join(a.strip() for a in arguments.split(','))})"
+    return prisma_type, None
+
+def get_prisma_default(field : FieldSchema, prisma_type : str) -> str:
+    """
+        @default attribute of the field, None if there is no default
+    """
+    if is_auto_increment(field):
+        return "@default(autoincrement())"
+    if field.default is None:
+        return None
+    default = field.default.strip()
+    if default.upper() in ('CURRENT_TIMESTAMP', 'CURRENT_TIMESTAMP()', 'NOW()', 'GETDATE()', 'SYSDATE', 'SYSTIMESTAMP'):
+        return "@default(now())"
+    if prisma_type == 'Boolean' and default.lower() in ('true', 'false', '1', '0'):
+        return f"@default({'true' if default.lower() in ('true', '1') else 'false'})"
+    if re.fullmatch(r'-?\d+(\.\d+)?', default):
+        return f"@default({default})"
+    if len(default) > 1 and default[0] == default[-1] == "'":
+        return f'@default("{default[1:-1]}")'
+    return f'@default(dbgenerated("{default}"))'
+
+def get_relation_field_name(field : FieldSchema) -> str:
+    """
+        Name of the relation field: user_id -> user, created_by -> created_by_ref
+    """
+    name = re.sub(r'_?id$', '', field.name, flags=re.IGNORECASE)
+    return name if name and name != field.name else f"{field.name}_ref"
+
+def generate_prisma_model(table : TableSchema) -> str:
+    """
+        Prisma model with relation fields for foreign keys. Several relations to the same table are named,
+        self relation gets back relation field, back relations of other models are not generated.
+    """
+    primary_key = table.primary_key
+    rows = []
+    for field in table.fields:
+        prisma_type, native_type = get_prisma_type(field)
+        optional = '' if field.not_null or field.primary_key else '?'
+        attributes = []
+        if field.primary_key and len(primary_key) == 1:
+            attributes.append("@id")
+        attributes.append(get_prisma_default(field, prisma_type))
+        if field.unique and not field.primary_key:
+            attributes.append("@unique")
+        attributes.append(native_type)
+        rows.append((field.name, f"{prisma_type}{optional}", " ".join(a for a in attributes if a)))
+
+    referenced_tables = [f.foreign_key.table.lower() for f in table.foreign_keys]
+    field_names = {f.name.lower() for f in table.fields}
+    for field in table.foreign_keys:
+        reference = field.foreign_key
+        relation_field = get_relation_field_name(field)
+        if relation_field.lower() in field_names:
+            relation_field = f"{field.name}_ref"
+        is_self = reference.table.lower() == (table.name or '').lower()
+        named = is_self or referenced_tables.count(reference.table.lower()) > 1
+        relation_name = f'"{table.name}_{field.name}", ' if named else ''
+        optional = '' if field.not_null else '?'
+        rows.append((relation_field, f"{reference.table}{optional}", f"@relation({relation_name}fields: [{field.name}], references: [{reference.column}])"))
+        if is_self:
+            rows.append((f"{relation_field}_items", f"{table.name}[]", f'@relation("{table.name}_{field.name}")'))
+
+    name_width = max((len(r[0]) for r in rows), default=0)
+    type_width = max((len(r[1]) for r in rows), default=0)
+    lines = [f"  {name:<{name_width}} {prisma_type:<{type_width}} {attributes}".rstrip() for name, prisma_type, attributes in rows]
+    if len(primary_key) > 1:
+        lines.append(f"  @@id([{', '.join(primary_key)}])")
+    for columns in table.unique_constraints:
+        lines.append(f"  @@unique([{', '.join(columns)}])")
+    body = "\n".join(lines)
+    return f"model {table.name} {{\n{body}\n}}"
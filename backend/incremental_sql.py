@@ -0,0 +1,309 @@
+"""
+    Incremental SQL regeneration based on diff of table schemas
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+
+from backend.llm_core import LLMCore
+from backend.sql_validator import get_sqlglot_dialect, split_sql_statements
+from backend import prompts
+from backend.schema_model import ForeignKeyRef, parse_table_schema
+
+logger : logging.Logger = logging.getLogger()
+
+# artifacts of GENERATE_SQL_DEFAULT_CRUD in the same order
+CRUD_ARTIFACTS = ['table', 'create', 'update', 'delete', 'get', 'get_all']
+
+# attributes of field that change columns of procedures and views, others (constraints, user attributes) change only table script
+_COLUMN_ATTRIBUTES = {'type', 'default', 'primary_key'}
+
+_OBJECT_RE = re.compile(r'^(CREATE|DROP|ALTER)\s+(OR\s+(REPLACE|ALTER)\s+)?(UNIQUE\s+)?(TABLE|VIEW|INDEX|PROCEDURE|PROC|FUNCTION)\s+(IF\s+(NOT\s+)?EXISTS\s+)?([\w.\"\[\]`]+)', re.IGNORECASE)
+_LEADING_COMMENTS_RE = re.compile(r'^(\s*(--[^\n]*(\n|$)|/\*.*?\*/))*\s*', re.DOTALL)
+
+@dataclass
+class SchemaDiff:
+    """
+        Difference between previous and new version of table schema
+    """
+    table_name : str
+    old_table_name : str
+    added : list[dict[str, str]] = field(default_factory=list)
+    removed : list[dict[str, str]] = field(default_factory=list)
+    changed : list[tuple[dict[str, str], dict[str, str]]] = field(default_factory=list)
+
+@dataclass
+class IncrementalSqlResult:
+    """
+        Result of incremental sql generation
+    """
+    sql_script : str = ''
+    migration_script : str = ''
+    regenerated : list[str] = field(default_factory=list)
+    full_regeneration : bool = False
+    local_errors : list[str] = field(default_factory=list)
+    tokens_used : int = 0
+    context : str = ''
+
+def get_generation_context(db_name : str, script_definition : str = None, existed_tables : list[str] = None) -> str:
+    """
+        Inputs of sql generation except table schema, previous script can be reused only if they are the same
+    """
+    return json.dumps([
+        (db_name or '').strip().lower(),
+        (script_definition or prompts.GENERATE_SQL_DEFAULT_CRUD).strip(),
+        sorted({t.strip().lower() for t in existed_tables or []})
+    ])
+
+def get_table_fields(table_schema : str) -> tuple[str, dict[str, dict[str, str]]]:
+    """
+        Table name and fields (name -> attributes) from table schema XML or Prisma model
+    """
+    table = parse_table_schema(table_schema)
+    if table is None:
+        return None, {}
+    return table.name, {f.name.lower() : f.to_attributes() for f in table.fields}
+
+def is_true(value : str) -> bool:
+    """
+        Boolean attribute of schema
+    """
+    return (value or '').lower() == 'true'
+
+def get_comparable_attributes(attributes : dict[str, str]) -> dict[str, str]:
+    """
+        Attributes normalized for comparison, false flags are the same as missing ones
+    """
+    return {k : v.lower() for k, v in attributes.items() if k != 'name' and v and v.lower() not in ('false', 'none')}
+
+def get_changed_attributes(old_attributes : dict[str, str], new_attributes : dict[str, str]) -> set[str]:
+    """
+        Names of attributes changed in the field
+    """
+    old_comparable = get_comparable_attributes(old_attributes)
+    new_comparable = get_comparable_attributes(new_attributes)
+    return {k for k in set(old_comparable) | set(new_comparable) if old_comparable.get(k) != new_comparable.get(k)}
+
+def diff_table_schemas(old_table_schema : str, new_table_schema : str) -> SchemaDiff:
+    """
+        Compare fields of previous and new table schema
+    """
+    old_table_name, old_fields = get_table_fields(old_table_schema)
+    new_table_name, new_fields = get_table_fields(new_table_schema)
+    diff = SchemaDiff(new_table_name, old_table_name)
+    for name, attributes in new_fields.items():
+        old_attributes = old_fields.get(name)
+        if old_attributes is None:
+            diff.added.append(attributes)
+        elif get_changed_attributes(old_attributes, attributes):
+            diff.changed.append((old_attributes, attributes))
+    diff.removed = [attributes for name, attributes in old_fields.items() if name not in new_fields]
+    return diff
+
+def get_affected_artifacts(diff : SchemaDiff) -> list[str]:
+    """
+        Artifacts to regenerate for the diff, None if whole script has to be regenerated
+    """
+    if not diff.table_name or (diff.old_table_name or '').lower() != diff.table_name.lower():
+        return None
+    changed_fields = diff.added + diff.removed + [new for _, new in diff.changed]
+    if any(is_true(f.get('primary_key')) for f in changed_fields) or any(is_true(old.get('primary_key')) for old, _ in diff.changed):
+        return None
+    if not changed_fields:
+        return []
+
+    affected = {'table'}
+    columns_changed = diff.added or diff.removed or any(
+        get_changed_attributes(old, new) & _COLUMN_ATTRIBUTES for old, new in diff.changed
+    )
+    if columns_changed:
+        affected.update(['create', 'update', 'get', 'get_all'])
+    if any(f.get('name', '').lower() == 'is_deleted' for f in diff.added + diff.removed):
+        affected.update(['delete', 'get', 'get_all'])
+    return [a for a in CRUD_ARTIFACTS if a in affected]
+
+def get_artifact(statement : str, table_name : str) -> str:
+    """
+        CRUD artifact of the statement, None if statement is not recognized
+    """
+    match = _OBJECT_RE.match(_LEADING_COMMENTS_RE.sub('', statement, count=1))
+    if match is None:
+        return None
+    object_type = match.group(5).upper()
+    if object_type in ('TABLE', 'INDEX'):
+        return 'table'
+    if object_type == 'VIEW':
+        return 'get_all'
+
+    # procedure or function: words of the name without table name, e.g. sp_get_all_users -> sp, get, all
+    name = match.group(8).strip('"[]`').split('.')[-1]
+    name = re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', name).lower()
+    table_words = table_name.lower().replace('tb_', '', 1) if table_name else ''
+    if table_words:
+        name = name.replace(table_words, '_')
+    words = set(re.split(r'[^a-z0-9]+', name))
+    if words & {'delete', 'remove', 'del'}:
+        return 'delete'
+    if words & {'update', 'edit', 'upd', 'modify'}:
+        return 'update'
+    if words & {'create', 'insert', 'add', 'new', 'ins'}:
+        return 'create'
+    if words & {'all', 'list', 'items'}:
+        return 'get_all'
+    if words & {'get', 'select', 'read', 'find', 'id', 'sel'}:
+        return 'get'
+    return None
+
+def get_script_chunks(sql_script : str, table_name : str) -> list[tuple[str, str]]:
+    """
+        Split script into (artifact, text) chunks, text includes delimiter of the statement
+    """
+    statements = split_sql_statements(sql_script)
+    chunks = []
+    for i, statement in enumerate(statements):
+        end = statements[i + 1].start if i + 1 < len(statements) else len(sql_script)
+        chunks.append((get_artifact(statement.text, table_name), sql_script[statement.start:end].rstrip()))
+    return chunks
+
+def stitch_sql_script(old_sql_script : str, new_sql_script : str, artifacts : list[str], table_name : str) -> str:
+    """
+        Replace regenerated artifacts of previous script by new ones, artifacts missing in previous script are appended
+    """
+    new_chunks = get_script_chunks(new_sql_script, table_name)
+    chunks = []
+    inserted = set()
+    for artifact, chunk in get_script_chunks(old_sql_script, table_name):
+        if artifact not in artifacts:
+            chunks.append(chunk)
+        elif artifact not in inserted:
+            chunks.extend(c for a, c in new_chunks if a == artifact)
+            inserted.add(artifact)
+    chunks.extend(c for a, c in new_chunks if a not in inserted)
+    return "\n\n".join(chunks)
+
+def get_column_definition(attributes : dict[str, str]) -> str:
+    """
+        Column definition for ALTER TABLE
+    """
+    definition = f"{attributes['name']} {attributes.get('type', '')}".strip()
+    if is_true(attributes.get('not_null')):
+        definition += " NOT NULL"
+    if is_true(attributes.get('unique')):
+        definition += " UNIQUE"
+    references = get_references(attributes)
+    if references:
+        definition += f" REFERENCES {references}"
+    return definition
+
+def get_references(attributes : dict[str, str]) -> str:
+    """
+        Referenced table and column of foreign key: tb_user, tb_user(id) or tb_user.id -> tb_user(id)
+    """
+    references = ForeignKeyRef.parse(attributes.get('foreign_key'))
+    return str(references) if references else None
+
+def build_migration_script(db_name : str, diff : SchemaDiff) -> str:
+    """
+        ALTER TABLE script to migrate table from previous schema to the new one
+    """
+    dialect = get_sqlglot_dialect(db_name)
+    table = diff.table_name
+    lines = []
+    for attributes in diff.added:
+        add = 'ADD' if dialect == 'tsql' else 'ADD COLUMN'
+        lines.append(f"ALTER TABLE {table} {add} {get_column_definition(attributes)};")
+
+    for old, new in diff.changed:
+        column = new['name']
+        column_type = new.get('type', '')
+        not_null = is_true(new.get('not_null'))
+        if old.get('type', '').lower() != column_type.lower() or is_true(old.get('not_null')) != not_null:
+            if dialect == 'sqlite':
+                lines.append(f"-- SQLite can't alter column {column}, table {table} has to be rebuilt")
+            elif dialect == 'tsql':
+                lines.append(f"ALTER TABLE {table} ALTER COLUMN {column} {column_type} {'NOT NULL' if not_null else 'NULL'};")
+            elif dialect == 'mysql':
+                lines.append(f"ALTER TABLE {table} MODIFY COLUMN {column} {column_type}{' NOT NULL' if not_null else ''};")
+            else:
+                if old.get('type', '').lower() != column_type.lower():
+                    lines.append(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {column_type};")
+                if is_true(old.get('not_null')) != not_null:
+                    lines.append(f"ALTER TABLE {table} ALTER COLUMN {column} {'SET' if not_null else 'DROP'} NOT NULL;")
+        if is_true(old.get('unique')) != is_true(new.get('unique')):
+            if is_true(new.get('unique')):
+                lines.append(f"ALTER TABLE {table} ADD CONSTRAINT uq_{table}_{column} UNIQUE ({column});")
+            else:
+                lines.append(f"-- drop unique constraint of {table}.{column}")
+        old_references, new_references = get_references(old), get_references(new)
+        if (old_references or '').lower() != (new_references or '').lower():
+            if old_references:
+                lines.append(f"-- drop foreign key constraint of {table}.{column} to {old_references}")
+            if new_references:
+                lines.append(f"ALTER TABLE {table} ADD CONSTRAINT fk_{table}_{column} FOREIGN KEY ({column}) REFERENCES {new_references};")
+
+    for attributes in diff.removed:
+        lines.append(f"ALTER TABLE {table} DROP COLUMN {attributes['name']};")
+    return "\n".join(lines)
+
+def is_default_script_definition(script_definition : str) -> bool:
+    """
+        Check script definition is default CRUD, only it can be split into artifacts
+    """
+    return not script_definition or script_definition.split() == prompts.GENERATE_SQL_DEFAULT_CRUD.split()
+
+def get_script_definition(artifacts : list[str]) -> str:
+    """
+        Script definition with only given artifacts of default CRUD
+    """
+    crud_lines = [re.sub(r'^\d+\.\s*', '', line.strip()) for line in prompts.GENERATE_SQL_DEFAULT_CRUD.strip().splitlines()]
+    lines = [line for artifact, line in zip(CRUD_ARTIFACTS, crud_lines) if artifact in artifacts]
+    return "\n".join(f"{i}. {line}" for i, line in enumerate(lines, start=1))
+
+class IncrementalSqlGenerator:
+    """
+        Regenerate only scripts affected by changes of table schema and stitch them into previous script
+    """
+
+    def __init__(self, llm_backend : LLMCore):
+        self.llm_backend = llm_backend
+
+    def run(self, db_name : str, old_table_schema : str, table_schema : str, old_sql_script : str, script_definition : str = None, existed_tables : list[str] = None, old_context : str = None, force : bool = False) -> IncrementalSqlResult:
+        """
+            Generate sql for new version of table schema.
+            Previous script is reused only if it was generated with the same context (see get_generation_context),
+            force regenerates the whole script.
+        """
+        result = IncrementalSqlResult(context=get_generation_context(db_name, script_definition, existed_tables))
+        artifacts = None
+        if force:
+            logger.info("Full SQL regeneration is forced")
+        elif old_context != result.context:
+            logger.info("Database, script definition or existed tables changed since previous generation")
+        elif old_table_schema and old_sql_script and is_default_script_definition(script_definition):
+            try:
+                diff = diff_table_schemas(old_table_schema, table_schema)
+                artifacts = get_affected_artifacts(diff)
+            except Exception as error: # pylint: disable=W0718
+                logger.warning(f"Could not diff table schemas: {error}")
+
+        if artifacts is None:
+            logger.info("Full SQL regeneration")
+            result.full_regeneration = True
+            result.regenerated = list(CRUD_ARTIFACTS)
+            _, result.sql_script, result.local_errors, result.tokens_used = self.llm_backend.generate_sql(db_name, table_schema, script_definition, existed_tables)
+            return result
+
+        if not artifacts:
+            logger.info("Table schema is not changed, SQL is not regenerated")
+            result.sql_script = old_sql_script
+            return result
+
+        logger.info(f"Incremental SQL regeneration: {artifacts}")
+        result.regenerated = artifacts
+        _, new_sql_script, result.local_errors, result.tokens_used = self.llm_backend.generate_sql(db_name, table_schema, get_script_definition(artifacts), existed_tables)
+        result.sql_script = stitch_sql_script(old_sql_script, new_sql_script, artifacts, diff.table_name)
+        result.migration_script = build_migration_script(db_name, diff)
+        return result
@@ -0,0 +1,231 @@
+"""
+    Background jobs: bounded queue, worker threads and persisted job status
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import contextvars
+import dataclasses
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable
+
+logger : logging.Logger = logging.getLogger()
+
+DEFAULT_JOBS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.jobs.db')
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+@dataclass
+class Job:
+    """
+        Job status and result, result is JSON compatible (dataclasses are converted to dicts)
+    """
+    job_id : str
+    kind : str
+    status : str = JOB_QUEUED
+    created : float = 0.0
+    started : float = None
+    finished : float = None
+    message : str = None
+    partial_result : str = None
+    result : Any = None
+    tokens_used : int = 0
+    error : str = None
+
+    @property
+    def is_finished(self) -> bool:
+        """
+            Job is done or failed
+        """
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+def to_json_value(value : Any) -> Any:
+    """
+        JSON compatible value of the job result
+    """
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+class JobStore:
+    """
+        SQLite store of jobs, so status and results survive page reloads and app restarts.
+        Each thread uses own connection.
+    """
+
+    def __init__(self, database_path : str = DEFAULT_JOBS_PATH, keep_seconds : float = 86400):
+        self.database_path = database_path
+        self.local = threading.local()
+        directory = os.path.dirname(database_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self.get_connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, status TEXT NOT NULL, data TEXT NOT NULL, updated REAL NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated)")
+        with connection:
+            connection.execute("DELETE FROM jobs WHERE updated < ?", (time.time() - keep_seconds,))
+        self.fail_interrupted()
+
+    def get_connection(self) -> sqlite3.Connection:
+        """
+            Connection of the current thread
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def save(self, job : Job):
+        """
+            Insert or update job
+        """
+        connection = self.get_connection()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO jobs (job_id, status, data, updated) VALUES (?, ?, ?, ?)", (job.job_id, job.status, json.dumps(dataclasses.asdict(job)), time.time()))
+
+    def load(self, job_id : str) -> Job:
+        """
+            Job by id, None if not found
+        """
+        row = self.get_connection().execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return Job(**json.loads(row[0]))
+
+    def fail_interrupted(self):
+        """
+            Jobs queued or running in the previous process will never finish
+        """
+        rows = self.get_connection().execute("SELECT data FROM jobs WHERE status IN (?, ?)", (JOB_QUEUED, JOB_RUNNING)).fetchall()
+        for row in rows:
+            job = Job(**json.loads(row[0]))
+            job.status = JOB_FAILED
+            job.finished = time.time()
+            job.error = "Job was interrupted by application restart"
+            self.save(job)
+        if rows:
+            logger.warning(f"Jobs interrupted by restart: {len(rows)}")
+
+class JobProgress:
+    """
+        Handle passed to job function to report progress
+    """
+    _SAVE_INTERVAL_SECONDS = 1.0
+
+    def __init__(self, job : Job, store : JobStore):
+        self.job = job
+        self.store = store
+        self.saved = 0.0
+
+    def update(self, message : str = None, partial_result : str = None):
+        """
+            Update job progress, store is updated not more often than once per second
+        """
+        if message is not None:
+            self.job.message = message
+        if partial_result is not None:
+            self.job.partial_result = partial_result
+        now = time.monotonic()
+        if now - self.saved >= self._SAVE_INTERVAL_SECONDS:
+            self.saved = now
+            self.store.save(self.job)
+
+class JobQueue:
+    """
+        Bounded queue of jobs executed by worker threads (LLM calls are I/O bound and share LLMCore).
+        Job function is called as func(progress, *args) and returns (result, tokens_used),
+        it runs in a copy of the submitter context (e.g. request id for logging).
+    """
+
+    def __init__(self, store : JobStore, workers : int = 4, max_queued : int = 100):
+        self.store = store
+        self.queue : queue.Queue = queue.Queue(maxsize=max_queued)
+        self.active_jobs : dict[str, Job] = {}
+        self.lock = threading.Lock()
+        self.workers = [threading.Thread(target=self.worker, name=f"job-worker-{i}", daemon=True) for i in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, kind : str, func : Callable[..., tuple[Any, int]], *args : Any) -> str:
+        """
+            Queue job and return job id, raises queue.Full if too many jobs are waiting
+        """
+        job = Job(job_id=uuid.uuid4().hex, kind=kind, created=time.time())
+        with self.lock:
+            self.queue.put_nowait((job, func, args, contextvars.copy_context()))
+            self.active_jobs[job.job_id] = job
+        self.store.save(job)
+        logger.info(f"Job {job.job_id} ({kind}) queued, queue size {self.queue.qsize()}")
+        return job.job_id
+
+    def get(self, job_id : str) -> Job:
+        """
+            Current state of the job, None if not found
+        """
+        with self.lock:
+            job = self.active_jobs.get(job_id)
+        if job is not None:
+            return dataclasses.replace(job)
+        return self.store.load(job_id)
+
+    def worker(self):
+        """
+            Run jobs from the queue
+        """
+        while True:
+            job, func, args, context = self.queue.get()
+            context.run(self.run_job, job, func, args)
+            self.queue.task_done()
+
+    def run_job(self, job : Job, func : Callable[..., tuple[Any, int]], args : tuple):
+        """
+            Run job and store its result or error
+        """
+        job.status = JOB_RUNNING
+        job.started = time.time()
+        self.store.save(job)
+        try:
+            result, tokens_used = func(JobProgress(job, self.store), *args)
+            job.result = to_json_value(result)
+            job.tokens_used = tokens_used
+            job.status = JOB_DONE
+        except Exception as error: # pylint: disable=W0718
+            logger.error(f"Job {job.job_id} ({job.kind}) failed: {error}")
+            job.error = str(error)
+            job.status = JOB_FAILED
+        job.finished = time.time()
+        self.store.save(job)
+        with self.lock:
+            self.active_jobs.pop(job.job_id, None)
+        logger.info(f"Job {job.job_id} ({job.kind}) {job.status} in {job.finished - job.started:.2f}s")
+
+_shared_job_queue : JobQueue = None
+_shared_job_queue_lock = threading.Lock()
+
+def get_shared_job_queue(all_secrets : dict[str, Any]) -> JobQueue:
+    """
+        Process-wide job queue from [jobs] section of secrets (WORKERS, MAX_QUEUED, STORE_PATH, KEEP_SECONDS)
+    """
+    global _shared_job_queue # pylint: disable=W0603
+    with _shared_job_queue_lock:
+        if _shared_job_queue is None:
+            jobs_secrets = (all_secrets.get('jobs') if all_secrets else None) or {}
+            store = JobStore(jobs_secrets.get('STORE_PATH', DEFAULT_JOBS_PATH), float(jobs_secrets.get('KEEP_SECONDS', 86400)))
+            _shared_job_queue = JobQueue(store, int(jobs_secrets.get('WORKERS', 4)), int(jobs_secrets.get('MAX_QUEUED', 100)))
+            logger.info(f"Job queue with {len(_shared_job_queue.workers)} workers")
+        return _shared_job_queue
@@ -0,0 +1,231 @@
+"""
+    LLM cache backends
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from langchain.globals import set_llm_cache
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+from backend import prompts
+from backend.metrics import record_cache_lookup
+
+logger : logging.Logger = logging.getLogger()
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.langchain.db')
+
+def get_cache_key(prompt : str, llm_string : str) -> str:
+    """
+        Cache key based on prompt version, LLM parameters (includes model name) and prompt
+    """
+    return hashlib.sha256(f"{prompts.PROMPT_VERSION}\n{llm_string}\n{prompt}".encode('utf-8')).hexdigest()
+
+def dumps_generations(generations : RETURN_VAL_TYPE) -> str:
+    """
+        Serialize generations
+    """
+    return json.dumps([dumps(g) for g in generations])
+
+def loads_generations(generations_str : str) -> RETURN_VAL_TYPE:
+    """
+        Deserialize generations, returns None for broken value
+    """
+    try:
+        return [loads(g) for g in json.loads(generations_str)]
+    except Exception as error: # pylint: disable=W0718
+        logger.warning(f"Could not load cached value: {error}")
+        return None
+
+class MemoryLRUCache(BaseCache):
+    """
+        In-process cache with LRU eviction and TTL
+    """
+
+    def __init__(self, max_size : int = 10000, ttl_seconds : float = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.entries : OrderedDict[str, tuple[float, RETURN_VAL_TYPE]] = OrderedDict()
+
+    def lookup(self, prompt : str, llm_string : str) -> RETURN_VAL_TYPE:
+        key = get_cache_key(prompt, llm_string)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                record_cache_lookup(False)
+                return None
+            expires, return_val = entry
+            if expires and expires < time.time():
+                del self.entries[key]
+                record_cache_lookup(False)
+                return None
+            self.entries.move_to_end(key)
+        record_cache_lookup(True)
+        return return_val
+
+    def update(self, prompt : str, llm_string : str, return_val : RETURN_VAL_TYPE):
+        key = get_cache_key(prompt, llm_string)
+        expires = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        with self.lock:
+            self.entries[key] = (expires, return_val)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self, **kwargs : Any):
+        with self.lock:
+            self.entries.clear()
+
+class SQLiteWALCache(BaseCache):
+    """
+        SQLite cache in WAL mode (readers do not block writer), with max size and TTL.
+        Each thread uses own connection.
+    """
+    _EVICTION_CHECK_INTERVAL = 100
+
+    def __init__(self, database_path : str = DEFAULT_CACHE_PATH, max_size : int = 100000, ttl_seconds : float = None):
+        self.database_path = database_path
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.local = threading.local()
+        self.updates_lock = threading.Lock()
+        self.updates_count = 0
+        directory = os.path.dirname(database_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self.get_connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache (created)")
+        connection.commit()
+
+    def get_connection(self) -> sqlite3.Connection:
+        """
+            Connection of the current thread
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def lookup(self, prompt : str, llm_string : str) -> RETURN_VAL_TYPE:
+        key = get_cache_key(prompt, llm_string)
+        row = self.get_connection().execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            record_cache_lookup(False)
+            return None
+        value, created = row
+        if self.ttl_seconds and created + self.ttl_seconds < time.time():
+            record_cache_lookup(False)
+            return None
+        return_val = loads_generations(value)
+        record_cache_lookup(return_val is not None)
+        return return_val
+
+    def update(self, prompt : str, llm_string : str, return_val : RETURN_VAL_TYPE):
+        key = get_cache_key(prompt, llm_string)
+        connection = self.get_connection()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO llm_cache (key, value, created) VALUES (?, ?, ?)", (key, dumps_generations(return_val), time.time()))
+
+        with self.updates_lock:
+            self.updates_count += 1
+            check_eviction = self.updates_count % self._EVICTION_CHECK_INTERVAL == 0
+        if check_eviction:
+            self.evict()
+
+    def evict(self):
+        """
+            Remove expired entries and the oldest entries above max size
+        """
+        connection = self.get_connection()
+        with connection:
+            if self.ttl_seconds:
+                connection.execute("DELETE FROM llm_cache WHERE created < ?", (time.time() - self.ttl_seconds,))
+            count = connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            if count > self.max_size:
+                connection.execute("DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY created LIMIT ?)", (count - self.max_size,))
+
+    def clear(self, **kwargs : Any):
+        connection = self.get_connection()
+        with connection:
+            connection.execute("DELETE FROM llm_cache")
+
+class ShardedSQLiteCache(BaseCache):
+    """
+        On-disk cache split into several SQLite files by key hash to reduce writer contention
+    """
+
+    def __init__(self, directory : str, shards : int = 8, max_size : int = 100000, ttl_seconds : float = None):
+        self.shards = [
+            SQLiteWALCache(os.path.join(directory, f"shard_{i:02d}.db"), max(1, max_size // shards), ttl_seconds)
+            for i in range(shards)
+        ]
+
+    def get_shard(self, prompt : str, llm_string : str) -> SQLiteWALCache:
+        """
+            Shard for the key
+        """
+        return self.shards[int(get_cache_key(prompt, llm_string)[:8], 16) % len(self.shards)]
+
+    def lookup(self, prompt : str, llm_string : str) -> RETURN_VAL_TYPE:
+        return self.get_shard(prompt, llm_string).lookup(prompt, llm_string)
+
+    def update(self, prompt : str, llm_string : str, return_val : RETURN_VAL_TYPE):
+        self.get_shard(prompt, llm_string).update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs : Any):
+        for shard in self.shards:
+            shard.clear()
+
+def create_llm_cache(cache_secrets : dict[str, Any]) -> BaseCache:
+    """
+        Create cache from [llm_cache] section of secrets
+    """
+    cache_secrets = cache_secrets or {}
+    backend     = cache_secrets.get('BACKEND', 'sqlite')
+    max_size    = cache_secrets.get('MAX_SIZE')
+    ttl_seconds = cache_secrets.get('TTL_SECONDS')
+    ttl_seconds = float(ttl_seconds) if ttl_seconds else None
+
+    if backend == 'none':
+        return None
+    if backend == 'memory':
+        return MemoryLRUCache(int(max_size or 10000), ttl_seconds)
+    if backend == 'sqlite':
+        return SQLiteWALCache(cache_secrets.get('PATH', DEFAULT_CACHE_PATH), int(max_size or 100000), ttl_seconds)
+    if backend == 'sharded':
+        directory = cache_secrets.get('PATH', os.path.splitext(DEFAULT_CACHE_PATH)[0] + '_shards')
+        return ShardedSQLiteCache(directory, int(cache_secrets.get('SHARDS', 8)), int(max_size or 100000), ttl_seconds)
+
+    logger.error(f'create_llm_cache: unsupported cache backend: {backend}')
+    return None
+
+_llm_cache_lock = threading.Lock()
+_llm_cache_installed = False
+
+def init_llm_cache(all_secrets : dict[str, Any]):
+    """
+        Install global LLM cache once per process
+    """
+    global _llm_cache_installed # pylint: disable=W0603
+    with _llm_cache_lock:
+        if _llm_cache_installed:
+            return
+        cache_secrets = all_secrets.get('llm_cache') if all_secrets else None
+        llm_cache = create_llm_cache(cache_secrets)
+        set_llm_cache(llm_cache)
+        _llm_cache_installed = True
+        logger.info(f'LLM cache: {type(llm_cache).__name__}')
@@ -3,56 +3,281 @@
 """
 # pylint: disable=C0301,C0103,C0303,C0411,W1203
 
+import hashlib
+import json
 import logging
 import os
-from typing import Any
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+import httpx
 
 from langchain_openai import ChatOpenAI, AzureChatOpenAI
-from langchain.globals import set_llm_cache
-from langchain_community.cache import SQLiteCache
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.callbacks.manager import get_openai_callback
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableSequence
+from langchain_community.callbacks.openai_info import OpenAICallbackHandler
 
 from backend import prompts
 from backend import xml_utils
+from backend import prompt_budget
+from backend import ddl_generator
+from backend.prompt_packing import PackSizer, format_packed_descriptions
+from backend.prompt_registry import get_prompt_template
+from backend.schema_model import TableSchema, normalize_table_schema, parse_table_schema
+from backend.semantic_cache import SemanticCache
+from backend.sql_validator import SqlValidator, SqlError, SqlStatement, format_sql_error, replace_statements, strip_statement_delimiter
+from backend.llm_cache import init_llm_cache
+from backend.llm_router import create_llm_router
+from backend.metrics import CallMetrics, MetricsSink, create_metrics_sinks, track_cache_lookups
 
 logger : logging.Logger = logging.getLogger()
 
+@dataclass
+class TableSchemaResult:
+    """
+        Result of schema generation for one table description
+    """
+    table_description : str
+    table_schema : str = None
+    table_name : str = None
+    tokens_used : int = 0
+    error : str = None
+
+@dataclass
+class TableSqlResult:
+    """
+        Result of SQL generation for one table schema
+    """
+    table_schema : str
+    new_tables : list[str] = None
+    sql_script : str = None
+    local_errors : list[str] = None
+    sql_errors : list[SqlError] = None
+    tokens_used : int = 0
+    error : str = None
+
+class UsageCallbackHandler(OpenAICallbackHandler):
+    """
+        Token usage callback that also keeps the deployment that served the call (reported by LLM router)
+    """
+    deployment : str = None
+
+    def on_llm_end(self, response : LLMResult, **kwargs : Any):
+        deployment = (response.llm_output or {}).get('deployment')
+        if deployment is None and response.generations and response.generations[0]:
+            deployment = (response.generations[0][0].generation_info or {}).get('deployment')
+        if deployment is not None:
+            self.deployment = deployment
+        super().on_llm_end(response, **kwargs)
+
+_TABLE_SCRIPT_RE = re.compile(r'create\s+table|table\s+script|\bddl\b', re.IGNORECASE)
+
+def split_script_definition(script_definition : str) -> tuple[str, list[str]]:
+    """
+        Split numbered or bulleted script definition into table script and other scripts,
+        lines without number continue the previous script
+    """
+    items = []
+    for line in script_definition.strip().splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        item_match = re.match(r'^(\d+[.)]|[-*])\s*', line)
+        if item_match or not items:
+            items.append(line[item_match.end():] if item_match else line)
+        else:
+            items[-1] += f" {line}"
+    table_index = next((i for i, item in enumerate(items) if _TABLE_SCRIPT_RE.search(item)), 0)
+    return items[table_index], items[:table_index] + items[table_index + 1:]
+
+def get_packed_table(element : Any) -> TableSchema:
+    """
+        Table of packed LLM output without id attribute (position in the pack is not part of the schema)
+    """
+    table = TableSchema.from_xml_element(element)
+    if table.extra:
+        table.extra.pop('id', None)
+        table.extra = table.extra or None
+    return table
+
+def join_script_items(items : list[str]) -> str:
+    """
+        Numbered script definition of several items, one item is kept as is
+    """
+    if len(items) == 1:
+        return items[0]
+    return "\n".join(f"{i}. {item}" for i, item in enumerate(items, 1))
+
+def normalize_script_item(item : str) -> str:
+    """
+        Script item for comparison: lower case, single spaces, without trailing period
+    """
+    return " ".join(item.split()).rstrip('.').lower()
+
+_DEFAULT_TABLE_ITEM = normalize_script_item(split_script_definition(prompts.GENERATE_SQL_DEFAULT_CRUD)[0])
+
+class SqlStream:
+    """
+        Streamed sql generation. Iterate to get sql script text chunks as they arrive,
+        after iteration new_tables, sql_script, local_errors, sql_errors and tokens_used are filled.
+        Token usage is reported only if the provider returns usage for streamed calls.
+        If table is given, table script is generated locally and other scripts are streamed by one call.
+    """
+
+    def __init__(self, llm_core : Any, inputs : dict[str, str], existed_tables : list[str], local_table : TableSchema = None):
+        self.llm_core = llm_core
+        self.inputs = inputs
+        self.existed_tables = existed_tables
+        self.local_table = local_table
+        self.new_tables = None
+        self.sql_script = None
+        self.local_errors = None
+        self.sql_errors = None
+        self.tokens_used = 0
+
+    def __iter__(self):
+        if self.local_table is not None:
+            yield from self.iter_local_table()
+            return
+
+        handler = UsageCallbackHandler()
+        parser  = xml_utils.XmlTagTextStreamParser('sql_script_text')
+        chunks  = []
+        for chunk in self.llm_core.chain_generate_sql.stream(self.inputs, config={"callbacks" : [handler]}):
+            chunks.append(chunk)
+            text = parser.feed(chunk)
+            if text:
+                yield text
+        sql_xml, repair_tokens = self.llm_core.repair_llm_xml("".join(chunks))
+        self.new_tables, self.sql_script, self.local_errors = self.llm_core.parse_sql(sql_xml, self.existed_tables)
+        self.sql_script, self.sql_errors, validate_tokens = self.llm_core.validate_sql(self.inputs["dbname"], self.sql_script)
+        self.local_errors.extend(format_sql_error(e) for e in self.sql_errors)
+        self.tokens_used = handler.total_tokens + repair_tokens + validate_tokens
+        logger.debug(f"LLM used tokens: {self.tokens_used}")
+
+    def iter_local_table(self):
+        """
+            Local table script at once, then other scripts streamed by one LLM call based on it.
+            If streamed scripts can't be parsed, they are regenerated without streaming.
+        """
+        db_name = self.inputs["dbname"]
+        _, other_items = split_script_definition(self.inputs["script"])
+        items = [join_script_items(other_items)] if other_items else []
+        with self.llm_core.track_call('generate_sql_stream') as call_metrics:
+            self.new_tables, table_sql, self.local_errors = self.llm_core.generate_local_table_sql(db_name, self.local_table, self.existed_tables, call_metrics)
+            yield table_sql
+            part_scripts = []
+            for item in items:
+                handler   = UsageCallbackHandler()
+                parser    = xml_utils.XmlTagTextStreamParser('sql_script_text')
+                chunks    = []
+                separator = "\n\n"
+                for chunk in self.llm_core.chain_generate_sql_part.stream({"dbname" : db_name, "script" : item, "table_sql" : table_sql}, config={"callbacks" : [handler]}):
+                    chunks.append(chunk)
+                    text = parser.feed(chunk)
+                    if text:
+                        yield separator + text
+                        separator = ""
+                call_metrics.add_usage(handler)
+                self.tokens_used += handler.total_tokens
+                part_scripts.append(self.llm_core.parse_sql_part("".join(chunks), call_metrics))
+            if None in part_scripts:
+                sql_script, part_errors, parts_tokens = self.llm_core.generate_sql_parts(db_name, table_sql, items, call_metrics)
+                self.tokens_used += parts_tokens
+            else:
+                sql_script, part_errors = self.llm_core.merge_sql_parts(table_sql, items, part_scripts)
+            self.local_errors.extend(part_errors)
+            self.sql_script, self.sql_errors, validate_tokens = self.llm_core.validate_sql(db_name, sql_script, call_metrics)
+            self.local_errors.extend(format_sql_error(e) for e in self.sql_errors)
+            self.tokens_used += validate_tokens
+        logger.debug(f"LLM used tokens: {self.tokens_used}")
+
 class LLMCore:
     """
         LLM Core
     """
     _BASE_MODEL_NAME = "gpt-3.5-turbo-0125"
     _MAX_TOKENS = 2000
+    _MAX_CONCURRENCY = 8
+    _MAX_CONNECTIONS = 100
+    _FIX_XML_EXTRA_TOKENS = 200
+    _FIX_SQL_EXTRA_TOKENS = 200
+    _SPLIT_SQL_GENERATION = False
+    _SPLIT_SQL_RETRIES = 1
+    _LOCAL_DDL = True
+    _SYSTEM_MESSAGES = True
+    _PACK_SCHEMA_GENERATION = False
+    _MAX_PACK_TABLES = 8
+    _MAX_PACK_TOKENS = 2000
+    _EXISTED_TABLES_MAX_TOKENS = 1000
 
     chain_generate_sql_schema = None
+    chain_generate_sql_schema_packed = None
     chain_generate_prisma_schema = None
     chain_generate_sql = None
+    chain_generate_sql_part = None
+    chain_generate_procedures = None
+    semantic_cache : SemanticCache = None
+    sql_validator : SqlValidator = None
+    schema_pack_sizer : PackSizer = None
+    router_secrets : dict[str, Any] = None
+    metrics_sinks : list[MetricsSink] = None
 
     def __init__(self, all_secrets : dict[str, Any]):
 
         # Init cache
-        set_llm_cache(SQLiteCache(database_path=".langchain.db"))
+        init_llm_cache(all_secrets)
+        self.semantic_cache = SemanticCache.from_secrets(all_secrets)
+
+        # Init local validation of generated sql
+        self.sql_validator = SqlValidator.from_secrets(all_secrets)
+
+        # Init metrics
+        self.metrics_sinks = create_metrics_sinks(all_secrets)
 
         # init env
         self.init_llm_environment(all_secrets)
 
+        # HTTP clients with keep-alive connection pool, shared by all chains
+        limits = httpx.Limits(max_connections=self._MAX_CONNECTIONS, max_keepalive_connections=self._MAX_CONNECTIONS)
+        self.http_client = httpx.Client(limits=limits)
+        self.http_async_client = httpx.AsyncClient(limits=limits)
+
         # Init LLM
         llm = self.create_llm(self._MAX_TOKENS, self._BASE_MODEL_NAME)
+        self.llm = llm
 
-        # Init chains
-        generate_sql_schema_prompt = ChatPromptTemplate.from_template(prompts.GENERATE_SQL_SCHEMA_PROMPT)
+        # Init chains, prompt templates are compiled once per process
+        generate_sql_schema_prompt = get_prompt_template('generate_sql_schema', self._SYSTEM_MESSAGES)
         self.chain_generate_sql_schema  = generate_sql_schema_prompt | llm | StrOutputParser()
 
-        generate_prisma_schema_prompt = ChatPromptTemplate.from_template(prompts.GENERATE_PRISMA_SCHEMA_PROMPT)
+        generate_sql_schema_packed_prompt = get_prompt_template('generate_sql_schema_packed', self._SYSTEM_MESSAGES)
+        self.chain_generate_sql_schema_packed  = generate_sql_schema_packed_prompt | llm | StrOutputParser()
+        self.schema_pack_sizer = PackSizer(self._MAX_PACK_TABLES, self._MAX_PACK_TOKENS, self._MAX_TOKENS, self._BASE_MODEL_NAME)
+
+        generate_prisma_schema_prompt = get_prompt_template('generate_prisma_schema', self._SYSTEM_MESSAGES)
         self.chain_generate_prisma_schema  = generate_prisma_schema_prompt | llm | StrOutputParser()
 
-        generate_sql_prompt = ChatPromptTemplate.from_template(prompts.GENERATE_SQL_PROMPT)
+        generate_sql_prompt = get_prompt_template('generate_sql', self._SYSTEM_MESSAGES)
         self.chain_generate_sql  = generate_sql_prompt | llm | StrOutputParser()
 
+        generate_sql_part_prompt = get_prompt_template('generate_sql_part', self._SYSTEM_MESSAGES)
+        self.chain_generate_sql_part  = generate_sql_part_prompt | llm | StrOutputParser()
+
+        generate_procedures_prompt = get_prompt_template('generate_procedures', self._SYSTEM_MESSAGES)
+        self.chain_generate_procedures  = generate_procedures_prompt | llm | StrOutputParser()
+
+        self.fix_xml_prompt = get_prompt_template('fix_xml', self._SYSTEM_MESSAGES)
+        self.fix_sql_prompt = get_prompt_template('fix_sql', self._SYSTEM_MESSAGES)
+        self.translate_sql_prompt = get_prompt_template('translate_sql', self._SYSTEM_MESSAGES)
+
     def init_llm_environment(self, all_secrets : dict[str, any]):
-        """Inint OpenAI or Azure environment"""
+        """Inint OpenAI, Azure or router environment"""
 
         self.openai_api_type = 'openai'
         self.openai_api_deployment = None
@@ -66,12 +291,7 @@ class LLMCore:
             openai_secrets = all_secrets.get('open_api_openai')
             if openai_secrets:
                 os.environ["OPENAI_API_KEY"] = openai_secrets.get('OPENAI_API_KEY')
-                base_model_name = openai_secrets.get('OPENAI_BASE_MODEL_NAME')
-                if base_model_name:
-                    self._BASE_MODEL_NAME = base_model_name
-                max_tokens = openai_secrets.get('MAX_TOKENS')
-                if max_tokens:
-                    self._MAX_TOKENS = int(max_tokens)
+                self.read_llm_settings(openai_secrets)
                 logger.info(f'Run with OpenAI from config file [{len(os.environ["OPENAI_API_KEY"])}]')
                 logger.info(f'Base model {self._BASE_MODEL_NAME}')
             else:
@@ -86,20 +306,60 @@ class LLMCore:
                 os.environ["OPENAI_API_VERSION"] = azure_secrets.get('OPENAI_API_VERSION')
                 os.environ["AZURE_OPENAI_ENDPOINT"] = azure_secrets.get('AZURE_OPENAI_ENDPOINT')
                 self.openai_api_deployment = azure_secrets.get('OPENAI_API_DEPLOYMENT')
-                base_model_name = azure_secrets.get('OPENAI_BASE_MODEL_NAME')
-                if base_model_name:
-                    self._BASE_MODEL_NAME = base_model_name
-                max_tokens = azure_secrets.get('MAX_TOKENS')
-                if max_tokens:
-                    self._MAX_TOKENS = int(max_tokens)
+                self.read_llm_settings(azure_secrets)
                 logger.info('Run with Azure OpenAI config file')
                 logger.info(f'Base model {self._BASE_MODEL_NAME}')
             else:
                 logger.error('open_api_azure section is required')
             return
+
+        if self.openai_api_type == 'router':
+            router_secrets = all_secrets.get('llm_router')
+            if router_secrets:
+                self.router_secrets = router_secrets
+                self.read_llm_settings(router_secrets)
+                logger.info(f'Run with LLM router over {len(router_secrets.get("DEPLOYMENTS", []))} deployments')
+                logger.info(f'Base model {self._BASE_MODEL_NAME}')
+            else:
+                logger.error('llm_router section is required')
+            return
         
         logger.error(f'init_llm_environment: unsupported OPENAI_API_TYPE: {self.openai_api_type}')
 
+    def read_llm_settings(self, llm_secrets : dict[str, Any]):
+        """Read model and generation settings shared by all LLM providers"""
+
+        base_model_name = llm_secrets.get('OPENAI_BASE_MODEL_NAME')
+        if base_model_name:
+            self._BASE_MODEL_NAME = base_model_name
+        max_tokens = llm_secrets.get('MAX_TOKENS')
+        if max_tokens:
+            self._MAX_TOKENS = int(max_tokens)
+        max_concurrency = llm_secrets.get('MAX_CONCURRENCY')
+        if max_concurrency:
+            self._MAX_CONCURRENCY = int(max_concurrency)
+        existed_tables_max_tokens = llm_secrets.get('EXISTED_TABLES_MAX_TOKENS')
+        if existed_tables_max_tokens:
+            self._EXISTED_TABLES_MAX_TOKENS = int(existed_tables_max_tokens)
+        split_sql_generation = llm_secrets.get('SPLIT_SQL_GENERATION')
+        if split_sql_generation is not None:
+            self._SPLIT_SQL_GENERATION = bool(split_sql_generation)
+        local_ddl = llm_secrets.get('LOCAL_DDL')
+        if local_ddl is not None:
+            self._LOCAL_DDL = bool(local_ddl)
+        system_messages = llm_secrets.get('SYSTEM_MESSAGES')
+        if system_messages is not None:
+            self._SYSTEM_MESSAGES = bool(system_messages)
+        pack_schema_generation = llm_secrets.get('PACK_SCHEMA_GENERATION')
+        if pack_schema_generation is not None:
+            self._PACK_SCHEMA_GENERATION = bool(pack_schema_generation)
+        max_pack_tables = llm_secrets.get('MAX_PACK_TABLES')
+        if max_pack_tables:
+            self._MAX_PACK_TABLES = int(max_pack_tables)
+        max_pack_tokens = llm_secrets.get('MAX_PACK_TOKENS')
+        if max_pack_tokens:
+            self._MAX_PACK_TOKENS = int(max_pack_tokens)
+
     def create_llm(self, max_tokens : int, model_name : str) -> ChatOpenAI:
         """Create LLM"""
 
@@ -108,7 +368,9 @@ class LLMCore:
                 model_name     = model_name,
                 max_tokens     = max_tokens,
                 temperature    = 0,
-                verbose        = False
+                verbose        = False,
+                http_client       = self.http_client,
+                http_async_client = self.http_async_client
             )
         
         if self.openai_api_type == 'azure':
@@ -117,132 +379,994 @@ class LLMCore:
                 model_name     = model_name,
                 max_tokens     = max_tokens,
                 temperature    = 0,
-                verbose        = False
+                verbose        = False,
+                http_client       = self.http_client,
+                http_async_client = self.http_async_client
             )
+
+        if self.openai_api_type == 'router':
+            return create_llm_router(self.router_secrets, max_tokens, model_name, self.http_client, self.http_async_client)
         
         logger.error(f'create_llm: unsupported OPENAI_API_TYPE: {self.openai_api_type}')
         return None
 
 
-    def generate_sql_schema(self, db_name : str, table_description : str, rules : str = None, existed_tables : list[str] = None) -> str :
+    def get_existed_tables_str(self, existed_tables : list[str], query_text : str = '') -> str:
         """
-            Generate SQL schema based on table description and list of existed tables
+            Build list of existed tables for prompt, 
+            only the most relevant tables that fit into token budget are included
         """
-        if existed_tables is None:
-            existed_tables = []
-        existed_tables_str = "\n".join([f"- {t} - table for {t.replace('tb_', '')}" for t in existed_tables])
+        if not existed_tables:
+            return ''
+        embedding_model = self.semantic_cache.embedding_model if self.semantic_cache else None
+        selection = prompt_budget.select_existed_tables(existed_tables, query_text, self._EXISTED_TABLES_MAX_TOKENS, self._BASE_MODEL_NAME, embedding_model)
+        return selection.text
 
+    def get_schema_inputs(self, db_name : str, table_description : str, rules : str = None, existed_tables : list[str] = None) -> dict[str, str]:
+        """
+            Build inputs for schema generation chains
+        """
         if rules is None:
             rules = prompts.GENERATE_SCHEMA_DEFAULT_RULES
 
-        with get_openai_callback() as cb:
-            sql_xml = self.chain_generate_sql_schema.invoke({
+        return {
+            "dbname" : db_name,
+            "rules" : rules,
+            "existed_tables": self.get_existed_tables_str(existed_tables, table_description), 
+            "table_description": table_description
+        }
+
+    def get_sql_inputs(self, db_name : str, table_schema : str, script_definition : str = None, existed_tables : list[str] = None) -> dict[str, str]:
+        """
+            Build inputs for sql generation chain
+        """
+        if not script_definition:
+            script_definition = prompts.GENERATE_SQL_DEFAULT_CRUD
+
+        # schema from UI can be XML or Prisma, LLM gets the same compact XML for both
+        table_schema = normalize_table_schema(table_schema)
+        return {
+            "dbname" : db_name,
+            "existed_tables": self.get_existed_tables_str(existed_tables, table_schema), 
+            "script": script_definition, 
+            "table_schema": table_schema
+        }
+
+    def semantic_cache_lookup(self, kind : str, inputs : dict[str, str]) -> Any:
+        """
+            Find cached result for similar table description
+        """
+        if self.semantic_cache is None:
+            return None
+        key = (kind, inputs["dbname"], inputs["rules"].strip(), inputs["existed_tables"])
+        return self.semantic_cache.lookup(key, inputs["table_description"])
+
+    def semantic_cache_update(self, kind : str, inputs : dict[str, str], value : Any):
+        """
+            Store result for table description
+        """
+        if self.semantic_cache is None:
+            return
+        key = (kind, inputs["dbname"], inputs["rules"].strip(), inputs["existed_tables"])
+        self.semantic_cache.update(key, inputs["table_description"], value)
+
+    @contextmanager
+    def track_call(self, operation : str) -> Iterator[CallMetrics]:
+        """
+            Measure total time and errors of the call and send metrics to sinks
+        """
+        call_metrics = CallMetrics(operation, self._BASE_MODEL_NAME, self.openai_api_deployment, timestamp=time.time())
+        start = time.perf_counter()
+        try:
+            yield call_metrics
+        except Exception as error:
+            call_metrics.error = type(error).__name__
+            raise
+        finally:
+            call_metrics.total_seconds = time.perf_counter() - start
+            self.record_call_metrics(call_metrics)
+
+    def record_call_metrics(self, call_metrics : CallMetrics):
+        """
+            Send metrics to all sinks
+        """
+        for sink in self.metrics_sinks:
+            try:
+                sink.record(call_metrics)
+            except Exception as error: # pylint: disable=W0718
+                logger.error(f"Could not record metrics: {error}")
+
+    def invoke_chain(self, chain : RunnableSequence, inputs : dict[str, str], call_metrics : CallMetrics = None) -> tuple[str, int]:
+        """
+            Invoke chain, returns LLM output and used tokens.
+            Token callback is passed per call, so it's safe for concurrent calls.
+            Prompt step and LLM step are timed separately.
+        """
+        if call_metrics is None:
+            call_metrics = CallMetrics('invoke_chain')
+        handler = UsageCallbackHandler()
+        config = {"callbacks" : [handler]}
+        with track_cache_lookups() as cache_lookups:
+            with call_metrics.measure('prompt_seconds'):
+                prompt_value = chain.first.invoke(inputs, config=config)
+            with call_metrics.measure('network_seconds'):
+                output = RunnableSequence(*chain.steps[1:]).invoke(prompt_value, config=config)
+        call_metrics.add_usage(handler)
+        if cache_lookups["hits"]:
+            call_metrics.cache_hit = 'llm'
+        return output, handler.total_tokens
+
+    async def ainvoke_chain(self, chain : RunnableSequence, inputs : dict[str, str], call_metrics : CallMetrics = None) -> tuple[str, int]:
+        """
+            Async invoke chain, returns LLM output and used tokens
+        """
+        if call_metrics is None:
+            call_metrics = CallMetrics('ainvoke_chain')
+        handler = UsageCallbackHandler()
+        config = {"callbacks" : [handler]}
+        with track_cache_lookups() as cache_lookups:
+            with call_metrics.measure('prompt_seconds'):
+                prompt_value = await chain.first.ainvoke(inputs, config=config)
+            with call_metrics.measure('network_seconds'):
+                output = await RunnableSequence(*chain.steps[1:]).ainvoke(prompt_value, config=config)
+        call_metrics.add_usage(handler)
+        if cache_lookups["hits"]:
+            call_metrics.cache_hit = 'llm'
+        return output, handler.total_tokens
+
+    def batch_chain(self, chain : RunnableSequence, inputs : list[dict[str, str]], call_metrics : CallMetrics) -> tuple[list[Any], int]:
+        """
+            Run chain for many inputs concurrently with token callback per input.
+            Failed calls are returned as exceptions. Returns LLM outputs and used tokens.
+        """
+        handlers = [UsageCallbackHandler() for _ in inputs]
+        configs  = [{"callbacks" : [h], "max_concurrency" : self._MAX_CONCURRENCY} for h in handlers]
+        with call_metrics.measure('network_seconds'):
+            outputs = chain.batch(inputs, config=configs, return_exceptions=True)
+        for handler in handlers:
+            call_metrics.add_usage(handler)
+        return outputs, sum(h.total_tokens for h in handlers)
+
+    async def abatch_chain(self, chain : RunnableSequence, inputs : list[dict[str, str]], call_metrics : CallMetrics) -> tuple[list[Any], int]:
+        """
+            Async version of batch_chain
+        """
+        handlers = [UsageCallbackHandler() for _ in inputs]
+        configs  = [{"callbacks" : [h], "max_concurrency" : self._MAX_CONCURRENCY} for h in handlers]
+        with call_metrics.measure('network_seconds'):
+            outputs = await chain.abatch(inputs, config=configs, return_exceptions=True)
+        for handler in handlers:
+            call_metrics.add_usage(handler)
+        return outputs, sum(h.total_tokens for h in handlers)
+
+    def generate_sql_schema(self, db_name : str, table_description : str, rules : str = None, existed_tables : list[str] = None) -> str :
+        """
+            Generate SQL schema based on table description and list of existed tables
+        """
+        with self.track_call('generate_sql_schema') as call_metrics:
+            inputs = self.get_schema_inputs(db_name, table_description, rules, existed_tables)
+            cached = self.semantic_cache_lookup('sql_schema', inputs)
+            if cached:
+                call_metrics.cache_hit = 'semantic'
+                return *cached, 0
+
+            sql_xml, tokens_used = self.invoke_chain(self.chain_generate_sql_schema, inputs, call_metrics)
+            sql_xml, repair_tokens = self.repair_llm_xml(sql_xml, call_metrics)
+            tokens_used += repair_tokens
+            logger.debug(f"LLM used tokens: {tokens_used}")
+
+            with call_metrics.measure('parse_seconds'):
+                table_string, table_name = self.parse_sql_schema(sql_xml)
+            if table_name:
+                self.semantic_cache_update('sql_schema', inputs, (table_string, table_name))
+            return table_string, table_name, tokens_used
+
+    async def agenerate_sql_schema(self, db_name : str, table_description : str, rules : str = None, existed_tables : list[str] = None) -> str :
+        """
+            Async generate SQL schema based on table description and list of existed tables
+        """
+        with self.track_call('generate_sql_schema') as call_metrics:
+            inputs = self.get_schema_inputs(db_name, table_description, rules, existed_tables)
+            cached = self.semantic_cache_lookup('sql_schema', inputs)
+            if cached:
+                call_metrics.cache_hit = 'semantic'
+                return *cached, 0
+
+            sql_xml, tokens_used = await self.ainvoke_chain(self.chain_generate_sql_schema, inputs, call_metrics)
+            sql_xml, repair_tokens = await self.arepair_llm_xml(sql_xml, call_metrics)
+            tokens_used += repair_tokens
+            logger.debug(f"LLM used tokens: {tokens_used}")
+
+            with call_metrics.measure('parse_seconds'):
+                table_string, table_name = self.parse_sql_schema(sql_xml)
+            if table_name:
+                self.semantic_cache_update('sql_schema', inputs, (table_string, table_name))
+            return table_string, table_name, tokens_used
+
+    def generate_sql_schema_batch(self, db_name : str, table_descriptions : list[str], rules : str = None, existed_tables : list[str] = None, max_concurrency : int = None) -> list[TableSchemaResult]:
+        """
+            Generate SQL schemas for many table descriptions concurrently.
+            Errors are reported per table and do not abort the batch.
+        """
+        if not max_concurrency:
+            max_concurrency = self._MAX_CONCURRENCY
+
+        results = [TableSchemaResult(table_description) for table_description in table_descriptions]
+        all_inputs = [self.get_schema_inputs(db_name, table_description, rules, existed_tables) for table_description in table_descriptions]
+
+        # only descriptions without similar cached result go to LLM
+        pending = []
+        for result, inputs in zip(results, all_inputs):
+            cached = self.semantic_cache_lookup('sql_schema', inputs)
+            if cached:
+                result.table_schema, result.table_name = cached
+            else:
+                pending.append((result, inputs))
+        if self._PACK_SCHEMA_GENERATION and len(pending) > 1:
+            # tables missing in packed output are generated one by one below
+            pending = self.generate_sql_schema_packed(db_name, pending, rules, existed_tables, max_concurrency)
+        if not pending:
+            return results
+
+        # one callback handler per item to get token count for each table
+        handlers = [UsageCallbackHandler() for _ in pending]
+        configs  = [{"callbacks" : [h], "max_concurrency" : max_concurrency} for h in handlers]
+        batch_start = time.perf_counter()
+        outputs  = self.chain_generate_sql_schema.batch([inputs for _, inputs in pending], config=configs, return_exceptions=True)
+        batch_seconds = time.perf_counter() - batch_start
+
+        for (result, inputs), handler, sql_xml in zip(pending, handlers, outputs):
+            # network time of batch item is the time of the whole batch
+            call_metrics = CallMetrics('generate_sql_schema_batch', self._BASE_MODEL_NAME, self.openai_api_deployment, network_seconds=batch_seconds, timestamp=time.time())
+            call_metrics.add_usage(handler)
+            result.tokens_used += handler.total_tokens
+            sql_xml, repair_tokens = self.batch_repair_llm_xml(sql_xml, call_metrics)
+            result.tokens_used += repair_tokens
+            self.parse_sql_schema_result(result, inputs, sql_xml, call_metrics)
+            call_metrics.total_seconds = call_metrics.network_seconds + call_metrics.parse_seconds
+            self.record_call_metrics(call_metrics)
+
+        return results
+
+    def generate_sql_schema_packed(self, db_name : str, pending : list[tuple[TableSchemaResult, dict[str, str]]], rules : str = None, existed_tables : list[str] = None, max_concurrency : int = None) -> list[tuple[TableSchemaResult, dict[str, str]]]:
+        """
+            Generate schemas for several table descriptions per LLM call, so instructions and rules are sent once per pack.
+            Returns items that are missing in LLM output.
+        """
+        packs = self.schema_pack_sizer.build_packs([inputs["table_description"] for _, inputs in pending])
+        if all(len(pack) == 1 for pack in packs):
+            return pending
+
+        pack_inputs = []
+        for pack in packs:
+            descriptions = [pending[i][1]["table_description"] for i in pack]
+            pack_inputs.append({
                 "dbname" : db_name,
-                "rules" : rules,
-                "existed_tables": existed_tables_str, 
-                "table_description": table_description
+                "rules" : rules or prompts.GENERATE_SCHEMA_DEFAULT_RULES,
+                "existed_tables" : self.get_existed_tables_str(existed_tables, " ".join(descriptions)),
+                "table_descriptions" : format_packed_descriptions(descriptions)
             })
-        tokens_used = cb.total_tokens
-       
+
+        handlers = [UsageCallbackHandler() for _ in pack_inputs]
+        configs  = [{"callbacks" : [h], "max_concurrency" : max_concurrency or self._MAX_CONCURRENCY} for h in handlers]
+        batch_start = time.perf_counter()
+        outputs  = self.chain_generate_sql_schema_packed.batch(pack_inputs, config=configs, return_exceptions=True)
+        batch_seconds = time.perf_counter() - batch_start
+
+        missing = []
+        for pack, handler, sql_xml in zip(packs, handlers, outputs):
+            call_metrics = CallMetrics('generate_sql_schema_packed', self._BASE_MODEL_NAME, self.openai_api_deployment, network_seconds=batch_seconds, timestamp=time.time())
+            call_metrics.add_usage(handler)
+            tokens_used = handler.total_tokens
+            tables = None
+            sql_xml, repair_tokens = self.batch_repair_llm_xml(sql_xml, call_metrics)
+            tokens_used += repair_tokens
+            if isinstance(sql_xml, Exception):
+                logger.error(f"LLM call failed: {sql_xml}")
+                call_metrics.error = type(sql_xml).__name__
+            else:
+                try:
+                    with call_metrics.measure('parse_seconds'):
+                        x = xml_utils.parse_llm_xml(self.extract_llm_xml_string(sql_xml))
+                        tables = {e.attrib.get('id') : get_packed_table(e) for e in x.iter('table')}
+                except Exception as error: # pylint: disable=W0718
+                    logger.error(f"Could not parse LLM generated XML: {error}")
+                    call_metrics.error = type(error).__name__
+
+            pack_missing = []
+            for table_id, (i, table_tokens) in enumerate(zip(pack, prompt_budget.split_tokens(tokens_used, len(pack))), 1):
+                result, inputs = pending[i]
+                result.tokens_used = table_tokens
+                table = tables.get(str(table_id)) if tables is not None else None
+                if table is None or not table.name or not table.fields:
+                    pack_missing.append(pending[i])
+                    continue
+                result.table_schema, result.table_name = table.to_xml(), table.name
+                self.semantic_cache_update('sql_schema', inputs, (result.table_schema, result.table_name))
+            missing.extend(pack_missing)
+            if tables is not None:
+                # only tables dropped from parsed output show that the pack is too big, not failed calls
+                self.schema_pack_sizer.record(len(pack), len(pack_missing), handler.completion_tokens)
+            call_metrics.total_seconds = call_metrics.network_seconds + call_metrics.parse_seconds
+            self.record_call_metrics(call_metrics)
+
+        logger.info(f"Packed schema generation: {len(pending)} tables in {len(packs)} calls, missing {len(missing)}")
+        return missing
+
+    def parse_sql_schema_result(self, result : TableSchemaResult, inputs : dict[str, str], sql_xml : Any, call_metrics : CallMetrics):
+        """
+            Fill batch item result from LLM output or exception
+        """
+        if isinstance(sql_xml, Exception):
+            logger.error(f"LLM call failed: {sql_xml}")
+            result.error = f"LLM call failed: {sql_xml}"
+            call_metrics.error = type(sql_xml).__name__
+            return
+        try:
+            with call_metrics.measure('parse_seconds'):
+                result.table_schema, result.table_name = self.parse_sql_schema(sql_xml)
+        except Exception as error: # pylint: disable=W0718
+            logger.error(f"Could not parse LLM generated XML: {error}")
+            result.error = f"Could not parse LLM generated XML: {error}"
+            call_metrics.error = type(error).__name__
+            return
+        if result.table_name is None:
+            result.error = "Could not find table in LLM generated XML"
+            return
+        self.semantic_cache_update('sql_schema', inputs, (result.table_schema, result.table_name))
+
+    def parse_sql_schema(self, sql_xml : str) -> tuple[str, str]:
+        """
+            Parse LLM output of schema generation, returns table XML and table name
+        """
         sql_xml = self.extract_llm_xml_string(sql_xml)
         logger.debug(f"LLM generated schema: {sql_xml}")
-        logger.debug(f"LLM used tokens: {tokens_used}")
         
-        x = xml_utils.get_as_xml(sql_xml)
+        x = xml_utils.parse_llm_xml(sql_xml)
         table_element = x.find('.//table')
         if table_element is None:
             logger.error("Could not find table element in LLM generated XML")
-            return None, None, tokens_used
+            return None, None
     
-        table_name = table_element.attrib['name']
+        table_name = table_element.attrib.get('name')
         if table_name is None:
             logger.error("Could not find table name in LLM generated XML")
-            return table_element, None, tokens_used
+            return table_element, None
     
-        table_string = xml_utils.xml_to_string(table_element)
-        return table_string, table_name, tokens_used
+        return TableSchema.from_xml_element(table_element).to_xml(), table_name
     
 
     def generate_prisma_schema(self, db_name : str, table_description : str, rules : str = None, existed_tables : list[str] = None) -> str :
         """
             Generate Prisma schema based on table description and list of existed tables
         """
-        if existed_tables is None:
-            existed_tables = []
-        existed_tables_str = "\n".join([f"- {t} - table for {t.replace('tb_', '')}" for t in existed_tables])
+        with self.track_call('generate_prisma_schema') as call_metrics:
+            inputs = self.get_schema_inputs(db_name, table_description, rules, existed_tables)
+            cached = self.semantic_cache_lookup('prisma_schema', inputs)
+            if cached:
+                call_metrics.cache_hit = 'semantic'
+                return *cached, 0
 
-        if rules is None:
-            rules = prompts.GENERATE_SCHEMA_DEFAULT_RULES
+            sql_xml, tokens_used = self.invoke_chain(self.chain_generate_prisma_schema, inputs, call_metrics)
+            sql_xml, repair_tokens = self.repair_llm_xml(sql_xml, call_metrics)
+            tokens_used += repair_tokens
+            logger.debug(f"LLM used tokens: {tokens_used}")
 
-        with get_openai_callback() as cb:
-            sql_xml = self.chain_generate_prisma_schema.invoke({
-                "dbname" : db_name,
-                "rules" : rules,
-                "existed_tables": existed_tables_str, 
-                "table_description": table_description
-            })
-        tokens_used = cb.total_tokens
-       
+            with call_metrics.measure('parse_seconds'):
+                prisma_string, table_name = self.parse_prisma_schema(sql_xml)
+            if table_name:
+                self.semantic_cache_update('prisma_schema', inputs, (prisma_string, table_name))
+            return prisma_string, table_name, tokens_used
+
+    async def agenerate_prisma_schema(self, db_name : str, table_description : str, rules : str = None, existed_tables : list[str] = None) -> str :
+        """
+            Async generate Prisma schema based on table description and list of existed tables
+        """
+        with self.track_call('generate_prisma_schema') as call_metrics:
+            inputs = self.get_schema_inputs(db_name, table_description, rules, existed_tables)
+            cached = self.semantic_cache_lookup('prisma_schema', inputs)
+            if cached:
+                call_metrics.cache_hit = 'semantic'
+                return *cached, 0
+
+            sql_xml, tokens_used = await self.ainvoke_chain(self.chain_generate_prisma_schema, inputs, call_metrics)
+            sql_xml, repair_tokens = await self.arepair_llm_xml(sql_xml, call_metrics)
+            tokens_used += repair_tokens
+            logger.debug(f"LLM used tokens: {tokens_used}")
+
+            with call_metrics.measure('parse_seconds'):
+                prisma_string, table_name = self.parse_prisma_schema(sql_xml)
+            if table_name:
+                self.semantic_cache_update('prisma_schema', inputs, (prisma_string, table_name))
+            return prisma_string, table_name, tokens_used
+
+    def parse_prisma_schema(self, sql_xml : str) -> tuple[str, str]:
+        """
+            Parse LLM output of Prisma schema generation, returns Prisma schema and table name
+        """
         sql_xml = self.extract_llm_xml_string(sql_xml)
         logger.debug(f"LLM generated schema: {sql_xml}")
-        logger.debug(f"LLM used tokens: {tokens_used}")
         
-        x = xml_utils.get_as_xml(sql_xml)
+        x = xml_utils.parse_llm_xml(sql_xml)
         table_element = x.find('.//table')
         if table_element is None:
             logger.error("Could not find table element in LLM generated XML")
-            return None, None, tokens_used
+            return None, None
     
-        table_name = table_element.attrib['name']
+        table_name = table_element.attrib.get('name')
         if table_name is None:
             logger.error("Could not find table name in LLM generated XML")
-            return table_element, None, tokens_used
+            return table_element, None
     
-        prisma_element = x.find('.//prisma')
-        prisma_string = prisma_element.text.strip()
-        return prisma_string, table_name, tokens_used
+        prisma_string = xml_utils.get_text_by_xpath(x, './/prisma').strip()
+        return prisma_string, table_name
 
 
     def generate_sql(self, db_name : str, table_schema : str, script_definition : str = None, existed_tables : list[str] = None) -> str:
         """
             Generate sql for a table
         """
-        if not script_definition:
-            script_definition = prompts.GENERATE_SQL_DEFAULT_CRUD
-        
         if existed_tables is None:
             existed_tables = []
-        existed_tables_str = "\n".join([f"- {t} - table for {t.replace('tb_', '')}" for t in existed_tables])
 
-        with get_openai_callback() as cb:
-            sql_xml = self.chain_generate_sql.invoke({
-                "dbname" : db_name,
-                "existed_tables": existed_tables_str, 
-                "script": script_definition, 
-                "table_schema": table_schema
-            })
-        tokens_used = cb.total_tokens
-       
-        sql_xml = self.extract_llm_xml_string(sql_xml)
-        logger.debug(f"LLM generated sql: {sql_xml}")
-        logger.debug(f"LLM used tokens: {tokens_used}")
-        
-        x = xml_utils.get_as_xml(sql_xml)
+        if self._SPLIT_SQL_GENERATION or self.get_local_table(db_name, table_schema, script_definition) is not None:
+            return self.generate_sql_split(db_name, table_schema, script_definition, existed_tables)
 
-        new_tables    = xml_utils.get_array_by_xpath(x , './/created_tables//table')
-        foregn_tables = xml_utils.get_array_by_xpath(x , './/foregn_key_tables//table')
-        sql_script    = xml_utils.get_text_by_xpath(x , './/sql_script_text').strip('\n ')
-    
-        local_errors = []
-    
-        new_tables    = [i for i in new_tables if i and i.lower() != 'none'] # remove empty
-        foregn_tables = [i for i in foregn_tables if i and i.lower() != 'none']
+        with self.track_call('generate_sql') as call_metrics:
+            inputs = self.get_sql_inputs(db_name, table_schema, script_definition, existed_tables)
+            sql_xml, tokens_used = self.invoke_chain(self.chain_generate_sql, inputs, call_metrics)
+            sql_xml, repair_tokens = self.repair_llm_xml(sql_xml, call_metrics)
+            tokens_used += repair_tokens
+            logger.debug(f"LLM used tokens: {tokens_used}")
+
+            new_tables, sql_script, local_errors = self.parse_sql(sql_xml, existed_tables, call_metrics)
+            sql_script, sql_errors, validate_tokens = self.validate_sql(db_name, sql_script, call_metrics)
+            local_errors.extend(format_sql_error(e) for e in sql_errors)
+            return new_tables, sql_script, local_errors, tokens_used + validate_tokens
+
+    async def agenerate_sql(self, db_name : str, table_schema : str, script_definition : str = None, existed_tables : list[str] = None) -> str:
+        """
+            Async generate sql for a table
+        """
+        if existed_tables is None:
+            existed_tables = []
+
+        if self._SPLIT_SQL_GENERATION or self.get_local_table(db_name, table_schema, script_definition) is not None:
+            return await self.agenerate_sql_split(db_name, table_schema, script_definition, existed_tables)
+
+        with self.track_call('generate_sql') as call_metrics:
+            inputs = self.get_sql_inputs(db_name, table_schema, script_definition, existed_tables)
+            sql_xml, tokens_used = await self.ainvoke_chain(self.chain_generate_sql, inputs, call_metrics)
+            sql_xml, repair_tokens = await self.arepair_llm_xml(sql_xml, call_metrics)
+            tokens_used += repair_tokens
+            logger.debug(f"LLM used tokens: {tokens_used}")
+
+            new_tables, sql_script, local_errors = self.parse_sql(sql_xml, existed_tables, call_metrics)
+            sql_script, sql_errors, validate_tokens = await self.avalidate_sql(db_name, sql_script, call_metrics)
+            local_errors.extend(format_sql_error(e) for e in sql_errors)
+            return new_tables, sql_script, local_errors, tokens_used + validate_tokens
+
+    def generate_sql_split(self, db_name : str, table_schema : str, script_definition : str = None, existed_tables : list[str] = None) -> tuple[list[str], str, list[str], int]:
+        """
+            Generate sql for a table with one LLM call per script of the definition:
+            table script first (locally from schema if possible), then other scripts in parallel based on the table script.
+            If split generation is disabled, other scripts after local table script are generated by one call.
+            Failed scripts are retried, results are merged in order of the definition.
+        """
+        if existed_tables is None:
+            existed_tables = []
+
+        table_item, other_items = split_script_definition(script_definition or prompts.GENERATE_SQL_DEFAULT_CRUD)
+        local_table = self.get_local_table(db_name, table_schema, table_item)
+        with self.track_call('generate_sql_split' if self._SPLIT_SQL_GENERATION else 'generate_sql_local') as call_metrics:
+            if local_table is not None:
+                tokens_used = 0
+                new_tables, table_sql, local_errors = self.generate_local_table_sql(db_name, local_table, existed_tables, call_metrics)
+            else:
+                inputs = self.get_sql_inputs(db_name, table_schema, table_item, existed_tables)
+                sql_xml, tokens_used = self.invoke_chain(self.chain_generate_sql, inputs, call_metrics)
+                sql_xml, repair_tokens = self.repair_llm_xml(sql_xml, call_metrics)
+                tokens_used += repair_tokens
+                new_tables, table_sql, local_errors = self.parse_sql(sql_xml, existed_tables, call_metrics)
+
+            sql_script, part_errors, parts_tokens = self.generate_sql_parts(db_name, table_sql, self.get_sql_part_items(other_items), call_metrics)
+            tokens_used += parts_tokens
+            local_errors.extend(part_errors)
+            sql_script, sql_errors, validate_tokens = self.validate_sql(db_name, sql_script, call_metrics)
+            local_errors.extend(format_sql_error(e) for e in sql_errors)
+            tokens_used += validate_tokens
+            logger.debug(f"LLM used tokens: {tokens_used}")
+            return new_tables, sql_script, local_errors, tokens_used
+
+    async def agenerate_sql_split(self, db_name : str, table_schema : str, script_definition : str = None, existed_tables : list[str] = None) -> tuple[list[str], str, list[str], int]:
+        """
+            Async version of generate_sql_split
+        """
+        if existed_tables is None:
+            existed_tables = []
+
+        table_item, other_items = split_script_definition(script_definition or prompts.GENERATE_SQL_DEFAULT_CRUD)
+        local_table = self.get_local_table(db_name, table_schema, table_item)
+        with self.track_call('generate_sql_split' if self._SPLIT_SQL_GENERATION else 'generate_sql_local') as call_metrics:
+            if local_table is not None:
+                tokens_used = 0
+                new_tables, table_sql, local_errors = self.generate_local_table_sql(db_name, local_table, existed_tables, call_metrics)
+            else:
+                inputs = self.get_sql_inputs(db_name, table_schema, table_item, existed_tables)
+                sql_xml, tokens_used = await self.ainvoke_chain(self.chain_generate_sql, inputs, call_metrics)
+                sql_xml, repair_tokens = await self.arepair_llm_xml(sql_xml, call_metrics)
+                tokens_used += repair_tokens
+                new_tables, table_sql, local_errors = self.parse_sql(sql_xml, existed_tables, call_metrics)
+
+            sql_script, part_errors, parts_tokens = await self.agenerate_sql_parts(db_name, table_sql, self.get_sql_part_items(other_items), call_metrics)
+            tokens_used += parts_tokens
+            local_errors.extend(part_errors)
+            sql_script, sql_errors, validate_tokens = await self.avalidate_sql(db_name, sql_script, call_metrics)
+            local_errors.extend(format_sql_error(e) for e in sql_errors)
+            tokens_used += validate_tokens
+            logger.debug(f"LLM used tokens: {tokens_used}")
+            return new_tables, sql_script, local_errors, tokens_used
+
+    def get_local_table(self, db_name : str, table_schema : str, script_definition : str = None) -> TableSchema:
+        """
+            Table for local generation of table script, None if table script is not the default one
+            (custom instructions need LLM), database is not supported or schema can't be parsed (then LLM generates it)
+        """
+        if not self._LOCAL_DDL or not ddl_generator.is_supported_database(db_name):
+            return None
+        table_item, _ = split_script_definition(script_definition or prompts.GENERATE_SQL_DEFAULT_CRUD)
+        if normalize_script_item(table_item) != _DEFAULT_TABLE_ITEM:
+            return None
+        table = parse_table_schema(table_schema)
+        if table is None or not table.name or not table.fields:
+            return None
+        return table
+
+    def generate_local_table_sql(self, db_name : str, table : TableSchema, existed_tables : list[str], call_metrics : CallMetrics) -> tuple[list[str], str, list[str]]:
+        """
+            Table script from schema without LLM, returns new tables, sql script and local errors like parse_sql
+        """
+        with call_metrics.measure('parse_seconds'):
+            table_sql = ddl_generator.generate_table_sql(table, db_name)
+        known_tables = {t.lower() for t in existed_tables} | {table.name.lower()}
+        local_errors = [f"Table {t} doesn't exist" for t in sorted(table.dependencies) if t.lower() not in known_tables]
+        logger.debug(f"Table script of {table.name} is generated locally")
+        return [table.name], table_sql, local_errors
+
+    def get_sql_part_items(self, items : list[str]) -> list[str]:
+        """
+            Scripts of separate LLM calls: one call per script in split mode, otherwise one call for all scripts
+        """
+        if self._SPLIT_SQL_GENERATION or len(items) <= 1:
+            return items
+        return [join_script_items(items)]
+
+    def generate_sql_parts(self, db_name : str, table_sql : str, items : list[str], call_metrics : CallMetrics) -> tuple[str, list[str], int]:
+        """
+            Generate other scripts of the definition in parallel based on the table script, failed scripts are retried.
+            Returns merged sql script, errors of missing scripts and used tokens.
+        """
+        part_inputs  = [{"dbname" : db_name, "script" : item, "table_sql" : table_sql} for item in items]
+        part_scripts = [None] * len(part_inputs)
+        tokens_used  = 0
+        for attempt in range(1 + self._SPLIT_SQL_RETRIES):
+            pending = [i for i, script in enumerate(part_scripts) if script is None]
+            if not pending:
+                break
+            if attempt:
+                logger.warning(f"Retry {len(pending)} failed sql scripts")
+            outputs, batch_tokens = self.batch_chain(self.chain_generate_sql_part, [part_inputs[i] for i in pending], call_metrics)
+            tokens_used += batch_tokens
+            for i, output in zip(pending, outputs):
+                part_scripts[i] = self.parse_sql_part(output, call_metrics)
+
+        sql_script, part_errors = self.merge_sql_parts(table_sql, items, part_scripts)
+        return sql_script, part_errors, tokens_used
+
+    async def agenerate_sql_parts(self, db_name : str, table_sql : str, items : list[str], call_metrics : CallMetrics) -> tuple[str, list[str], int]:
+        """
+            Async version of generate_sql_parts
+        """
+        part_inputs  = [{"dbname" : db_name, "script" : item, "table_sql" : table_sql} for item in items]
+        part_scripts = [None] * len(part_inputs)
+        tokens_used  = 0
+        for attempt in range(1 + self._SPLIT_SQL_RETRIES):
+            pending = [i for i, script in enumerate(part_scripts) if script is None]
+            if not pending:
+                break
+            if attempt:
+                logger.warning(f"Retry {len(pending)} failed sql scripts")
+            outputs, batch_tokens = await self.abatch_chain(self.chain_generate_sql_part, [part_inputs[i] for i in pending], call_metrics)
+            tokens_used += batch_tokens
+            for i, output in zip(pending, outputs):
+                part_scripts[i] = self.parse_sql_part(output, call_metrics)
+
+        sql_script, part_errors = self.merge_sql_parts(table_sql, items, part_scripts)
+        return sql_script, part_errors, tokens_used
+
+    def parse_sql_part(self, sql_xml : Any, call_metrics : CallMetrics) -> str:
+        """
+            Sql script text from LLM output of one script, None if call failed, output is truncated or can't be parsed (it will be retried)
+        """
+        if isinstance(sql_xml, Exception):
+            logger.error(f"LLM call failed: {sql_xml}")
+            return None
+        if '</sql_script_text>' not in sql_xml:
+            logger.warning("LLM generated sql script is truncated")
+            return None
+        with call_metrics.measure('parse_seconds'):
+            x = xml_utils.try_parse_llm_xml(self.extract_llm_xml_string(sql_xml))
+            if x is None:
+                logger.warning("Could not parse LLM generated XML of sql script")
+                return None
+            sql_script = xml_utils.get_text_by_xpath(x, './/sql_script_text').strip('\n ')
+        return sql_script or None
+
+    def merge_sql_parts(self, table_sql : str, items : list[str], part_scripts : list[str]) -> tuple[str, list[str]]:
+        """
+            Table script and other scripts in order of the definition, returns sql script and errors of missing scripts
+        """
+        errors = [f"Could not generate script: {item}" for item, script in zip(items, part_scripts) if script is None]
+        return "\n\n".join([table_sql] + [script for script in part_scripts if script]), errors
+
+    def generate_sql_stream(self, db_name : str, table_schema : str, script_definition : str = None, existed_tables : list[str] = None) -> SqlStream:
+        """
+            Generate sql for a table in streaming mode
+        """
+        if existed_tables is None:
+            existed_tables = []
+
+        inputs = self.get_sql_inputs(db_name, table_schema, script_definition, existed_tables)
+        return SqlStream(self, inputs, existed_tables, self.get_local_table(db_name, table_schema, script_definition))
+
+    def generate_sql_batch(self, db_name : str, table_schemas : list[str], script_definition : str = None, existed_tables : list[str] = None, max_concurrency : int = None) -> list[TableSqlResult]:
+        """
+            Generate sql for many tables concurrently, table scripts are generated locally when possible.
+            Errors are reported per table and do not abort the batch.
+        """
+        if existed_tables is None:
+            existed_tables = []
+
+        if not max_concurrency:
+            max_concurrency = self._MAX_CONCURRENCY
+
+        results = [TableSqlResult(table_schema) for table_schema in table_schemas]
+
+        table_item, other_items = split_script_definition(script_definition or prompts.GENERATE_SQL_DEFAULT_CRUD)
+        local_tables = [self.get_local_table(db_name, table_schema, table_item) for table_schema in table_schemas]
+        local_indexes = [i for i, table in enumerate(local_tables) if table is not None]
+        if local_indexes:
+            self.generate_sql_batch_local(db_name, [results[i] for i in local_indexes], [local_tables[i] for i in local_indexes], other_items, existed_tables, max_concurrency)
+
+        llm_results = [result for result, table in zip(results, local_tables) if table is None]
+        if not llm_results:
+            return results
+
+        inputs = [self.get_sql_inputs(db_name, result.table_schema, script_definition, existed_tables) for result in llm_results]
+
+        handlers = [UsageCallbackHandler() for _ in inputs]
+        configs  = [{"callbacks" : [h], "max_concurrency" : max_concurrency} for h in handlers]
+        batch_start = time.perf_counter()
+        outputs  = self.chain_generate_sql.batch(inputs, config=configs, return_exceptions=True)
+        batch_seconds = time.perf_counter() - batch_start
+
+        for result, handler, sql_xml in zip(llm_results, handlers, outputs):
+            call_metrics = CallMetrics('generate_sql_batch', self._BASE_MODEL_NAME, self.openai_api_deployment, network_seconds=batch_seconds, timestamp=time.time())
+            call_metrics.add_usage(handler)
+            result.tokens_used = handler.total_tokens
+            sql_xml, repair_tokens = self.batch_repair_llm_xml(sql_xml, call_metrics)
+            result.tokens_used += repair_tokens
+            if isinstance(sql_xml, Exception):
+                logger.error(f"LLM call failed: {sql_xml}")
+                result.error = f"LLM call failed: {sql_xml}"
+                call_metrics.error = type(sql_xml).__name__
+            else:
+                try:
+                    result.new_tables, result.sql_script, result.local_errors = self.parse_sql(sql_xml, existed_tables, call_metrics)
+                except Exception as error: # pylint: disable=W0718
+                    logger.error(f"Could not parse LLM generated XML: {error}")
+                    result.error = f"Could not parse LLM generated XML: {error}"
+                    call_metrics.error = type(error).__name__
+                else:
+                    result.sql_script, result.sql_errors, validate_tokens = self.validate_sql(db_name, result.sql_script, call_metrics)
+                    result.local_errors.extend(format_sql_error(e) for e in result.sql_errors)
+                    result.tokens_used += validate_tokens
+            call_metrics.total_seconds = call_metrics.network_seconds + call_metrics.parse_seconds + call_metrics.validate_seconds
+            self.record_call_metrics(call_metrics)
+
+        return results
+
+    def generate_sql_batch_local(self, db_name : str, results : list[TableSqlResult], tables : list[TableSchema], other_items : list[str], existed_tables : list[str], max_concurrency : int):
+        """
+            Batch generation with table scripts generated locally:
+            other scripts of all tables go to LLM in one batch based on the table scripts, failed scripts are retried.
+        """
+        items = self.get_sql_part_items(other_items)
+        metrics = [CallMetrics('generate_sql_batch_local', self._BASE_MODEL_NAME, self.openai_api_deployment, timestamp=time.time()) for _ in results]
+        tables_sql = []
+        for result, table, call_metrics in zip(results, tables, metrics):
+            result.new_tables, table_sql, result.local_errors = self.generate_local_table_sql(db_name, table, existed_tables, call_metrics)
+            tables_sql.append(table_sql)
+
+        part_tables = [t for t in range(len(results)) for _ in items]
+        part_inputs = [{"dbname" : db_name, "script" : item, "table_sql" : table_sql} for table_sql in tables_sql for item in items]
+        part_scripts = [None] * len(part_inputs)
+        for attempt in range(1 + self._SPLIT_SQL_RETRIES):
+            pending = [i for i, script in enumerate(part_scripts) if script is None]
+            if not pending:
+                break
+            if attempt:
+                logger.warning(f"Retry {len(pending)} failed sql scripts")
+            handlers = [UsageCallbackHandler() for _ in pending]
+            configs  = [{"callbacks" : [h], "max_concurrency" : max_concurrency} for h in handlers]
+            batch_start = time.perf_counter()
+            outputs  = self.chain_generate_sql_part.batch([part_inputs[i] for i in pending], config=configs, return_exceptions=True)
+            batch_seconds = time.perf_counter() - batch_start
+            for t in {part_tables[i] for i in pending}:
+                metrics[t].network_seconds += batch_seconds
+            for i, handler, output in zip(pending, handlers, outputs):
+                call_metrics = metrics[part_tables[i]]
+                call_metrics.add_usage(handler)
+                if isinstance(output, Exception):
+                    call_metrics.error = type(output).__name__
+                part_scripts[i] = self.parse_sql_part(output, call_metrics)
+
+        for t, (result, table_sql, call_metrics) in enumerate(zip(results, tables_sql, metrics)):
+            sql_script, part_errors = self.merge_sql_parts(table_sql, items, part_scripts[t * len(items):(t + 1) * len(items)])
+            result.local_errors.extend(part_errors)
+            result.tokens_used = call_metrics.total_tokens
+            result.sql_script, result.sql_errors, validate_tokens = self.validate_sql(db_name, sql_script, call_metrics)
+            result.local_errors.extend(format_sql_error(e) for e in result.sql_errors)
+            result.tokens_used += validate_tokens
+            call_metrics.total_seconds = call_metrics.network_seconds + call_metrics.parse_seconds + call_metrics.validate_seconds
+            self.record_call_metrics(call_metrics)
+
+    def parse_sql(self, sql_xml : str, existed_tables : list[str], call_metrics : CallMetrics = None) -> tuple[list[str], str, list[str]]:
+        """
+            Parse LLM output of sql generation, returns new tables, sql script and local errors
+        """
+        if call_metrics is None:
+            call_metrics = CallMetrics('parse_sql')
+
+        with call_metrics.measure('parse_seconds'):
+            sql_xml = self.extract_llm_xml_string(sql_xml)
+            logger.debug(f"LLM generated sql: {sql_xml}")
+            
+            x = xml_utils.parse_llm_xml(sql_xml)
+            truncated = xml_utils.is_truncated(sql_xml)
+
+            new_tables    = xml_utils.get_array_by_xpath(x , './/created_tables//table')
+            foregn_tables = xml_utils.get_array_by_xpath(x , './/foregn_key_tables//table')
+            sql_script    = xml_utils.get_text_by_xpath(x , './/sql_script_text').strip('\n ')
     
-        for t in foregn_tables:
-            if t not in new_tables and t not in existed_tables:
-                local_errors.append(f"Table {t} doesn't exist")
+        with call_metrics.measure('validate_seconds'):
+            local_errors = []
+        
+            new_tables    = [i for i in new_tables if i and i.lower() != 'none'] # remove empty
+            foregn_tables = [i for i in foregn_tables if i and i.lower() != 'none']
+        
+            if truncated:
+                logger.warning("LLM generated sql script is truncated")
+                local_errors.append("LLM output is truncated, sql script is incomplete")
+
+            known_tables = {t.lower() for t in new_tables} | {t.lower() for t in existed_tables}
+            for t in foregn_tables:
+                if t.lower() not in known_tables:
+                    local_errors.append(f"Table {t} doesn't exist")
     
-        return new_tables, sql_script, local_errors, tokens_used
+        return new_tables, sql_script, local_errors
+
+    def generate_procedures_batch(self, db_name : str, tables : list[TableSchema], procedure_spec : str = None, existed_tables : list[str] = None, max_concurrency : int = None) -> list[TableSqlResult]:
+        """
+            Generate procedures for many tables concurrently.
+            All prompts share the same prefix (instructions, known tables, procedure spec), only table schema differs.
+            Errors are reported per table and do not abort the batch.
+        """
+        if existed_tables is None:
+            existed_tables = []
+
+        if not max_concurrency:
+            max_concurrency = self._MAX_CONCURRENCY
+
+        if not procedure_spec:
+            procedure_spec = prompts.GENERATE_PROCEDURES_DEFAULT_SPEC
+
+        table_names = [t.name for t in tables]
+        known_tables = set(table_names).union(existed_tables)
+        known_tables_str = "\n".join([t.to_summary() for t in tables] + [self.get_existed_tables_str([t for t in existed_tables if t not in table_names], " ".join(table_names))]).strip()
+        inputs = [
+            {
+                "dbname" : db_name,
+                "known_tables" : known_tables_str,
+                "procedures" : procedure_spec,
+                "table_schema" : table.to_xml()
+            }
+            for table in tables
+        ]
+
+        handlers = [UsageCallbackHandler() for _ in inputs]
+        configs  = [{"callbacks" : [h], "max_concurrency" : max_concurrency} for h in handlers]
+        batch_start = time.perf_counter()
+        outputs  = self.chain_generate_procedures.batch(inputs, config=configs, return_exceptions=True)
+        batch_seconds = time.perf_counter() - batch_start
+
+        results = []
+        for table, handler, sql_xml in zip(tables, handlers, outputs):
+            call_metrics = CallMetrics('generate_procedures_batch', self._BASE_MODEL_NAME, self.openai_api_deployment, network_seconds=batch_seconds, timestamp=time.time())
+            call_metrics.add_usage(handler)
+            result = TableSqlResult(table.to_xml(), tokens_used = handler.total_tokens)
+            results.append(result)
+            sql_xml, repair_tokens = self.batch_repair_llm_xml(sql_xml, call_metrics)
+            result.tokens_used += repair_tokens
+            if isinstance(sql_xml, Exception):
+                logger.error(f"LLM call failed: {sql_xml}")
+                result.error = f"LLM call failed: {sql_xml}"
+                call_metrics.error = type(sql_xml).__name__
+            else:
+                try:
+                    result.sql_script, result.local_errors = self.parse_procedures(sql_xml, known_tables, call_metrics)
+                except Exception as error: # pylint: disable=W0718
+                    logger.error(f"Could not parse LLM generated XML: {error}")
+                    result.error = f"Could not parse LLM generated XML: {error}"
+                    call_metrics.error = type(error).__name__
+                else:
+                    result.new_tables = []
+                    result.sql_script, result.sql_errors, validate_tokens = self.validate_sql(db_name, result.sql_script, call_metrics)
+                    result.local_errors.extend(format_sql_error(e) for e in result.sql_errors)
+                    result.tokens_used += validate_tokens
+            call_metrics.total_seconds = call_metrics.network_seconds + call_metrics.parse_seconds + call_metrics.validate_seconds
+            self.record_call_metrics(call_metrics)
+
+        return results
+
+    def parse_procedures(self, sql_xml : str, known_tables : set[str], call_metrics : CallMetrics = None) -> tuple[str, list[str]]:
+        """
+            Parse LLM output of procedures generation, returns sql script and local errors
+        """
+        if call_metrics is None:
+            call_metrics = CallMetrics('parse_procedures')
+
+        with call_metrics.measure('parse_seconds'):
+            sql_xml = self.extract_llm_xml_string(sql_xml)
+            logger.debug(f"LLM generated procedures: {sql_xml}")
+
+            x = xml_utils.parse_llm_xml(sql_xml)
+
+            referenced_tables = xml_utils.get_array_by_xpath(x , './/referenced_tables//table')
+            sql_script        = xml_utils.get_text_by_xpath(x , './/sql_script_text').strip('\n ')
+
+        with call_metrics.measure('validate_seconds'):
+            known_tables_lower = {t.lower() for t in known_tables}
+            local_errors = [f"Table {t} doesn't exist" for t in referenced_tables if t and t.lower() != 'none' and t.lower() not in known_tables_lower]
+
+        return sql_script, local_errors
+
+    def validate_sql(self, db_name : str, sql_script : str, call_metrics : CallMetrics = None) -> tuple[str, list[SqlError], int]:
+        """
+            Validate generated sql locally (if enabled), failing statements are fixed by LLM one by one
+            instead of full regeneration. Returns sql script, errors left and used tokens.
+        """
+        if self.sql_validator is None or not sql_script:
+            return sql_script, [], 0
+        if call_metrics is None:
+            call_metrics = CallMetrics('validate_sql')
+
+        with call_metrics.measure('validate_seconds'):
+            statements, sql_errors = self.sql_validator.validate(sql_script, db_name)
+        if not sql_errors or not self.sql_validator.repair:
+            return sql_script, sql_errors, 0
+
+        chain, indexes, inputs = self.get_fix_sql_request(db_name, statements, sql_errors)
+        outputs, tokens_used = self.batch_chain(chain, inputs, call_metrics)
+        sql_script, sql_errors = self.apply_sql_fixes(db_name, sql_script, statements, indexes, outputs, call_metrics)
+        return sql_script, sql_errors, tokens_used
+
+    async def avalidate_sql(self, db_name : str, sql_script : str, call_metrics : CallMetrics = None) -> tuple[str, list[SqlError], int]:
+        """
+            Async version of validate_sql
+        """
+        if self.sql_validator is None or not sql_script:
+            return sql_script, [], 0
+        if call_metrics is None:
+            call_metrics = CallMetrics('validate_sql')
+
+        with call_metrics.measure('validate_seconds'):
+            statements, sql_errors = self.sql_validator.validate(sql_script, db_name)
+        if not sql_errors or not self.sql_validator.repair:
+            return sql_script, sql_errors, 0
+
+        chain, indexes, inputs = self.get_fix_sql_request(db_name, statements, sql_errors)
+        outputs, tokens_used = await self.abatch_chain(chain, inputs, call_metrics)
+        sql_script, sql_errors = self.apply_sql_fixes(db_name, sql_script, statements, indexes, outputs, call_metrics)
+        return sql_script, sql_errors, tokens_used
+
+    def get_fix_sql_request(self, db_name : str, statements : list[SqlStatement], sql_errors : list[SqlError]) -> tuple[RunnableSequence, list[int], list[dict[str, str]]]:
+        """
+            Chain, indexes of failing statements and inputs to fix them, token budget is based on the longest statement
+        """
+        errors_by_statement : dict[int, list[str]] = {}
+        for sql_error in sql_errors:
+            errors_by_statement.setdefault(sql_error.statement_index, []).append(f"- {sql_error.message}")
+        indexes = sorted(errors_by_statement)
+        logger.warning(f"Generated SQL has errors in {len(indexes)} statements, ask LLM to fix them")
+
+        inputs = [{"dbname" : db_name, "errors" : "\n".join(errors_by_statement[i]), "statement" : statements[i].text} for i in indexes]
+        max_tokens = min(self._MAX_TOKENS, max(len(statements[i].text) for i in indexes) // 3 + self._FIX_SQL_EXTRA_TOKENS)
+        chain = self.fix_sql_prompt | self.llm.bind(max_tokens=max_tokens) | StrOutputParser()
+        return chain, indexes, inputs
+
+    def apply_sql_fixes(self, db_name : str, sql_script : str, statements : list[SqlStatement], indexes : list[int], outputs : list[Any], call_metrics : CallMetrics) -> tuple[str, list[SqlError]]:
+        """
+            Replace failing statements by fixed ones and validate script again.
+            Returns sql script and errors left.
+        """
+        replacements = {}
+        for index, output in zip(indexes, outputs):
+            if isinstance(output, Exception):
+                logger.error(f"LLM call failed: {output}")
+                continue
+            # delimiter of original statement is kept in the script
+            fixed_statement = strip_statement_delimiter(output)
+            if fixed_statement:
+                replacements[index] = fixed_statement
+
+        sql_script = replace_statements(sql_script, statements, replacements)
+        with call_metrics.measure('validate_seconds'):
+            _, sql_errors = self.sql_validator.validate(sql_script, db_name)
+        logger.debug(f"SQL errors after fix: {len(sql_errors)}")
+        return sql_script, sql_errors
+
+    def get_translate_sql_chain(self, statements : list[str]) -> RunnableSequence:
+        """
+            Chain to translate statements to another dialect, token budget is based on the longest statement
+        """
+        max_tokens = min(self._MAX_TOKENS, max(len(s) for s in statements) // 3 + self._FIX_SQL_EXTRA_TOKENS)
+        return self.translate_sql_prompt | self.llm.bind(max_tokens=max_tokens) | StrOutputParser()
+
+    def get_fix_xml_chain(self, sql_xml : str) -> RunnableSequence:
+        """
+            Chain to fix broken XML, token budget is based on the size of XML
+        """
+        max_tokens = min(self._MAX_TOKENS, len(sql_xml) // 3 + self._FIX_XML_EXTRA_TOKENS)
+        return self.fix_xml_prompt | self.llm.bind(max_tokens=max_tokens) | StrOutputParser()
+
+    def repair_llm_xml(self, sql_xml : str, call_metrics : CallMetrics = None) -> tuple[str, int]:
+        """
+            Returns LLM output as is if it can be parsed locally or is truncated (fix can't restore lost text, parse reports it),
+            otherwise asks LLM to fix XML (instead of full regeneration). Returns XML and used tokens.
+        """
+        if xml_utils.is_truncated(sql_xml):
+            logger.warning("LLM generated XML is truncated, it can't be fixed")
+            return sql_xml, 0
+        if xml_utils.try_parse_llm_xml(sql_xml) is not None:
+            return sql_xml, 0
+        logger.warning("Could not parse LLM generated XML, ask LLM to fix it")
+        return self.invoke_chain(self.get_fix_xml_chain(sql_xml), {"xml" : sql_xml}, call_metrics)
+
+    def batch_repair_llm_xml(self, sql_xml : Any, call_metrics : CallMetrics) -> tuple[Any, int]:
+        """
+            Repair of one batch item: LLM exceptions are returned as is, failed fix call is returned
+            as exception instead of XML, so it fails only this item and not the whole batch.
+        """
+        if isinstance(sql_xml, Exception):
+            return sql_xml, 0
+        try:
+            return self.repair_llm_xml(sql_xml, call_metrics)
+        except Exception as error: # pylint: disable=W0718
+            logger.error(f"Could not repair LLM generated XML: {error}")
+            return error, 0
+
+    async def arepair_llm_xml(self, sql_xml : str, call_metrics : CallMetrics = None) -> tuple[str, int]:
+        """
+            Async version of repair_llm_xml
+        """
+        if xml_utils.is_truncated(sql_xml):
+            logger.warning("LLM generated XML is truncated, it can't be fixed")
+            return sql_xml, 0
+        if xml_utils.try_parse_llm_xml(sql_xml) is not None:
+            return sql_xml, 0
+        logger.warning("Could not parse LLM generated XML, ask LLM to fix it")
+        return await self.ainvoke_chain(self.get_fix_xml_chain(sql_xml), {"xml" : sql_xml}, call_metrics)
 
     def extract_llm_xml_string(self, sql_xml : str) -> str:
         """
@@ -260,4 +1384,20 @@ class LLMCore:
             
         sql_xml = sql_xml.strip()
 
-        return sql_xml
\ No newline at end of file
+        return sql_xml
+
+_shared_llm_cores : dict[str, LLMCore] = {}
+_shared_llm_cores_lock = threading.Lock()
+
+def get_shared_llm_core(all_secrets : dict[str, Any]) -> LLMCore:
+    """
+        Process-wide LLMCore for the secrets, so chains, LLM clients and connection pool are reused by all sessions
+    """
+    secrets_hash = hashlib.sha256(json.dumps(all_secrets, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    with _shared_llm_cores_lock:
+        llm_core = _shared_llm_cores.get(secrets_hash)
+        if llm_core is None:
+            logger.info("Create shared LLMCore")
+            llm_core = LLMCore(all_secrets)
+            _shared_llm_cores[secrets_hash] = llm_core
+        return llm_core
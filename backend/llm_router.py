@@ -0,0 +1,379 @@
+"""
+    Router of LLM requests between several deployments with rate limiting and failover
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator
+
+import httpx
+import openai
+
+from langchain_openai import ChatOpenAI, AzureChatOpenAI
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+logger : logging.Logger = logging.getLogger()
+
+_RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+        Token bucket with capacity of one minute, refilled continuously.
+        Not thread-safe, used under lock of deployment.
+    """
+
+    def __init__(self, per_minute : float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now : float):
+        """
+            Add amount accumulated since last update
+        """
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def get_wait_seconds(self, amount : float, now : float) -> float:
+        """
+            Time till amount is available, requests larger than capacity wait for full bucket
+        """
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.available >= amount else (amount - self.available) / self.rate
+
+    def consume(self, amount : float):
+        """
+            Take amount, balance can be negative after correction by actual usage
+        """
+        self.available -= amount
+
+class Deployment:
+    """
+        One deployment (model of OpenAI account or Azure deployment) with own limits and state
+    """
+
+    def __init__(self, name : str, llm : BaseChatModel, weight : float = 1.0, rpm : float = None, tpm : float = None):
+        self.name = name
+        self.llm = llm
+        self.weight = weight
+        self.requests_bucket = TokenBucket(rpm) if rpm else None
+        self.tokens_bucket = TokenBucket(tpm) if tpm else None
+        self.lock = threading.Lock()
+        self.outstanding = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def try_acquire(self, estimated_tokens : int) -> float:
+        """
+            Take capacity for one request, returns 0 if acquired or seconds to wait
+        """
+        with self.lock:
+            now = time.monotonic()
+            wait_seconds = max(0.0, self.cooldown_until - now)
+            if self.requests_bucket:
+                wait_seconds = max(wait_seconds, self.requests_bucket.get_wait_seconds(1, now))
+            if self.tokens_bucket:
+                wait_seconds = max(wait_seconds, self.tokens_bucket.get_wait_seconds(estimated_tokens, now))
+            if wait_seconds > 0:
+                return wait_seconds
+            if self.requests_bucket:
+                self.requests_bucket.consume(1)
+            if self.tokens_bucket:
+                self.tokens_bucket.consume(estimated_tokens)
+            self.outstanding += 1
+            self.requests += 1
+            return 0.0
+
+    def release(self, estimated_tokens : int, used_tokens : int = None):
+        """
+            Request is done, token bucket is corrected by actual usage
+        """
+        with self.lock:
+            self.outstanding -= 1
+            if self.tokens_bucket and used_tokens is not None:
+                self.tokens_bucket.consume(used_tokens - estimated_tokens)
+
+    def fail(self, cooldown_seconds : float):
+        """
+            Do not send requests to the deployment for a while
+        """
+        with self.lock:
+            self.failures += 1
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown_seconds)
+
+def is_retryable_error(error : Exception) -> bool:
+    """
+        Rate limit, server and connection errors can be retried on another deployment
+    """
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, httpx.TransportError)):
+        return True
+    return getattr(error, 'status_code', None) in _RETRYABLE_STATUS_CODES
+
+def get_retry_after(error : Exception) -> float:
+    """
+        Retry-After header of the error response, None if not provided
+    """
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+def get_total_tokens(result : ChatResult) -> int:
+    """
+        Tokens used by the call, None if provider does not report usage
+    """
+    token_usage = (result.llm_output or {}).get('token_usage') or {}
+    return token_usage.get('total_tokens')
+
+class LLMRouter(BaseChatModel):
+    """
+        Chat model that sends each request to one of deployments.
+        Deployment is chosen by weight or by least outstanding requests among those
+        that have capacity in requests-per-minute and tokens-per-minute buckets.
+        Rate limit (429), server (5xx) and connection errors put deployment into cooldown
+        (Retry-After or jittered exponential backoff) and request fails over to another deployment.
+    """
+    deployments : list[Any]
+    strategy : str = 'least_outstanding'
+    max_attempts : int = 4
+    backoff_seconds : float = 1.0
+    max_backoff_seconds : float = 30.0
+    max_wait_seconds : float = 120.0
+    model_name : str = 'router'
+
+    @property
+    def _llm_type(self) -> str:
+        return "llm-router"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"model_name" : self.model_name, "deployments" : [d.name for d in self.deployments]}
+
+    def estimate_tokens(self, messages : list[BaseMessage], kwargs : dict[str, Any]) -> int:
+        """
+            Prompt tokens (approximately) and maximum completion tokens
+        """
+        max_tokens = kwargs.get('max_tokens') or getattr(self.deployments[0].llm, 'max_tokens', None) or 0
+        return sum(len(str(m.content)) for m in messages) // 4 + max_tokens
+
+    def get_candidates(self, excluded : set[str]) -> list[Deployment]:
+        """
+            Deployments in order of preference, deployments that failed this request go last
+        """
+        if self.strategy == 'weighted':
+            # weighted random order (Efraimidis-Spirakis)
+            ordered = sorted(self.deployments, key=lambda d: -random.random() ** (1.0 / max(d.weight, 1e-6)))
+        else:
+            ordered = sorted(self.deployments, key=lambda d: (d.outstanding / max(d.weight, 1e-6), random.random()))
+        return [d for d in ordered if d.name not in excluded] + [d for d in ordered if d.name in excluded]
+
+    def try_acquire_deployment(self, estimated_tokens : int, excluded : set[str]) -> tuple[Deployment, float]:
+        """
+            Deployment with capacity for the request, or None and time to wait for the first free one
+        """
+        wait_seconds = None
+        for deployment in self.get_candidates(excluded):
+            deployment_wait = deployment.try_acquire(estimated_tokens)
+            if deployment_wait == 0:
+                return deployment, 0.0
+            wait_seconds = deployment_wait if wait_seconds is None else min(wait_seconds, deployment_wait)
+        return None, wait_seconds
+
+    def acquire_deployment(self, estimated_tokens : int, excluded : set[str]) -> Deployment:
+        """
+            Wait for deployment with capacity for the request
+        """
+        deadline = time.monotonic() + self.max_wait_seconds
+        while True:
+            deployment, wait_seconds = self.try_acquire_deployment(estimated_tokens, excluded)
+            if deployment is not None:
+                return deployment
+            if time.monotonic() + wait_seconds > deadline:
+                raise TimeoutError(f"No LLM deployment is available in {self.max_wait_seconds} seconds")
+            time.sleep(wait_seconds)
+
+    async def aacquire_deployment(self, estimated_tokens : int, excluded : set[str]) -> Deployment:
+        """
+            Async version of acquire_deployment
+        """
+        deadline = time.monotonic() + self.max_wait_seconds
+        while True:
+            deployment, wait_seconds = self.try_acquire_deployment(estimated_tokens, excluded)
+            if deployment is not None:
+                return deployment
+            if time.monotonic() + wait_seconds > deadline:
+                raise TimeoutError(f"No LLM deployment is available in {self.max_wait_seconds} seconds")
+            await asyncio.sleep(wait_seconds)
+
+    def handle_error(self, deployment : Deployment, error : Exception, attempt : int, excluded : set[str]):
+        """
+            Raise error if it can't be retried, otherwise put deployment into cooldown
+        """
+        if not is_retryable_error(error) or attempt + 1 >= self.max_attempts:
+            raise error
+        backoff_seconds = random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt))
+        retry_after = get_retry_after(error)
+        cooldown_seconds = retry_after if retry_after is not None else backoff_seconds
+        logger.warning(f"LLM deployment {deployment.name} failed ({type(error).__name__}), cooldown {cooldown_seconds:.2f}s, attempt {attempt + 1} of {self.max_attempts}")
+        deployment.fail(cooldown_seconds)
+        excluded.add(deployment.name)
+
+    def add_deployment_info(self, result : ChatResult, deployment : Deployment) -> ChatResult:
+        """
+            Report deployment that served the request
+        """
+        result.llm_output = {**(result.llm_output or {}), "deployment" : deployment.name}
+        return result
+
+    def _generate(self, messages : list[BaseMessage], stop : list[str] = None, run_manager : Any = None, **kwargs : Any) -> ChatResult:
+        estimated_tokens = self.estimate_tokens(messages, kwargs)
+        excluded = set()
+        for attempt in range(self.max_attempts):
+            deployment = self.acquire_deployment(estimated_tokens, excluded)
+            try:
+                result = deployment.llm._generate(messages, stop=stop, **kwargs) # pylint: disable=W0212
+            except Exception as error: # pylint: disable=W0718
+                deployment.release(estimated_tokens)
+                self.handle_error(deployment, error, attempt, excluded)
+                continue
+            deployment.release(estimated_tokens, get_total_tokens(result))
+            return self.add_deployment_info(result, deployment)
+        raise RuntimeError("No attempts left") # not reachable, last error is raised by handle_error
+
+    async def _agenerate(self, messages : list[BaseMessage], stop : list[str] = None, run_manager : Any = None, **kwargs : Any) -> ChatResult:
+        estimated_tokens = self.estimate_tokens(messages, kwargs)
+        excluded = set()
+        for attempt in range(self.max_attempts):
+            deployment = await self.aacquire_deployment(estimated_tokens, excluded)
+            try:
+                result = await deployment.llm._agenerate(messages, stop=stop, **kwargs) # pylint: disable=W0212
+            except Exception as error: # pylint: disable=W0718
+                deployment.release(estimated_tokens)
+                self.handle_error(deployment, error, attempt, excluded)
+                continue
+            deployment.release(estimated_tokens, get_total_tokens(result))
+            return self.add_deployment_info(result, deployment)
+        raise RuntimeError("No attempts left")
+
+    def _stream(self, messages : list[BaseMessage], stop : list[str] = None, run_manager : Any = None, **kwargs : Any) -> Iterator[ChatGenerationChunk]:
+        # fail over is possible only till the first chunk is received
+        estimated_tokens = self.estimate_tokens(messages, kwargs)
+        excluded = set()
+        for attempt in range(self.max_attempts):
+            deployment = self.acquire_deployment(estimated_tokens, excluded)
+            started = False
+            released = False
+            try:
+                for chunk in deployment.llm._stream(messages, stop=stop, **kwargs): # pylint: disable=W0212
+                    if not started:
+                        chunk.generation_info = {**(chunk.generation_info or {}), "deployment" : deployment.name}
+                    started = True
+                    yield chunk
+            except Exception as error: # pylint: disable=W0718
+                deployment.release(estimated_tokens)
+                released = True
+                if started:
+                    raise
+                self.handle_error(deployment, error, attempt, excluded)
+                continue
+            finally:
+                # consumer can stop early (GeneratorExit, CancelledError)
+                if not released:
+                    deployment.release(estimated_tokens)
+            return
+
+    async def _astream(self, messages : list[BaseMessage], stop : list[str] = None, run_manager : Any = None, **kwargs : Any) -> AsyncIterator[ChatGenerationChunk]:
+        estimated_tokens = self.estimate_tokens(messages, kwargs)
+        excluded = set()
+        for attempt in range(self.max_attempts):
+            deployment = await self.aacquire_deployment(estimated_tokens, excluded)
+            started = False
+            released = False
+            try:
+                async for chunk in deployment.llm._astream(messages, stop=stop, **kwargs): # pylint: disable=W0212
+                    if not started:
+                        chunk.generation_info = {**(chunk.generation_info or {}), "deployment" : deployment.name}
+                    started = True
+                    yield chunk
+            except Exception as error: # pylint: disable=W0718
+                deployment.release(estimated_tokens)
+                released = True
+                if started:
+                    raise
+                self.handle_error(deployment, error, attempt, excluded)
+                continue
+            finally:
+                # consumer can stop early (GeneratorExit, CancelledError)
+                if not released:
+                    deployment.release(estimated_tokens)
+            return
+
+    def get_stats(self) -> list[dict[str, Any]]:
+        """
+            Requests, failures and outstanding requests of each deployment
+        """
+        return [{"name" : d.name, "requests" : d.requests, "failures" : d.failures, "outstanding" : d.outstanding} for d in self.deployments]
+
+def create_llm_router(router_secrets : dict[str, Any], max_tokens : int, model_name : str, http_client : httpx.Client = None, http_async_client : httpx.AsyncClient = None) -> LLMRouter:
+    """
+        Create router from [llm_router] section of secrets.
+        Each item of DEPLOYMENTS has NAME, API_TYPE (openai or azure), API_KEY, MODEL_NAME, WEIGHT, RPM, TPM
+        and BASE_URL for OpenAI compatible server or ENDPOINT, API_VERSION and DEPLOYMENT for Azure.
+    """
+    deployments = []
+    for i, deployment_secrets in enumerate(router_secrets.get('DEPLOYMENTS', [])):
+        common = {
+            "model_name"        : deployment_secrets.get('MODEL_NAME', model_name),
+            "max_tokens"        : max_tokens,
+            "temperature"       : 0,
+            "verbose"           : False,
+            "max_retries"       : 0, # retries are done by router
+            "http_client"       : http_client,
+            "http_async_client" : http_async_client
+        }
+        if deployment_secrets.get('API_TYPE', 'openai') == 'azure':
+            llm = AzureChatOpenAI(
+                azure_deployment = deployment_secrets.get('DEPLOYMENT'),
+                azure_endpoint   = deployment_secrets.get('ENDPOINT'),
+                api_key          = deployment_secrets.get('API_KEY'),
+                api_version      = deployment_secrets.get('API_VERSION'),
+                **common
+            )
+        else:
+            llm = ChatOpenAI(
+                api_key  = deployment_secrets.get('API_KEY'),
+                base_url = deployment_secrets.get('BASE_URL'),
+                **common
+            )
+        deployments.append(Deployment(
+            name   = deployment_secrets.get('NAME', f"deployment_{i}"),
+            llm    = llm,
+            weight = float(deployment_secrets.get('WEIGHT', 1.0)),
+            rpm    = deployment_secrets.get('RPM'),
+            tpm    = deployment_secrets.get('TPM')
+        ))
+    if not deployments:
+        raise ValueError('llm_router section has no DEPLOYMENTS')
+
+    logger.info(f"LLM router with {len(deployments)} deployments: {[d.name for d in deployments]}")
+    return LLMRouter(
+        deployments         = deployments,
+        strategy            = router_secrets.get('STRATEGY', 'least_outstanding'),
+        max_attempts        = int(router_secrets.get('MAX_ATTEMPTS', 4)),
+        backoff_seconds     = float(router_secrets.get('BACKOFF_SECONDS', 1.0)),
+        max_backoff_seconds = float(router_secrets.get('MAX_BACKOFF_SECONDS', 30.0)),
+        max_wait_seconds    = float(router_secrets.get('MAX_WAIT_SECONDS', 120.0)),
+        model_name          = model_name
+    )
@@ -0,0 +1,263 @@
+"""
+    Per-call LLM metrics and metrics sinks
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import abc
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+
+logger : logging.Logger = logging.getLogger()
+
+# LLM cache backends report lookups of the current call here
+_cache_lookups : contextvars.ContextVar[dict] = contextvars.ContextVar('cache_lookups', default=None)
+
+@contextmanager
+def track_cache_lookups() -> Iterator[dict]:
+    """
+        Collect LLM cache hits/misses of the calls inside of the block
+    """
+    lookups = {"hits" : 0, "misses" : 0}
+    token = _cache_lookups.set(lookups)
+    try:
+        yield lookups
+    finally:
+        _cache_lookups.reset(token)
+
+def record_cache_lookup(hit : bool):
+    """
+        Called by LLM cache backends on each lookup
+    """
+    lookups = _cache_lookups.get()
+    if lookups is not None:
+        lookups["hits" if hit else "misses"] += 1
+
+@dataclass
+class CallMetrics:
+    """
+        Metrics of one generation call
+    """
+    operation : str
+    model : str = None
+    deployment : str = None
+    prompt_tokens : int = 0
+    completion_tokens : int = 0
+    total_tokens : int = 0
+    cost : float = 0.0
+    prompt_seconds : float = 0.0
+    network_seconds : float = 0.0
+    parse_seconds : float = 0.0
+    validate_seconds : float = 0.0
+    total_seconds : float = 0.0
+    cache_hit : str = None
+    error : str = None
+    timestamp : float = 0.0
+
+    @contextmanager
+    def measure(self, field_name : str) -> Iterator[None]:
+        """
+            Add time of the block to the field
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            setattr(self, field_name, getattr(self, field_name) + time.perf_counter() - start)
+
+    def add_usage(self, handler : Any):
+        """
+            Add token usage and cost from OpenAI callback handler,
+            deployment reported by LLM router replaces the configured one
+        """
+        if getattr(handler, 'deployment', None):
+            self.deployment = handler.deployment
+        self.prompt_tokens     += handler.prompt_tokens
+        self.completion_tokens += handler.completion_tokens
+        self.total_tokens      += handler.total_tokens
+        self.cost              += handler.total_cost
+
+class MetricsSink(abc.ABC):
+    """
+        Base class of metrics sink
+    """
+
+    @abc.abstractmethod
+    def record(self, call_metrics : CallMetrics):
+        """
+            Record metrics of one call
+        """
+
+class JsonlMetricsSink(MetricsSink):
+    """
+        Append metrics of each call as JSON line
+    """
+
+    def __init__(self, path : str):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, call_metrics : CallMetrics):
+        line = json.dumps(asdict(call_metrics))
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+class Histogram:
+    """
+        Cumulative histogram in Prometheus style
+    """
+
+    def __init__(self, buckets : list[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value : float):
+        """
+            Add value
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name : str, labels : str) -> list[str]:
+        """
+            Prometheus text lines
+        """
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.total}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+class PrometheusMetricsSink(MetricsSink):
+    """
+        Aggregate metrics into counters and histograms, rendered in Prometheus text format
+    """
+    _LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60]
+    _PHASES = ['prompt', 'network', 'parse', 'validate', 'total']
+    _COUNTERS = ['prompt_tokens', 'completion_tokens', 'total_tokens', 'cost']
+    _HELP = {
+        'llm_call_seconds'            : 'Time of LLM call phases in seconds',
+        'llm_calls_total'             : 'Number of LLM calls',
+        'llm_prompt_tokens_total'     : 'Prompt tokens used by LLM calls',
+        'llm_completion_tokens_total' : 'Completion tokens used by LLM calls',
+        'llm_total_tokens_total'      : 'Tokens used by LLM calls',
+        'llm_cost_total'              : 'Cost of LLM calls in USD',
+        'llm_cache_hits_total'        : 'LLM calls served from cache',
+        'llm_errors_total'            : 'Failed LLM calls'
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms : dict[tuple[str, str, str], Histogram] = {}
+        self.counters : dict[tuple[str, str], float] = {}
+        self.server = None
+
+    def record(self, call_metrics : CallMetrics):
+        labels = f'operation="{call_metrics.operation}",model="{call_metrics.model}",deployment="{call_metrics.deployment or ""}"'
+        with self.lock:
+            for phase in self._PHASES:
+                key = ('llm_call_seconds', labels, phase)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(self._LATENCY_BUCKETS)
+                histogram.observe(getattr(call_metrics, f"{phase}_seconds"))
+            for counter in self._COUNTERS:
+                self.add_counter(f'llm_{counter}_total', labels, getattr(call_metrics, counter))
+            self.add_counter('llm_calls_total', labels, 1)
+            if call_metrics.cache_hit:
+                self.add_counter('llm_cache_hits_total', f'{labels},cache="{call_metrics.cache_hit}"', 1)
+            if call_metrics.error:
+                self.add_counter('llm_errors_total', f'{labels},error="{call_metrics.error}"', 1)
+
+    def add_counter(self, name : str, labels : str, value : float):
+        """
+            Increase counter, lock must be held
+        """
+        self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def render(self) -> str:
+        """
+            All metrics in Prometheus text format
+        """
+        lines = []
+        described = set()
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                self.add_metadata(lines, described, name, 'counter')
+                lines.append(f'{name}{{{labels}}} {value}')
+            for (name, labels, phase), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                self.add_metadata(lines, described, name, 'histogram')
+                lines.extend(histogram.render(name, f'{labels},phase="{phase}"'))
+        return "\n".join(lines) + "\n"
+
+    def add_metadata(self, lines : list[str], described : set[str], name : str, metric_type : str):
+        """
+            Add HELP and TYPE lines before the first sample of the metric
+        """
+        if name not in described:
+            described.add(name)
+            lines.append(f'# HELP {name} {self._HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+    def start_http_server(self, port : int, host : str = '127.0.0.1'):
+        """
+            Serve metrics on http://host:port/metrics in background thread
+        """
+        sink = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            """Metrics endpoint"""
+            def do_GET(self): # pylint: disable=C0116
+                body = sink.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # pylint: disable=W0622
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f'Metrics endpoint http://{host}:{port}/metrics')
+
+def create_metrics_sinks(all_secrets : dict[str, Any]) -> list[MetricsSink]:
+    """
+        Create sinks from [metrics] section of secrets (JSONL_PATH, PROMETHEUS_PORT)
+    """
+    metrics_secrets = all_secrets.get('metrics') if all_secrets else None
+    if not metrics_secrets:
+        return []
+    sinks = []
+    jsonl_path = metrics_secrets.get('JSONL_PATH')
+    if jsonl_path:
+        sinks.append(JsonlMetricsSink(jsonl_path))
+    prometheus_port = metrics_secrets.get('PROMETHEUS_PORT')
+    if prometheus_port:
+        prometheus_sink = PrometheusMetricsSink()
+        try:
+            prometheus_sink.start_http_server(int(prometheus_port), metrics_secrets.get('PROMETHEUS_HOST', '127.0.0.1'))
+        except OSError as error:
+            logger.error(f'Could not start metrics endpoint: {error}')
+        sinks.append(prometheus_sink)
+    return sinks
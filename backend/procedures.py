@@ -0,0 +1,61 @@
+"""
+    Bulk generation of stored procedures for many tables
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import logging
+from dataclasses import dataclass, field
+
+from backend.llm_core import LLMCore, TableSqlResult
+from backend.schema_model import TableSchema
+
+logger : logging.Logger = logging.getLogger()
+
+@dataclass
+class ProceduresResult:
+    """
+        Result of procedures generation for many tables
+    """
+    sql_script : str = ''
+    tables : dict[str, TableSqlResult] = field(default_factory=dict)
+    errors : list[str] = field(default_factory=list)
+    tokens_used : int = 0
+
+class ProcedureGenerator:
+    """
+        Generate procedures for all tables concurrently and combine them into one script
+    """
+
+    def __init__(self, llm_backend : LLMCore):
+        self.llm_backend = llm_backend
+
+    def run(self, db_name : str, tables : list[TableSchema], procedure_spec : str = None, existed_tables : list[str] = None, max_concurrency : int = None) -> ProceduresResult:
+        """
+            Generate procedures, references to tables that are neither in the batch nor existed are reported as errors
+        """
+        result = ProceduresResult()
+        unique_tables = {}
+        for table in tables:
+            if table is None or not table.name:
+                result.errors.append("Could not find table name in table schema")
+                continue
+            unique_tables.setdefault(table.name.lower(), table)
+        tables = list(unique_tables.values())
+        if not tables:
+            return result
+
+        logger.info(f"Generate procedures for {len(tables)} tables")
+        table_results = self.llm_backend.generate_procedures_batch(db_name, tables, procedure_spec, existed_tables, max_concurrency)
+
+        scripts = []
+        for table, table_result in zip(tables, table_results):
+            result.tables[table.name] = table_result
+            result.tokens_used += table_result.tokens_used
+            if table_result.error:
+                result.errors.append(f"{table.name}: {table_result.error}")
+                continue
+            result.errors.extend(f"{table.name}: {e}" for e in table_result.local_errors)
+            scripts.append(f"-- {table.name}\n{table_result.sql_script}")
+
+        result.sql_script = "\n\n".join(scripts)
+        return result
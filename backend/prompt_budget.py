@@ -0,0 +1,160 @@
+"""
+    Token-budgeted list of existed tables for prompts
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import contextvars
+import functools
+import logging
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger : logging.Logger = logging.getLogger()
+
+# names of existed tables trimmed from prompts of the current generation are reported here
+_trimmed_tables : contextvars.ContextVar[list] = contextvars.ContextVar('trimmed_tables', default=None)
+
+@contextmanager
+def track_trimmed_tables() -> Iterator[list[str]]:
+    """
+        Collect names of existed tables trimmed from prompts inside of the block
+    """
+    trimmed_tables = []
+    token = _trimmed_tables.set(trimmed_tables)
+    try:
+        yield trimmed_tables
+    finally:
+        _trimmed_tables.reset(token)
+
+@dataclass
+class ExistedTablesSelection:
+    """
+        Existed tables included into prompt and trimmed ones
+    """
+    text : str = ''
+    included : list[str] = field(default_factory=list)
+    trimmed : list[str] = field(default_factory=list)
+    tokens : int = 0
+
+@functools.lru_cache(maxsize=16)
+def get_encoding(model_name : str) -> Any:
+    """
+        Tiktoken encoding for the model, None if it's not available (no tiktoken or encoding can't be loaded offline)
+    """
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as error: # pylint: disable=W0718
+        logger.warning(f"Could not load tiktoken encoding, token count is approximate: {error}")
+        return None
+
+def count_tokens(text : str, model_name : str) -> int:
+    """
+        Number of tokens in text, approximate if tiktoken encoding is not available
+    """
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+def split_tokens(tokens : int, count : int) -> list[int]:
+    """
+        Split tokens of one shared call between count items, remainder goes to the last item so the sum is kept
+    """
+    if count <= 0:
+        return []
+    shares = [tokens // count] * count
+    shares[-1] += tokens % count
+    return shares
+
+def get_words(text : str) -> set[str]:
+    """
+        Lower case words of text, table prefix is removed and simple plural is reduced
+    """
+    words = set()
+    for word in re.findall(r'[a-z0-9]+', text.lower().replace('tb_', ' ')):
+        words.add(word)
+        if len(word) > 3 and word.endswith('s'):
+            words.add(word[:-1])
+    return words
+
+def get_table_line(table_name : str) -> str:
+    """
+        Line of existed table in prompt
+    """
+    return f"- {table_name} - table for {table_name.replace('tb_', '')}"
+
+def rank_tables(existed_tables : list[str], query_text : str, embedding_model : Any = None) -> list[str]:
+    """
+        Sort tables by relevance to the query: name match first, then embedding similarity if model is provided
+    """
+    query_words = get_words(query_text)
+    query_lower = query_text.lower()
+
+    def name_score(table_name : str) -> float:
+        table_words = get_words(table_name)
+        if not table_words:
+            return 0.0
+        score = len(table_words & query_words) / len(table_words)
+        if table_name.lower() in query_lower:
+            score += 1.0
+        return score
+
+    scores = {t : name_score(t) for t in existed_tables}
+    if embedding_model is not None and existed_tables:
+        names = [t.replace('tb_', '').replace('_', ' ') for t in existed_tables]
+        vectors = embedding_model.encode([query_text] + names, normalize_embeddings=True)
+        for t, vector in zip(existed_tables, vectors[1:]):
+            scores[t] += float(vector @ vectors[0])
+
+    # stable sort keeps original order for equal scores
+    return sorted(existed_tables, key=lambda t: -scores[t])
+
+def select_existed_tables(existed_tables : list[str], query_text : str, max_tokens : int, model_name : str, embedding_model : Any = None) -> ExistedTablesSelection:
+    """
+        Most relevant existed tables that fit into token budget
+    """
+    selection = ExistedTablesSelection()
+    if not existed_tables:
+        return selection
+
+    # everything fits - keep original list, no ranking needed
+    all_lines = [get_table_line(t) for t in existed_tables]
+    all_text = "\n".join(all_lines)
+    all_tokens = count_tokens(all_text, model_name)
+    if all_tokens <= max_tokens:
+        selection.text = all_text
+        selection.included = list(existed_tables)
+        selection.tokens = all_tokens
+        return selection
+
+    lines = []
+    for table_name in rank_tables(existed_tables, query_text or '', embedding_model):
+        line = get_table_line(table_name)
+        line_tokens = count_tokens(line + "\n", model_name)
+        if selection.tokens + line_tokens > max_tokens:
+            selection.trimmed.append(table_name)
+            continue
+        lines.append(line)
+        selection.included.append(table_name)
+        selection.tokens += line_tokens
+
+    selection.text = "\n".join(lines)
+    if selection.trimmed:
+        logger.info(f"Existed tables trimmed by token budget {max_tokens}: included {len(selection.included)}, trimmed {len(selection.trimmed)}")
+        logger.debug(f"Trimmed tables: {selection.trimmed}")
+        trimmed_tables = _trimmed_tables.get()
+        if trimmed_tables is not None:
+            trimmed_tables.extend(t for t in selection.trimmed if t not in trimmed_tables)
+    return selection
@@ -0,0 +1,89 @@
+"""
+    Packing of several table descriptions into one prompt
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import logging
+import threading
+import time
+
+from backend import prompt_budget
+
+logger : logging.Logger = logging.getLogger()
+
+def format_packed_descriptions(descriptions : list[str]) -> str:
+    """
+        Table descriptions with ids used to match tables in LLM output
+    """
+    return "\n".join(f'<table_definition id="{i}">\n{d.strip()}\n</table_definition>' for i, d in enumerate(descriptions, 1))
+
+class PackSizer:
+    """
+        Adaptive size of packs: limited by tokens of descriptions, by expected output tokens
+        and by past failure rate (tables missing in parsed LLM output), so packs shrink when the model drops tables.
+        Failure rate decays with time, so packing recovers even when no packs are sent.
+        Shared by all threads.
+    """
+    _SMOOTHING = 0.2
+    _OUTPUT_TOKENS_SHARE = 0.8
+
+    def __init__(self, max_tables : int = 8, max_input_tokens : int = 2000, max_output_tokens : int = 2000, model_name : str = None, output_tokens_per_table : float = 250.0, failure_half_life_seconds : float = 300.0):
+        self.max_tables = max_tables
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.model_name = model_name
+        self.output_tokens_per_table = output_tokens_per_table
+        self.failure_half_life_seconds = failure_half_life_seconds
+        self.failure_rate = 0.0
+        self.failure_rate_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def get_failure_rate(self) -> float:
+        """
+            Failure rate decayed by time since the last update, caller holds the lock
+        """
+        elapsed = time.monotonic() - self.failure_rate_time
+        if self.failure_half_life_seconds <= 0:
+            return self.failure_rate
+        return self.failure_rate * 0.5 ** (elapsed / self.failure_half_life_seconds)
+
+    def get_table_limit(self) -> int:
+        """
+            Current maximum number of tables in one pack
+        """
+        with self.lock:
+            by_failures = round(self.max_tables * (1.0 - self.get_failure_rate()))
+            by_output = int(self.max_output_tokens * self._OUTPUT_TOKENS_SHARE / max(self.output_tokens_per_table, 1.0))
+        return max(1, min(self.max_tables, by_failures, by_output))
+
+    def build_packs(self, descriptions : list[str]) -> list[list[int]]:
+        """
+            Split descriptions into packs (lists of indexes) keeping order
+        """
+        table_limit = self.get_table_limit()
+        packs = []
+        pack, pack_tokens = [], 0
+        for i, description in enumerate(descriptions):
+            tokens = prompt_budget.count_tokens(description, self.model_name)
+            if pack and (len(pack) >= table_limit or pack_tokens + tokens > self.max_input_tokens):
+                packs.append(pack)
+                pack, pack_tokens = [], 0
+            pack.append(i)
+            pack_tokens += tokens
+        if pack:
+            packs.append(pack)
+        logger.debug(f"Packed {len(descriptions)} descriptions into {len(packs)} prompts, limit {table_limit} tables")
+        return packs
+
+    def record(self, pack_size : int, failed : int, completion_tokens : int):
+        """
+            Update failure rate and output tokens per table with result of one parsed pack,
+            failed is number of tables missing in LLM output (transport errors are not recorded)
+        """
+        with self.lock:
+            failure_rate = self.get_failure_rate()
+            self.failure_rate = failure_rate + self._SMOOTHING * (failed / pack_size - failure_rate)
+            self.failure_rate_time = time.monotonic()
+            succeeded = pack_size - failed
+            if succeeded > 0 and completion_tokens:
+                self.output_tokens_per_table += self._SMOOTHING * (completion_tokens / succeeded - self.output_tokens_per_table)
@@ -0,0 +1,42 @@
+"""
+    Registry of prompt templates compiled once per process
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import functools
+from dataclasses import dataclass
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from backend import prompts
+
+@dataclass(frozen=True)
+class PromptSpec:
+    """
+        Prompt with static system part and variable user part
+    """
+    system : str
+    user : str
+
+PROMPTS : dict[str, PromptSpec] = {
+    'generate_sql_schema'    : PromptSpec(prompts.GENERATE_SQL_SCHEMA_SYSTEM_PROMPT, prompts.GENERATE_SQL_SCHEMA_USER_PROMPT),
+    'generate_sql_schema_packed' : PromptSpec(prompts.GENERATE_SQL_SCHEMA_PACKED_SYSTEM_PROMPT, prompts.GENERATE_SQL_SCHEMA_PACKED_USER_PROMPT),
+    'generate_prisma_schema' : PromptSpec(prompts.GENERATE_PRISMA_SCHEMA_SYSTEM_PROMPT, prompts.GENERATE_PRISMA_SCHEMA_USER_PROMPT),
+    'generate_sql'           : PromptSpec(prompts.GENERATE_SQL_SYSTEM_PROMPT, prompts.GENERATE_SQL_USER_PROMPT),
+    'generate_sql_part'      : PromptSpec(prompts.GENERATE_SQL_PART_SYSTEM_PROMPT, prompts.GENERATE_SQL_PART_USER_PROMPT),
+    'generate_procedures'    : PromptSpec(prompts.GENERATE_PROCEDURES_SYSTEM_PROMPT, prompts.GENERATE_PROCEDURES_USER_PROMPT),
+    'fix_xml'                : PromptSpec(prompts.FIX_XML_SYSTEM_PROMPT, prompts.FIX_XML_USER_PROMPT),
+    'fix_sql'                : PromptSpec(prompts.FIX_SQL_SYSTEM_PROMPT, prompts.FIX_SQL_USER_PROMPT),
+    'translate_sql'          : PromptSpec(prompts.TRANSLATE_SQL_SYSTEM_PROMPT, prompts.TRANSLATE_SQL_USER_PROMPT),
+}
+
+@functools.lru_cache(maxsize=None)
+def get_prompt_template(name : str, system_message : bool = True) -> ChatPromptTemplate:
+    """
+        Compiled prompt template: system and user messages, or one user message with the same static prefix.
+        Templates are immutable and shared by all LLMCore instances and threads.
+    """
+    spec = PROMPTS[name]
+    if system_message:
+        return ChatPromptTemplate.from_messages([("system", spec.system.strip()), ("human", spec.user.strip())])
+    return ChatPromptTemplate.from_template(spec.system.strip() + "\n###\n" + spec.user.strip())
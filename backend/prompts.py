@@ -1,9 +1,15 @@
 """
     LLM Prompts
+
+    Each prompt is split into static instructions (system part) and variable data (user part),
+    so all calls of the same kind share a long stable prefix that can be cached by the provider.
 """
 
-GENERATE_SQL_SCHEMA_PROMPT = """
-You are {dbname} DB engineer with 10 years of experience.
+# change it when prompts are changed, it's part of LLM cache key
+PROMPT_VERSION = "2"
+
+GENERATE_SQL_SCHEMA_SYSTEM_PROMPT = """
+You are DB engineer with 10 years of experience.
 Your task is to generate table fields based on provided table description and list of already existed tables.
 Check each field and build foregn key where field is a reference to the existed table.
 Use the best db practices:
@@ -13,24 +19,63 @@ Use the best db practices:
 - tables have prefix "tb_"
 ###
 Output has to be in XML format as table name and set of fields.
-{rules}
+Fields are described by rules below.
 Do not add field if it has default value.
 ###
+<output>
+    <table name="">
+       <field name="" />
+    </table>
+</output>
+"""
+
+GENERATE_SQL_SCHEMA_USER_PROMPT = """
+Database: {dbname}
+###
+{rules}
+###
 Table definition:
 {table_description}
 ###
 Existed tables (used for references in foregn key):
 {existed_tables}
+"""
+
+GENERATE_SQL_SCHEMA_PACKED_SYSTEM_PROMPT = """
+You are DB engineer with 10 years of experience.
+Your task is to generate table fields for EACH of provided table descriptions based on list of already existed tables.
+Check each field and build foregn key where field is a reference to the existed table or to another provided table.
+Use the best db practices:
+- find the best name for each field
+- all names are in lower case
+- boolean fields should have "is" prefix
+- tables have prefix "tb_"
+###
+Output has to be in XML format as one table element per table description with the same id.
+Fields are described by rules below.
+Do not add field if it has default value.
 ###
 <output>
-    <table name="">
+    <table id="" name="">
        <field name="" />
     </table>
 </output>
 """
 
-GENERATE_PRISMA_SCHEMA_PROMPT = """
-You are {dbname} DB engineer with 10 years of experience.
+GENERATE_SQL_SCHEMA_PACKED_USER_PROMPT = """
+Database: {dbname}
+###
+{rules}
+###
+Table definitions:
+{table_descriptions}
+###
+Existed tables (used for references in foregn key):
+{existed_tables}
+"""
+
+GENERATE_PRISMA_SCHEMA_SYSTEM_PROMPT = """
+You are DB engineer with 10 years of experience.
 Your task is to generate Prisma table definision.
 Check each field and build foregn key where field is a reference to the existed table.
 Use the best db practices:
@@ -41,12 +86,6 @@ Use the best db practices:
 ###
 Output has to be in XML format as table name and prisma schema.
 ###
-Table definition:
-{table_description}
-###
-Existed tables (used for references in foregn key):
-{existed_tables}
-###
 <output>
  <table name="">
   <prisma>
@@ -56,6 +95,16 @@ Existed tables (used for references in foregn key):
 </output>
 """
 
+GENERATE_PRISMA_SCHEMA_USER_PROMPT = """
+Database: {dbname}
+###
+Table definition:
+{table_description}
+###
+Existed tables (used for references in foregn key):
+{existed_tables}
+"""
+
 GENERATE_SCHEMA_DEFAULT_RULES = """
 Field contains:
 - correct database field name based on SQL notation
@@ -66,9 +115,9 @@ Field contains:
 - foreign_key (if field is id for another table)
 """
 
-GENERATE_SQL_PROMPT = """
-You are {dbname} DB engineer with 10 years of experience. 
-Your task is to generate {dbname} scripts based on provided table desciption.
+GENERATE_SQL_SYSTEM_PROMPT = """
+You are DB engineer with 10 years of experience.
+Your task is to generate scripts for the database based on provided table desciption.
 Use the best db practices:
 - for get operation you should generate VIEW and do NOT use "select *"
 - all foregn key constrains must have name
@@ -76,20 +125,10 @@ Use the best db practices:
 When table has "is_deleted" field then delete procedure should set this flag and do not delete item from the table.
 But if table has no "is_deleted" field - do NOT add it.
 
+You MUST generate ALL requested scripts! It's very important task.
 ###
 Output has to be in XML format.
 ###
-Scripts to generate:
-{script}
-###
-Table schema:
-{table_schema}
-###
-Existed tables (used for references in foregn key):
-{existed_tables}
-###
-You MUST generate ALL requested scripts! It's very important task.
-###
 <output>
  <created_tables>
      <table>table</table>
@@ -103,11 +142,133 @@ You MUST generate ALL requested scripts! It's very important task.
 </output>
 """
 
+GENERATE_SQL_USER_PROMPT = """
+Database: {dbname}
+###
+Scripts to generate:
+{script}
+###
+Table schema:
+{table_schema}
+###
+Existed tables (used for references in foregn key):
+{existed_tables}
+"""
+
 GENERATE_SQL_DEFAULT_CRUD = """
 1. CREATE TABLE script
-2. Stored procedures to create (return new id) 
+2. Stored procedures to create (return new id)
 3. Stored procedures to update by id (return True if success)
 4. Stored procedures to delete by id (return True if success)
 5. Stored procedures to get by id
 6. View and stored procedures to get all items
 """
+
+GENERATE_SQL_PART_SYSTEM_PROMPT = """
+You are DB engineer with 10 years of experience.
+Your task is to generate script for the table created by the provided script.
+Use the best db practices:
+- for get operation you should generate VIEW and do NOT use "select *"
+
+When table has "is_deleted" field then delete procedure should set this flag and do not delete item from the table.
+But if table has no "is_deleted" field - do NOT add it.
+###
+Output has to be in XML format.
+###
+<output>
+ <sql_script_text>
+   put result here as SQL-text with comments, do not add additional xml tags
+ </sql_script_text>
+</output>
+"""
+
+GENERATE_SQL_PART_USER_PROMPT = """
+Database: {dbname}
+###
+Script to generate:
+{script}
+###
+Table creation script:
+{table_sql}
+"""
+
+GENERATE_PROCEDURES_SYSTEM_PROMPT = """
+You are DB engineer with 10 years of experience.
+Your task is to generate stored procedures for the table by provided procedure definition.
+Procedures can use other tables only from the list of known tables, do NOT invent tables or columns.
+Use the best db practices:
+- do NOT use "select *"
+- use parameters instead of dynamic SQL
+###
+Output has to be in XML format.
+###
+<output>
+ <referenced_tables>
+     <table>other table used by procedures</table>
+ </referenced_tables>
+ <sql_script_text>
+   put result here as SQL-text with comments, do not add additional xml tags
+ </sql_script_text>
+</output>
+"""
+
+GENERATE_PROCEDURES_USER_PROMPT = """
+Database: {dbname}
+###
+Known tables:
+{known_tables}
+###
+Procedures to generate:
+{procedures}
+###
+Table schema:
+{table_schema}
+"""
+
+GENERATE_PROCEDURES_DEFAULT_SPEC = """
+1. Stored procedure to search items by any combination of fields with paging
+2. Stored procedure to insert or update item (upsert), returns id
+3. Stored procedure to get item by id together with items of referenced tables
+"""
+
+FIX_XML_SYSTEM_PROMPT = """
+The XML provided by user is broken (not well-formed or truncated).
+Fix it and return only the fixed XML:
+- keep all tags, attributes and text as is
+- put text of <sql_script_text> and <prisma> into CDATA
+- close all unclosed tags
+"""
+
+FIX_XML_USER_PROMPT = """
+{xml}
+"""
+
+FIX_SQL_SYSTEM_PROMPT = """
+You are DB engineer with 10 years of experience.
+The SQL statement provided by user has errors.
+Fix only these errors and return only the fixed SQL statement, without explanations.
+"""
+
+FIX_SQL_USER_PROMPT = """
+Database: {dbname}
+###
+Errors:
+{errors}
+###
+{statement}
+"""
+
+TRANSLATE_SQL_SYSTEM_PROMPT = """
+You are DB engineer with 10 years of experience.
+The SQL statement provided by user is written for the source database.
+Translate it to the target database: keep all names, parameters and logic, use syntax and types of the target database.
+Return only the translated SQL statement, without explanations.
+"""
+
+TRANSLATE_SQL_USER_PROMPT = """
+Database: {dbname}
+###
+Source database: {source_dbname}
+###
+{statement}
+"""
@@ -0,0 +1,336 @@
+"""
+    Compact in-memory model of table schema with parsers from XML and Prisma and XML serializer
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import functools
+import logging
+import re
+import xml.etree.ElementTree as ET
+from xml.sax import saxutils
+
+from backend import xml_utils
+
+logger : logging.Logger = logging.getLogger()
+
+_FALSE_VALUES = ('', 'false', 'none', 'no', '0')
+
+_FIELD_ATTRIBUTES = ('name', 'type', 'primary_key', 'not_null', 'unique', 'default', 'foreign_key')
+
+_REFERENCE_RE = re.compile(r'^([^()]+?)\s*\(\s*([^()]*?)\s*\)$')
+
+_PRISMA_MODEL_RE = re.compile(r'\bmodel\s+(\w+)\s*\{(.*?)\n\s*\}', re.DOTALL)
+_PRISMA_FIELD_RE = re.compile(r'^(\w+)\s+(\w+)(\[\])?(\?)?\s*(.*)$')
+_PRISMA_ATTRIBUTE_RE = re.compile(r'@(@?)([\w.]+)(\((?:[^()]|\([^()]*\))*\))?')
+_PRISMA_LIST_RE = re.compile(r'(\w+)\s*:\s*\[([^\]]*)\]')
+
+_PRISMA_TYPES = {
+    'int'      : 'INT',
+    'bigint'   : 'BIGINT',
+    'string'   : 'TEXT',
+    'boolean'  : 'BOOLEAN',
+    'datetime' : 'TIMESTAMP',
+    'float'    : 'FLOAT',
+    'decimal'  : 'DECIMAL',
+    'json'     : 'JSON',
+    'bytes'    : 'BLOB'
+}
+
+def is_true(value : str) -> bool:
+    """
+        Boolean attribute of schema XML
+    """
+    return (value or '').strip().lower() not in _FALSE_VALUES
+
+class ForeignKeyRef:
+    """
+        Column referenced by foreign key
+    """
+    __slots__ = ('table', 'column')
+
+    def __init__(self, table : str, column : str = 'id'):
+        self.table = table
+        self.column = column
+
+    @classmethod
+    def parse(cls, foreign_key : str) -> 'ForeignKeyRef':
+        """
+            Parse foreign_key attribute: tb_user, tb_user(id), tb_user.id or schema qualified public.tb_user(id),
+            None if it's not a reference
+        """
+        if not foreign_key or foreign_key.strip().lower() in _FALSE_VALUES + ('true',):
+            return None
+        foreign_key = foreign_key.strip()
+        reference_match = _REFERENCE_RE.match(foreign_key)
+        if reference_match is not None:
+            return cls(reference_match.group(1).strip(), reference_match.group(2).strip() or 'id')
+        table, _, column = foreign_key.rpartition('.')
+        if not table:
+            return cls(foreign_key, 'id')
+        return cls(table, column.strip() or 'id')
+
+    def __str__(self) -> str:
+        return f"{self.table}({self.column})"
+
+    def __eq__(self, other : object) -> bool:
+        return isinstance(other, ForeignKeyRef) and (self.table.lower(), self.column.lower()) == (other.table.lower(), other.column.lower())
+
+    def __hash__(self) -> int:
+        return hash((self.table.lower(), self.column.lower()))
+
+class FieldSchema:
+    """
+        Field of table
+    """
+    __slots__ = ('name', 'type', 'primary_key', 'not_null', 'unique', 'default', 'foreign_key', 'extra')
+
+    def __init__(self, name : str, type : str = '', primary_key : bool = False, not_null : bool = False, unique : bool = False, default : str = None, foreign_key : ForeignKeyRef = None, extra : dict[str, str] = None): # pylint: disable=W0622
+        self.name = name
+        self.type = type
+        self.primary_key = primary_key
+        self.not_null = not_null
+        self.unique = unique
+        self.default = default
+        self.foreign_key = foreign_key
+        # other attributes asked by user rules (description, check, ...), kept as is
+        self.extra = extra
+
+    @classmethod
+    def from_attributes(cls, attributes : dict[str, str]) -> 'FieldSchema':
+        """
+            Field from attributes of <field> element
+        """
+        return cls(
+            name        = attributes.get('name', '').strip(),
+            type        = attributes.get('type', '').strip(),
+            primary_key = is_true(attributes.get('primary_key')),
+            not_null    = is_true(attributes.get('not_null')),
+            unique      = is_true(attributes.get('unique')),
+            default     = (attributes.get('default') or '').strip() or None,
+            foreign_key = ForeignKeyRef.parse(attributes.get('foreign_key')),
+            extra       = {k : v for k, v in attributes.items() if k not in _FIELD_ATTRIBUTES} or None
+        )
+
+    def to_attributes(self) -> dict[str, str]:
+        """
+            Attributes of <field> element, flags with default value are omitted
+        """
+        attributes = {'name' : self.name, 'type' : self.type}
+        if self.primary_key:
+            attributes['primary_key'] = 'true'
+        if self.not_null:
+            attributes['not_null'] = 'true'
+        if self.unique:
+            attributes['unique'] = 'true'
+        if self.default is not None:
+            attributes['default'] = self.default
+        if self.foreign_key is not None:
+            attributes['foreign_key'] = str(self.foreign_key)
+        if self.extra:
+            attributes.update(self.extra)
+        return attributes
+
+    def __repr__(self) -> str:
+        return f"FieldSchema({self.to_attributes()})"
+
+class TableSchema:
+    """
+        Table with fields and composite unique constraints.
+        Other attributes of <table> and other child elements are kept as is for XML serialization.
+        Instances returned by parse_table_schema are shared, do not change them.
+    """
+    __slots__ = ('name', 'fields', 'unique_constraints', 'extra', 'extra_elements')
+
+    def __init__(self, name : str, fields : list[FieldSchema] = None, unique_constraints : list[tuple[str, ...]] = None, extra : dict[str, str] = None, extra_elements : list[str] = None):
+        self.name = name
+        self.fields = fields or []
+        self.unique_constraints = unique_constraints or []
+        self.extra = extra
+        self.extra_elements = extra_elements
+
+    def get_field(self, name : str) -> FieldSchema:
+        """
+            Field by name (case insensitive), None if not found
+        """
+        name = name.lower()
+        return next((f for f in self.fields if f.name.lower() == name), None)
+
+    @property
+    def primary_key(self) -> list[str]:
+        """
+            Names of primary key fields
+        """
+        return [f.name for f in self.fields if f.primary_key]
+
+    @property
+    def foreign_keys(self) -> list[FieldSchema]:
+        """
+            Fields with foreign key
+        """
+        return [f for f in self.fields if f.foreign_key is not None]
+
+    @property
+    def dependencies(self) -> set[str]:
+        """
+            Tables referenced by foreign keys, except the table itself
+        """
+        return {f.foreign_key.table for f in self.fields if f.foreign_key is not None and f.foreign_key.table != self.name}
+
+    @classmethod
+    def from_xml_element(cls, element : ET.Element) -> 'TableSchema':
+        """
+            Table from <table> element or element that contains it, None if there is no table
+        """
+        if element.tag != 'table':
+            element = element.find('.//table')
+        if element is None:
+            return None
+        fields = [FieldSchema.from_attributes(e.attrib) for e in element.iter('field')]
+        unique_constraints = [tuple(c.strip() for c in e.attrib.get('fields', '').split(',') if c.strip()) for e in element.iter('unique')]
+        extra = {k : v for k, v in element.attrib.items() if k != 'name'} or None
+        extra_elements = [ET.tostring(e, encoding='unicode').strip() for e in element if e.tag not in ('field', 'unique')] or None
+        return cls(element.attrib.get('name'), [f for f in fields if f.name], [u for u in unique_constraints if u], extra, extra_elements)
+
+    @classmethod
+    def from_xml(cls, table_schema : str) -> 'TableSchema':
+        """
+            Table from schema XML
+        """
+        return cls.from_xml_element(xml_utils.get_as_xml(table_schema))
+
+    @classmethod
+    def from_prisma(cls, prisma_schema : str) -> 'TableSchema':
+        """
+            Table from the first model of Prisma schema, None if there is no model.
+            Relation fields are folded into foreign keys of their scalar fields.
+        """
+        model_match = _PRISMA_MODEL_RE.search(prisma_schema)
+        if model_match is None:
+            return None
+        table = cls(model_match.group(1))
+        relations = []
+        for line in model_match.group(2).splitlines():
+            line = line.split('//', 1)[0].strip()
+            if line.startswith('@@'):
+                table.add_prisma_block_attribute(line)
+                continue
+            field_match = _PRISMA_FIELD_RE.match(line)
+            if field_match is None:
+                continue
+            name, prisma_type, is_list, is_optional, modifiers = field_match.groups()
+            attributes = {a.group(2) : (a.group(3) or '')[1:-1] for a in _PRISMA_ATTRIBUTE_RE.finditer(modifiers) if not a.group(1)}
+            if 'relation' in attributes:
+                relations.append((prisma_type, attributes['relation']))
+                continue
+            if is_list or prisma_type.lower() not in _PRISMA_TYPES:
+                # back relation or enum/model type
+                continue
+            table.fields.append(get_prisma_field(name, prisma_type, attributes, not is_optional))
+
+        for referenced_table, relation in relations:
+            lists = dict(_PRISMA_LIST_RE.findall(relation))
+            columns = [c.strip() for c in lists.get('fields', '').split(',') if c.strip()]
+            references = [c.strip() for c in lists.get('references', '').split(',') if c.strip()]
+            for column, reference in zip(columns, references):
+                field = table.get_field(column)
+                if field is not None:
+                    field.foreign_key = ForeignKeyRef(referenced_table, reference)
+        return table
+
+    def add_prisma_block_attribute(self, line : str):
+        """
+            Composite primary key or unique constraint of Prisma model
+        """
+        attribute_match = _PRISMA_ATTRIBUTE_RE.match(line)
+        if attribute_match is None or not attribute_match.group(3):
+            return
+        columns = tuple(c.strip() for c in re.sub(r'\(.*?\)', '', attribute_match.group(3)[1:-1].split(']')[0].lstrip('[')).split(',') if c.strip())
+        if attribute_match.group(2) == 'id':
+            for column in columns:
+                field = self.get_field(column)
+                if field is not None:
+                    field.primary_key = True
+        elif attribute_match.group(2) == 'unique' and columns:
+            self.unique_constraints.append(columns)
+
+    def to_xml(self) -> str:
+        """
+            Compact schema XML, one field per line
+        """
+        table_attributes = "".join(f' {k}={saxutils.quoteattr(v)}' for k, v in (self.extra or {}).items())
+        lines = [f'<table name={saxutils.quoteattr(self.name or "")}{table_attributes}>']
+        for field in self.fields:
+            attributes = " ".join(f'{k}={saxutils.quoteattr(v)}' for k, v in field.to_attributes().items())
+            lines.append(f'    <field {attributes} />')
+        for columns in self.unique_constraints:
+            lines.append(f'    <unique fields={saxutils.quoteattr(",".join(columns))} />')
+        lines.extend(f'    {e}' for e in self.extra_elements or [])
+        lines.append('</table>')
+        return "\n".join(lines)
+
+    def to_summary(self) -> str:
+        """
+            One line description of table for prompt context: tb_order(id, user_id -> tb_user(id))
+        """
+        columns = [f"{f.name} -> {f.foreign_key}" if f.foreign_key is not None else f.name for f in self.fields]
+        return f"{self.name}({', '.join(columns)})"
+
+    def __repr__(self) -> str:
+        return f"TableSchema({self.name!r}, {len(self.fields)} fields)"
+
+def get_prisma_field(name : str, prisma_type : str, attributes : dict[str, str], not_null : bool) -> FieldSchema:
+    """
+        Field from Prisma scalar field
+    """
+    sql_type = _PRISMA_TYPES[prisma_type.lower()]
+    native_types = [(k[3:], v) for k, v in attributes.items() if k.startswith('db.')]
+    if native_types:
+        native_type, arguments = native_types[0]
+        sql_type = f"{native_type.upper()}({arguments})" if arguments else native_type.upper()
+    default = attributes.get('default')
+    if default == 'autoincrement()':
+        sql_type = 'BIGSERIAL' if sql_type == 'BIGINT' else 'SERIAL'
+        default = None
+    return FieldSchema(
+        name        = name,
+        type        = sql_type,
+        primary_key = 'id' in attributes,
+        not_null    = not_null and 'id' not in attributes,
+        unique      = 'unique' in attributes,
+        default     = default or None
+    )
+
+@functools.lru_cache(maxsize=1024)
+def parse_table_schema(table_schema : str) -> TableSchema:
+    """
+        Parse schema XML or Prisma model, None if it's neither of them.
+        Results are cached, so the same schema text is parsed once.
+    """
+    if not table_schema or not table_schema.strip():
+        return None
+    text = xml_utils.strip_code_fence(table_schema)
+    if text.startswith('<'):
+        try:
+            return TableSchema.from_xml(text)
+        except ET.ParseError as error:
+            logger.debug(f"Table schema is not valid XML: {error}")
+            return None
+    return TableSchema.from_prisma(text)
+
+def parse_table_schemas(text : str) -> list[TableSchema]:
+    """
+        All tables from text with several <table> elements or Prisma models
+    """
+    text = xml_utils.strip_code_fence(text or '')
+    if text.startswith('<'):
+        return [TableSchema.from_xml_element(e) for e in xml_utils.get_as_xml(f"<tables>{text}</tables>").iter('table')]
+    return [TableSchema.from_prisma(m.group(0)) for m in _PRISMA_MODEL_RE.finditer(text)]
+
+def normalize_table_schema(table_schema : str) -> str:
+    """
+        Compact schema XML for the prompt, text that is not a schema is returned as is
+    """
+    table = parse_table_schema(table_schema)
+    if table is None or not table.name or not table.fields:
+        return table_schema
+    return table.to_xml()
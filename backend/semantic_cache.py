@@ -0,0 +1,123 @@
+"""
+    Semantic cache for near-duplicate table descriptions
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import importlib.util
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+
+logger : logging.Logger = logging.getLogger()
+
+class SemanticCache:
+    """
+        In-memory semantic cache. Entries are grouped by key (prompt, db name, rules...),
+        inside of the group value is found by cosine similarity of embedded description.
+    """
+    _DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+    _DEFAULT_THRESHOLD  = 0.95
+    _DEFAULT_MAX_SIZE   = 1000
+
+    def __init__(self, threshold : float = _DEFAULT_THRESHOLD, max_size : int = _DEFAULT_MAX_SIZE, model_name : str = _DEFAULT_MODEL_NAME, embedding_model : Any = None):
+        self.threshold = threshold
+        self.max_size  = max_size
+        if embedding_model is None:
+            # heavy import (torch), done only when the cache is enabled
+            from sentence_transformers import SentenceTransformer # pylint: disable=C0415
+            embedding_model = SentenceTransformer(model_name)
+        self.embedding_model = embedding_model
+        self.lock = threading.Lock()
+        self.entries : OrderedDict[int, tuple[tuple, Any, Any]] = OrderedDict() # id -> (key, embedding, value), in LRU order
+        self.groups : dict[tuple, list[int]] = {}
+        self.matrices : dict[tuple, Any] = {}
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_secrets(cls, all_secrets : dict[str, Any]) -> 'SemanticCache':
+        """
+            Create cache from [semantic_cache] section of secrets, returns None if disabled
+        """
+        if not all_secrets:
+            return None
+        cache_secrets = all_secrets.get('semantic_cache')
+        if not cache_secrets or not cache_secrets.get('ENABLED'):
+            return None
+        if importlib.util.find_spec('sentence_transformers') is None:
+            logger.error('semantic_cache requires sentence-transformers package')
+            return None
+        logger.info('Semantic cache enabled')
+        return cls(
+            threshold  = float(cache_secrets.get('THRESHOLD', cls._DEFAULT_THRESHOLD)),
+            max_size   = int(cache_secrets.get('MAX_SIZE', cls._DEFAULT_MAX_SIZE)),
+            model_name = cache_secrets.get('MODEL_NAME', cls._DEFAULT_MODEL_NAME)
+        )
+
+    def embed(self, text : str) -> Any:
+        """
+            Normalized embedding of the text
+        """
+        return self.embedding_model.encode(" ".join(text.split()), normalize_embeddings=True)
+
+    def lookup(self, key : tuple, text : str) -> Any:
+        """
+            Find cached value for the most similar text, returns None if nothing is similar enough
+        """
+        embedding = self.embed(text)
+        with self.lock:
+            ids = self.groups.get(key)
+            if not ids:
+                self.misses += 1
+                return None
+            matrix = self.matrices.get(key)
+            if matrix is None:
+                matrix = np.stack([self.entries[i][1] for i in ids])
+                self.matrices[key] = matrix
+            similarities = matrix @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            entry_id = ids[best]
+            self.entries.move_to_end(entry_id)
+            self.hits += 1
+            logger.debug(f"Semantic cache hit, similarity {similarities[best]:.3f}")
+            return self.entries[entry_id][2]
+
+    def update(self, key : tuple, text : str, value : Any):
+        """
+            Add value to the cache, the least recently used entry is evicted when cache is full
+        """
+        embedding = self.embed(text)
+        with self.lock:
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = (key, embedding, value)
+            self.groups.setdefault(key, []).append(entry_id)
+            self.matrices.pop(key, None)
+            while len(self.entries) > self.max_size:
+                old_id, (old_key, _, _) = self.entries.popitem(last=False)
+                self.groups[old_key].remove(old_id)
+                if not self.groups[old_key]:
+                    del self.groups[old_key]
+                self.matrices.pop(old_key, None)
+
+    def clear(self):
+        """
+            Remove all entries
+        """
+        with self.lock:
+            self.entries.clear()
+            self.groups.clear()
+            self.matrices.clear()
+
+    def get_stats(self) -> dict[str, int]:
+        """
+            Hit/miss counters and size
+        """
+        return {"hits" : self.hits, "misses" : self.misses, "size" : len(self.entries)}
@@ -0,0 +1,119 @@
+"""
+    Multi-table SQL pipeline based on foreign key dependencies
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import logging
+from dataclasses import dataclass, field
+
+from backend.llm_core import LLMCore, TableSqlResult
+from backend.schema_model import parse_table_schema
+
+logger : logging.Logger = logging.getLogger()
+
+@dataclass
+class SqlPipelineResult:
+    """
+        Result of multi-table SQL generation
+    """
+    sql_script : str = ''
+    levels : list[list[str]] = field(default_factory=list)
+    tables : dict[str, TableSqlResult] = field(default_factory=dict)
+    errors : list[str] = field(default_factory=list)
+    tokens_used : int = 0
+
+def get_table_dependencies(table_schema : str) -> tuple[str, set[str]]:
+    """
+        Get table name and names of tables referenced by foreign keys from table schema XML or Prisma model
+    """
+    table = parse_table_schema(table_schema)
+    if table is None:
+        return None, set()
+    return table.name, table.dependencies
+
+def get_unqualified_name(table_name : str) -> str:
+    """
+        Lower case table name without schema and quotes: public."TB_Org" -> tb_org
+    """
+    return table_name.rsplit('.', 1)[-1].strip('"[]` ').lower()
+
+def build_dependency_levels(dependencies : dict[str, set[str]]) -> list[list[str]]:
+    """
+        Split tables into levels in topological order, tables of the same level are independent.
+        References are matched by table name without schema, case insensitive.
+        Tables that are part of a cycle are put into the last level.
+    """
+    tables_by_name = {get_unqualified_name(t) : t for t in dependencies}
+    remaining = {}
+    for table, deps in dependencies.items():
+        referenced = (tables_by_name.get(get_unqualified_name(d)) for d in deps)
+        remaining[table] = {r for r in referenced if r is not None and r != table}
+    levels = []
+    while remaining:
+        level = sorted(t for t, deps in remaining.items() if not deps)
+        if not level:
+            logger.warning(f"Cyclic foreign keys between tables: {sorted(remaining)}")
+            levels.append(sorted(remaining))
+            break
+        levels.append(level)
+        for t in level:
+            del remaining[t]
+        for deps in remaining.values():
+            deps.difference_update(level)
+    return levels
+
+class SqlPipeline:
+    """
+        Generate SQL for set of tables level-by-level along foreign key graph
+    """
+
+    def __init__(self, llm_backend : LLMCore):
+        self.llm_backend = llm_backend
+
+    def run(self, db_name : str, table_schemas : list[str], script_definition : str = None, existed_tables : list[str] = None, max_concurrency : int = None) -> SqlPipelineResult:
+        """
+            Generate one ordered migration script for all tables
+        """
+        result = SqlPipelineResult()
+        existed_tables = list(existed_tables or [])
+
+        schema_by_table = {}
+        dependencies = {}
+        for table_schema in table_schemas:
+            try:
+                table_name, table_dependencies = get_table_dependencies(table_schema)
+            except Exception as error: # pylint: disable=W0718
+                result.errors.append(f"Could not parse table schema: {error}")
+                continue
+            if not table_name:
+                result.errors.append("Could not find table name in table schema")
+                continue
+            schema_by_table[table_name] = table_schema
+            dependencies[table_name] = table_dependencies
+
+        result.levels = build_dependency_levels(dependencies)
+        logger.info(f"SQL pipeline: {len(schema_by_table)} tables in {len(result.levels)} levels")
+
+        scripts = []
+        for level in result.levels:
+            level_results = self.llm_backend.generate_sql_batch(
+                db_name,
+                [schema_by_table[t] for t in level],
+                script_definition,
+                existed_tables,
+                max_concurrency
+            )
+            new_tables = []
+            for table_name, table_result in zip(level, level_results):
+                result.tables[table_name] = table_result
+                result.tokens_used += table_result.tokens_used
+                if table_result.error:
+                    result.errors.append(f"{table_name}: {table_result.error}")
+                    continue
+                result.errors.extend(f"{table_name}: {e}" for e in table_result.local_errors)
+                new_tables.extend(table_result.new_tables or [table_name])
+                scripts.append(f"-- {table_name}\n{table_result.sql_script}")
+            existed_tables.extend(t for t in new_tables if t not in existed_tables)
+
+        result.sql_script = "\n\n".join(scripts)
+        return result
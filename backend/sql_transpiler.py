@@ -0,0 +1,148 @@
+"""
+    Translation of generated SQL to other dialects: sqlglot for DDL and queries, LLM only for procedural statements
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import logging
+import re
+from dataclasses import dataclass, field
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import ErrorLevel, SqlglotError
+except ImportError:
+    sqlglot = None
+
+from backend import prompt_budget
+from backend.llm_core import LLMCore
+from backend.sql_validator import SqlError, SqlStatement, format_sql_error, get_sqlglot_dialect, is_procedural_statement, replace_statements, split_sql_statements, strip_statement_delimiter
+
+logger : logging.Logger = logging.getLogger()
+
+_LEADING_COMMENTS_RE = re.compile(r'^(\s*(--[^\n]*(\n|$)|/\*.*?\*/))*\s*', re.DOTALL)
+
+@dataclass
+class DialectSqlResult:
+    """
+        Script translated to one target database
+    """
+    db_name : str
+    sql_script : str = ''
+    transpiled : int = 0
+    translated_by_llm : int = 0
+    sql_errors : list[SqlError] = field(default_factory=list)
+    local_errors : list[str] = field(default_factory=list)
+    tokens_used : int = 0
+
+def normalize_expression(expression : "exp.Expression") -> "exp.Expression":
+    """
+        Rewrite constructs that sqlglot keeps as is but target databases don't support:
+        SERIAL types become integer types with auto increment, NULL ordering of index columns is dropped
+    """
+    if sqlglot is None:
+        return expression
+    serial_types = {
+        exp.DataType.Type.SMALLSERIAL : exp.DataType.Type.SMALLINT,
+        exp.DataType.Type.SERIAL      : exp.DataType.Type.INT,
+        exp.DataType.Type.BIGSERIAL   : exp.DataType.Type.BIGINT
+    }
+    for column in list(expression.find_all(exp.ColumnDef)):
+        kind = column.args.get('kind')
+        if kind is not None and kind.this in serial_types:
+            column.set('kind', exp.DataType.build(serial_types[kind.this]))
+            column.append('constraints', exp.ColumnConstraint(kind=exp.AutoIncrementColumnConstraint()))
+    if isinstance(expression, exp.Create) and (expression.args.get('kind') or '').upper() == 'INDEX':
+        for ordered in list(expression.find_all(exp.Ordered)):
+            if ordered.args.get('desc'):
+                ordered.set('nulls_first', None)
+            else:
+                ordered.replace(ordered.this)
+    return expression
+
+def transpile_statement(text : str, read : str, write : str) -> str:
+    """
+        Translate statement by sqlglot, leading comments are kept as is.
+        Raises ValueError if statement can't be translated mechanically.
+    """
+    comments = _LEADING_COMMENTS_RE.match(text).group(0)
+    body = text[len(comments):]
+    if sqlglot is None or read is None or write is None:
+        raise ValueError("sqlglot dialect is not available")
+    if is_procedural_statement(body):
+        raise ValueError("procedural statement")
+    try:
+        expressions = [e for e in sqlglot.parse(body, read=read, error_level=ErrorLevel.RAISE) if e is not None]
+        if not expressions or any(isinstance(e, exp.Command) for e in expressions):
+            raise ValueError("statement is not supported by sqlglot")
+        translated = ";\n".join(normalize_expression(e).sql(dialect=write, pretty=True, unsupported_level=ErrorLevel.RAISE) for e in expressions)
+    except SqlglotError as error:
+        raise ValueError(str(error)) from error
+    return comments + translated
+
+def transpile_sql_script(sql_script : str, db_name : str, target_db_name : str) -> tuple[list[SqlStatement], dict[int, str], list[int]]:
+    """
+        Translate statements locally, returns statements, translated texts by index
+        and indexes of statements that have to be translated by LLM
+    """
+    read, write = get_sqlglot_dialect(db_name), get_sqlglot_dialect(target_db_name)
+    statements = split_sql_statements(sql_script)
+    replacements = {}
+    untranslated = []
+    for index, statement in enumerate(statements):
+        try:
+            replacements[index] = transpile_statement(statement.text, read, write)
+        except ValueError as error:
+            logger.debug(f"Statement {index} is translated by LLM: {error}")
+            untranslated.append(index)
+    return statements, replacements, untranslated
+
+class SqlTranspiler:
+    """
+        Translate script generated for one database to other databases.
+        Statements that sqlglot can't translate of all targets go to LLM in one batch.
+    """
+
+    def __init__(self, llm_backend : LLMCore):
+        self.llm_backend = llm_backend
+
+    def run(self, db_name : str, sql_script : str, target_db_names : list[str]) -> list[DialectSqlResult]:
+        """
+            Translated and validated script for each target database
+        """
+        results = [DialectSqlResult(target_db_name) for target_db_name in target_db_names]
+        if not sql_script or not results:
+            return results
+
+        with self.llm_backend.track_call('transpile_sql') as call_metrics:
+            scripts = []
+            llm_items = []
+            inputs = []
+            with call_metrics.measure('parse_seconds'):
+                for result in results:
+                    statements, replacements, untranslated = transpile_sql_script(sql_script, db_name, result.db_name)
+                    result.transpiled = len(replacements)
+                    scripts.append((statements, replacements))
+                    for index in untranslated:
+                        llm_items.append((result, replacements, index, statements[index].line))
+                        inputs.append({"dbname" : result.db_name, "source_dbname" : db_name, "statement" : statements[index].text})
+
+            if inputs:
+                logger.info(f"Translate {len(inputs)} statements by LLM to {', '.join(target_db_names)}")
+                outputs, tokens_used = self.llm_backend.batch_chain(self.llm_backend.get_translate_sql_chain([i["statement"] for i in inputs]), inputs, call_metrics)
+                for (result, replacements, index, line), output, item_tokens in zip(llm_items, outputs, prompt_budget.split_tokens(tokens_used, len(inputs))):
+                    result.tokens_used += item_tokens
+                    if isinstance(output, Exception):
+                        logger.error(f"LLM call failed: {output}")
+                        result.local_errors.append(f"Could not translate statement at line {line}: {output}")
+                        continue
+                    replacements[index] = strip_statement_delimiter(output)
+                    result.translated_by_llm += 1
+
+            for result, (statements, replacements) in zip(results, scripts):
+                result.sql_script = replace_statements(sql_script, statements, replacements)
+                result.sql_script, result.sql_errors, validate_tokens = self.llm_backend.validate_sql(result.db_name, result.sql_script, call_metrics)
+                result.local_errors.extend(format_sql_error(e) for e in result.sql_errors)
+                result.tokens_used += validate_tokens
+
+        return results
@@ -0,0 +1,346 @@
+"""
+    Local validation of generated SQL: dialect-aware parsing and DDL execution in in-memory sandbox
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import logging
+import re
+import sqlite3
+from dataclasses import dataclass
+from typing import Any
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import ErrorLevel, ParseError, SqlglotError
+except ImportError:
+    sqlglot = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logger : logging.Logger = logging.getLogger()
+
+_SANDBOX_LIMITATION_ERRORS = ('syntax error', 'Parser Error', 'Not implemented', 'Type with name', 'unknown database')
+
+_SERIAL_TYPES = {
+    exp.DataType.Type.SERIAL : exp.DataType.Type.INT,
+    exp.DataType.Type.BIGSERIAL : exp.DataType.Type.BIGINT,
+    exp.DataType.Type.SMALLSERIAL : exp.DataType.Type.SMALLINT,
+} if sqlglot is not None else {}
+
+# substrings of lower case db name without spaces -> sqlglot dialect
+_DIALECTS = [
+    ('postgres', 'postgres'),
+    ('pgsql', 'postgres'),
+    ('sqlserver', 'tsql'),
+    ('mssql', 'tsql'),
+    ('tsql', 'tsql'),
+    ('azuresql', 'tsql'),
+    ('mysql', 'mysql'),
+    ('mariadb', 'mysql'),
+    ('sqlite', 'sqlite'),
+    ('duckdb', 'duckdb'),
+    ('oracle', 'oracle'),
+    ('snowflake', 'snowflake'),
+    ('bigquery', 'bigquery'),
+    ('redshift', 'redshift'),
+    ('clickhouse', 'clickhouse'),
+]
+
+# statements with procedural bodies, only sandbox of the real database can check them
+_PROCEDURAL_RE = re.compile(r'^\s*(CREATE|ALTER)\s+(OR\s+(REPLACE|ALTER)\s+)?(DEFINER\s*=\s*\S+\s+)?(PROCEDURE|PROC|FUNCTION|TRIGGER|PACKAGE)\b', re.IGNORECASE)
+_DELIMITER_RE  = re.compile(r'^[ \t]*DELIMITER[ \t]+(\S+)[ \t]*$', re.IGNORECASE | re.MULTILINE)
+_GO_RE         = re.compile(r'^[ \t]*GO[ \t]*$', re.IGNORECASE | re.MULTILINE)
+_WORD_RE       = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_DOLLAR_RE     = re.compile(r'\$([A-Za-z_][A-Za-z0-9_]*)?\$')
+
+@dataclass
+class SqlStatement:
+    """
+        Statement of sql script with position in the script
+    """
+    text : str
+    start : int
+    end : int
+    line : int
+
+@dataclass
+class SqlError:
+    """
+        Error found in one statement of sql script
+    """
+    statement_index : int
+    line : int
+    stage : str # parse or execute
+    message : str
+    statement : str
+
+def get_sqlglot_dialect(db_name : str) -> str:
+    """
+        sqlglot dialect for database name entered by user, None if unknown
+    """
+    name = re.sub(r'[\s\-_]', '', (db_name or '').lower())
+    for substring, dialect in _DIALECTS:
+        if substring in name:
+            return dialect
+    return None
+
+def is_procedural_statement(text : str) -> bool:
+    """
+        Statement with procedural body: procedure, function, trigger or package
+    """
+    return _PROCEDURAL_RE.match(text) is not None
+
+def format_sql_error(sql_error : SqlError) -> str:
+    """
+        Error text for user
+    """
+    return f"SQL {sql_error.stage} error at line {sql_error.line}: {sql_error.message}"
+
+def split_sql_statements(sql_script : str) -> list[SqlStatement]:
+    """
+        Split script into statements by ";" (or custom DELIMITER) and GO lines.
+        Strings, comments, dollar quoted bodies and BEGIN ... END blocks are kept whole.
+    """
+    statements = []
+    delimiter = ';'
+    depth = 0
+    start = 0
+    i = 0
+    length = len(sql_script)
+
+    def add_statement(end : int):
+        text = sql_script[start:end]
+        stripped = text.strip()
+        if stripped and stripped != delimiter:
+            offset = start + len(text) - len(text.lstrip())
+            statements.append(SqlStatement(stripped, offset, offset + len(stripped), sql_script.count('\n', 0, offset) + 1))
+
+    while i < length:
+        c = sql_script[i]
+        line_start = i == 0 or sql_script[i - 1] == '\n'
+
+        if line_start:
+            match = _DELIMITER_RE.match(sql_script, i)
+            if match:
+                add_statement(i)
+                delimiter = match.group(1)
+                i = start = match.end()
+                continue
+            match = _GO_RE.match(sql_script, i)
+            if match:
+                add_statement(i)
+                depth = 0
+                i = start = match.end()
+                continue
+
+        if sql_script.startswith('--', i):
+            end = sql_script.find('\n', i)
+            i = length if end < 0 else end
+        elif sql_script.startswith('/*', i):
+            end = sql_script.find('*/', i + 2)
+            i = length if end < 0 else end + 2
+        elif c in ("'", '"', '`'):
+            end = i + 1
+            while end < length:
+                if sql_script[end] == c:
+                    if sql_script[end + 1:end + 2] == c: # escaped quote
+                        end += 2
+                        continue
+                    break
+                end += 1
+            i = end + 1
+        elif c == '$' and (match := _DOLLAR_RE.match(sql_script, i)):
+            end = sql_script.find(match.group(0), match.end())
+            i = length if end < 0 else end + len(match.group(0))
+        elif c.isalpha() or c == '_':
+            match = _WORD_RE.match(sql_script, i)
+            word = match.group(0).upper()
+            if word in ('BEGIN', 'CASE'):
+                # BEGIN TRANSACTION/TRAN/WORK and BEGIN; start transaction, not a block
+                following = sql_script[match.end():match.end() + 20].lstrip().upper()
+                if word == 'CASE' or not (following.startswith(('TRAN', 'WORK', ';')) or following.startswith(delimiter)):
+                    depth += 1
+            elif word == 'END' and depth > 0:
+                following = sql_script[match.end():match.end() + 10].lstrip().upper()
+                if not following.startswith(('IF', 'LOOP', 'WHILE', 'REPEAT', 'FOR')):
+                    depth -= 1
+            i = match.end()
+        elif depth == 0 and sql_script.startswith(delimiter, i):
+            add_statement(i)
+            i = start = i + len(delimiter)
+        else:
+            i += 1
+
+    add_statement(length)
+    return statements
+
+def replace_statements(sql_script : str, statements : list[SqlStatement], replacements : dict[int, str]) -> str:
+    """
+        Replace text of statements by index, returns new script
+    """
+    for index in sorted(replacements, reverse=True):
+        statement = statements[index]
+        sql_script = sql_script[:statement.start] + replacements[index] + sql_script[statement.end:]
+    return sql_script
+
+def strip_statement_delimiter(text : str) -> str:
+    """
+        Remove markdown code fence and trailing ";" from statement returned by LLM
+    """
+    text = re.sub(r'```[a-zA-Z]*', '', text).strip()
+    return text[:-1].rstrip() if text.endswith(';') else text
+
+class SqlValidator:
+    """
+        Validate sql script: parse each statement with sqlglot in dialect of the database,
+        then execute DDL (tables, indexes, views, alter table) transpiled to in-memory SQLite or DuckDB.
+        Statements that refer to tables not created by the script are not executed,
+        procedural statements (procedures, functions, triggers) are not checked.
+    """
+    _SANDBOXES = ('sqlite', 'duckdb', 'none')
+
+    def __init__(self, sandbox : str = 'sqlite', repair : bool = True):
+        if sandbox not in self._SANDBOXES:
+            raise ValueError(f"Unsupported SQL sandbox: {sandbox}")
+        if sandbox == 'duckdb' and duckdb is None:
+            logger.error('duckdb sandbox requires duckdb package, sqlite is used')
+            sandbox = 'sqlite'
+        self.sandbox = sandbox
+        self.repair = repair
+
+    @classmethod
+    def from_secrets(cls, all_secrets : dict[str, Any]) -> 'SqlValidator':
+        """
+            Create validator from [sql_validation] section of secrets (ENABLED, SANDBOX, REPAIR), returns None if disabled
+        """
+        if not all_secrets:
+            return None
+        validation_secrets = all_secrets.get('sql_validation')
+        if not validation_secrets or not validation_secrets.get('ENABLED'):
+            return None
+        if sqlglot is None:
+            logger.error('sql_validation requires sqlglot package')
+            return None
+        logger.info('SQL validation enabled')
+        return cls(
+            sandbox = validation_secrets.get('SANDBOX', 'sqlite'),
+            repair  = bool(validation_secrets.get('REPAIR', True))
+        )
+
+    def validate(self, sql_script : str, db_name : str) -> tuple[list[SqlStatement], list[SqlError]]:
+        """
+            Returns statements of the script and errors found
+        """
+        statements = split_sql_statements(sql_script)
+        dialect = get_sqlglot_dialect(db_name)
+        if dialect is None:
+            logger.debug(f"Unknown SQL dialect for {db_name}, validation skipped")
+            return statements, []
+
+        errors = []
+        expressions = []
+        for index, statement in enumerate(statements):
+            expression = None
+            if not _PROCEDURAL_RE.match(statement.text):
+                try:
+                    expression = sqlglot.parse_one(statement.text, read=dialect, error_level=ErrorLevel.RAISE)
+                except ParseError as error:
+                    details = error.errors[0] if error.errors else {}
+                    line = statement.line + (details.get('line') or 1) - 1
+                    errors.append(SqlError(index, line, 'parse', details.get('description') or str(error), statement.text))
+                except SqlglotError as error:
+                    logger.debug(f"sqlglot could not parse statement: {error}")
+            expressions.append(expression)
+
+        if self.sandbox != 'none':
+            errors.extend(self.execute_in_sandbox(statements, expressions, dialect))
+        return statements, sorted(errors, key=lambda e: e.statement_index)
+
+    def execute_in_sandbox(self, statements : list[SqlStatement], expressions : list[Any], dialect : str) -> list[SqlError]:
+        """
+            Execute DDL statements in in-memory database, returns execution errors
+        """
+        errors = []
+        created_tables = set()
+        connection = duckdb.connect(':memory:') if self.sandbox == 'duckdb' else sqlite3.connect(':memory:')
+        try:
+            for index, (statement, expression) in enumerate(zip(statements, expressions)):
+                target = get_ddl_target(expression)
+                if target is None:
+                    continue
+                kind, table_name = target
+                expression = get_sandbox_expression(expression, created_tables | {table_name}, self.sandbox)
+                if expression is None:
+                    continue
+                referenced_tables = {t.name.lower() for t in expression.find_all(exp.Table) if t.name}
+                if kind in ('TABLE', 'VIEW'):
+                    referenced_tables.discard(table_name)
+                if not referenced_tables.issubset(created_tables):
+                    continue
+                try:
+                    sandbox_sql = expression.sql(dialect=self.sandbox)
+                except SqlglotError as error:
+                    logger.debug(f"Could not transpile statement from {dialect} to {self.sandbox}: {error}")
+                    continue
+                try:
+                    connection.execute(sandbox_sql)
+                except Exception as error: # pylint: disable=W0718
+                    message = str(error).splitlines()[0]
+                    if any(e in message for e in _SANDBOX_LIMITATION_ERRORS):
+                        # syntax is checked by parser, here it's a limitation of transpiling or of the sandbox
+                        logger.debug(f"Sandbox could not execute statement: {message}")
+                    else:
+                        errors.append(SqlError(index, statement.line, 'execute', message, statement.text))
+                    continue
+                if kind in ('TABLE', 'VIEW'):
+                    created_tables.add(table_name)
+        finally:
+            connection.close()
+        return errors
+
+def get_sandbox_expression(expression : Any, created_tables : set[str], sandbox : str) -> Any:
+    """
+        Copy of statement prepared for sandbox: without foreign keys to tables not created in sandbox,
+        with null ordering of the sandbox (SQLite does not support NULLS FIRST/LAST in indexes)
+        and with serial types replaced by integers.
+        None if nothing is left to execute (e.g. alter table that only adds such foreign key)
+    """
+    expression = expression.copy()
+    null_ordering = sqlglot.Dialect.get_or_raise(sandbox).NULL_ORDERING
+    for ordered in expression.find_all(exp.Ordered):
+        descending = bool(ordered.args.get('desc'))
+        ordered.set('nulls_first', (null_ordering == 'nulls_are_small') != descending if null_ordering != 'nulls_are_last' else False)
+    for data_type in expression.find_all(exp.DataType):
+        integer_type = _SERIAL_TYPES.get(data_type.this)
+        if integer_type is not None:
+            data_type.set('this', integer_type)
+    for reference in list(expression.find_all(exp.Reference)):
+        table = reference.find(exp.Table)
+        if table is None or table.name.lower() in created_tables:
+            continue
+        node = reference.parent
+        if isinstance(node, exp.ForeignKey) and isinstance(node.parent, exp.Constraint):
+            node = node.parent
+        parent = node.parent
+        node.pop()
+        if isinstance(parent, exp.AddConstraint) and not parent.expressions:
+            return None
+    return expression
+
+def get_ddl_target(expression : Any) -> tuple[str, str]:
+    """
+        Kind and lower case name of object created or altered by DDL statement, None for other statements
+    """
+    if isinstance(expression, exp.Create):
+        kind = (expression.args.get('kind') or '').upper()
+        if kind not in ('TABLE', 'VIEW', 'INDEX'):
+            return None
+        table = expression.find(exp.Table)
+        return (kind, table.name.lower()) if table is not None and table.name else None
+    if isinstance(expression, exp.Alter) and (expression.args.get('kind') or '').upper() == 'TABLE':
+        return ('ALTER', expression.this.name.lower())
+    return None
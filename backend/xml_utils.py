@@ -2,8 +2,16 @@
     XML utils
 """
 
+import re
 import xml.etree.ElementTree as ET
+from xml.sax import saxutils
 
+# tags with free text from LLM (SQL, Prisma), their content is wrapped into CDATA on repair
+TEXT_TAGS = ('sql_script_text', 'prisma')
+
+BARE_AMPERSAND = re.compile(r'&(?!(?:amp|lt|gt|quot|apos|#\d+|#x[0-9a-fA-F]+);)')
+XML_TAG = re.compile(r'<(/?)([A-Za-z_][\w.-]*)([^<>]*?)(/?)>')
+XML_ATTRIBUTE = re.compile(r'([A-Za-z_][\w.-]*)\s*=\s*"([^"]*)"')
 
 def get_as_xml(xml_string):
     """
@@ -13,9 +21,12 @@ def get_as_xml(xml_string):
 
 def get_text_by_xpath(xml, xpath):
     """
-    Get text by xpath
+    Get text by xpath, empty string if node or text doesn't exist
     """
-    return xml.find(xpath).text
+    element = xml.find(xpath)
+    if element is None or element.text is None:
+        return ''
+    return element.text
 
 def get_array_by_xpath(xml, xpath):
     """
@@ -27,4 +38,197 @@ def xml_to_string(xml):
     """
     Convert XML to string
     """
-    return ET.tostring(xml, encoding='unicode').strip()
\ No newline at end of file
+    return ET.tostring(xml, encoding='unicode').strip()
+
+def strip_code_fence(text):
+    """
+    Remove markdown code fences like ```xml
+    """
+    return re.sub(r'```[a-zA-Z]*', '', text).strip()
+
+def extract_output_block(text, root_tag='output'):
+    """
+    Get <output>...</output> block from text with surrounding prose, unclosed block is returned till the end
+    """
+    begin = text.find(f'<{root_tag}')
+    if begin < 0:
+        return text
+    end = text.rfind(f'</{root_tag}>')
+    if end < 0:
+        return text[begin:]
+    return text[begin:end + len(root_tag) + 3]
+
+def wrap_text_tags_in_cdata(text, tags=TEXT_TAGS):
+    """
+    Put content of free text tags into CDATA, so < and & in SQL do not break XML
+    """
+    def to_cdata(match):
+        content = match.group(2)
+        if content.strip().startswith('<![CDATA['):
+            return match.group(0)
+        content = saxutils.unescape(content).replace(']]>', ']]]]><![CDATA[>')
+        return f'{match.group(1)}<![CDATA[{content}]]>{match.group(3)}'
+
+    for tag in tags:
+        text = re.sub(rf'(<{tag}\b[^>]*>)(.*?)(</{tag}>|$)', to_cdata, text, flags=re.DOTALL)
+    return text
+
+def close_unclosed_tags(text):
+    """
+    Add close tags for truncated output
+    """
+    stack = []
+    for match in XML_TAG.finditer(re.sub(r'<!\[CDATA\[.*?(\]\]>|$)', '', text, flags=re.DOTALL)):
+        closing, tag, _, self_closing = match.groups()
+        if self_closing:
+            continue
+        if not closing:
+            stack.append(tag)
+        elif tag in stack:
+            while stack and stack.pop() != tag:
+                pass
+    return text + ''.join(f'</{tag}>' for tag in reversed(stack))
+
+def is_truncated(text, tags=TEXT_TAGS + ('output',)):
+    """
+    True if output ends inside free text tag or root block: tag is opened more times than closed
+    """
+    return any(len(re.findall(rf'<{tag}\b[^<>]*(?<!/)>', text)) > text.count(f'</{tag}>') for tag in tags)
+
+def repair_xml_string(text):
+    """
+    Fix typical LLM XML problems: free text tags, bare ampersands, truncated output
+    """
+    text = wrap_text_tags_in_cdata(text)
+    parts = re.split(r'(<!\[CDATA\[.*?\]\]>)', text, flags=re.DOTALL)
+    text = ''.join(part if part.startswith('<![CDATA[') else BARE_AMPERSAND.sub('&amp;', part) for part in parts)
+    return close_unclosed_tags(text)
+
+def extract_xml_by_regex(text):
+    """
+    Last resort: build <output> element from known tags found by regex
+    """
+    output = ET.Element('output')
+    found = False
+
+    for table_match in re.finditer(r'<table\s+([^<>]*?)/?>(.*?)(?:</table>|(?=<table\s)|$)', text, flags=re.DOTALL):
+        attributes = dict(XML_ATTRIBUTE.findall(table_match.group(1)))
+        if 'name' not in attributes:
+            continue
+        table = ET.SubElement(output, 'table', attributes)
+        for field_match in re.finditer(r'<field\s+([^<>]*?)/?>', table_match.group(2)):
+            ET.SubElement(table, 'field', dict(XML_ATTRIBUTE.findall(field_match.group(1))))
+        prisma_match = re.search(r'<prisma>(.*?)(?:</prisma>|$)', table_match.group(2), flags=re.DOTALL)
+        if prisma_match:
+            ET.SubElement(table, 'prisma').text = saxutils.unescape(prisma_match.group(1))
+        found = True
+
+    for list_tag in ('created_tables', 'foregn_key_tables'):
+        list_match = re.search(rf'<{list_tag}>(.*?)</{list_tag}>', text, flags=re.DOTALL)
+        if list_match:
+            list_element = ET.SubElement(output, list_tag)
+            for item in re.findall(r'<table>(.*?)</table>', list_match.group(1), flags=re.DOTALL):
+                ET.SubElement(list_element, 'table').text = item.strip()
+            found = True
+
+    script_match = re.search(r'<sql_script_text>(.*?)(?:</sql_script_text>|$)', text, flags=re.DOTALL)
+    if script_match:
+        script = script_match.group(1).strip()
+        if script.startswith('<![CDATA['):
+            script = script[len('<![CDATA['):].rsplit(']]>', 1)[0]
+        else:
+            script = saxutils.unescape(script)
+        ET.SubElement(output, 'sql_script_text').text = script
+        found = True
+
+    return output if found else None
+
+def parse_llm_xml(text):
+    """
+    Tolerant parsing of LLM output: strict parsing, then repaired XML, then regex extraction.
+    Raises ET.ParseError if nothing works.
+    """
+    text = extract_output_block(strip_code_fence(text))
+    try:
+        return ET.fromstring(text)
+    except ET.ParseError as error:
+        parse_error = error
+
+    try:
+        return ET.fromstring(repair_xml_string(text))
+    except ET.ParseError:
+        pass
+
+    output = extract_xml_by_regex(text)
+    if output is None:
+        raise parse_error
+    return output
+
+def try_parse_llm_xml(text):
+    """
+    Tolerant parsing of LLM output, None if it's not possible
+    """
+    try:
+        return parse_llm_xml(text)
+    except ET.ParseError:
+        return None
+
+class XmlTagTextStreamParser:
+    """
+    Incremental parser for streamed LLM output.
+    Returns text of one tag as soon as it arrives.
+    """
+
+    def __init__(self, tag : str):
+        self.open_tag  = f"<{tag}>"
+        self.close_tag = f"</{tag}>"
+        self.buffer    = ''
+        self.inside    = False
+        self.done      = False
+        self.started   = False
+
+    def feed(self, chunk : str) -> str:
+        """
+        Feed next chunk, returns new text of the tag (can be empty)
+        """
+        if self.done:
+            return ''
+        self.buffer += chunk
+
+        if not self.inside:
+            begin = self.buffer.find(self.open_tag)
+            if begin < 0:
+                # keep only tail that can be start of the open tag
+                self.buffer = self.buffer[-len(self.open_tag):]
+                return ''
+            self.buffer = self.buffer[begin + len(self.open_tag):]
+            self.inside = True
+
+        end = self.buffer.find(self.close_tag)
+        if end >= 0:
+            text = self.buffer[:end]
+            self.buffer = ''
+            self.done = True
+        else:
+            # hold back possible beginning of close tag or entity
+            hold = self.get_hold_length(self.buffer)
+            text = self.buffer[:len(self.buffer) - hold]
+            self.buffer = self.buffer[len(self.buffer) - hold:]
+
+        text = saxutils.unescape(text)
+        if not self.started:
+            text = text.lstrip('\n ')
+            self.started = bool(text)
+        return text
+
+    def get_hold_length(self, text : str) -> int:
+        """
+        Length of tail that must wait for next chunk
+        """
+        for size in range(min(len(self.close_tag) - 1, len(text)), 0, -1):
+            if self.close_tag.startswith(text[-size:]):
+                return size
+        amp = text.rfind('&')
+        if amp >= 0 and ';' not in text[amp:] and len(text) - amp < 10:
+            return len(text) - amp
+        return 0
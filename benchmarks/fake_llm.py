@@ -0,0 +1,100 @@
+"""
+    Deterministic fake chat model replaying recorded responses
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import asyncio
+import re
+import time
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from backend.llm_core import LLMCore
+from benchmarks import recorded_responses
+
+def get_recorded_response(prompt : str) -> str:
+    """
+        Recorded response for the prompt, table name is taken from the prompt
+    """
+    if 'Source database:' in prompt:
+        # translation of one statement: statement is returned as is
+        return prompt.rsplit('###', 1)[-1].strip()
+    if 'Table definitions:' in prompt:
+        tables = re.findall(r'<table_definition id="(\d+)">\s*Table (\w+)', prompt)
+        body = "".join(recorded_responses.SQL_SCHEMA_PACKED_TABLE.format(id=i, table=get_table_name(t)) for i, t in tables)
+        return f"```xml\n<output>{body}\n</output>\n```"
+    if 'Table creation script:' in prompt:
+        table_match = re.search(r'CREATE TABLE (\w+)', prompt)
+        response = recorded_responses.SQL_PART_RESPONSE
+    elif 'Table schema:' in prompt:
+        table_match = re.search(r'<table name="(\w+)"', prompt)
+        response = recorded_responses.SQL_RESPONSE
+    else:
+        table_match = re.search(r'Table definition:\s*Table (\w+)', prompt)
+        response = recorded_responses.PRISMA_SCHEMA_RESPONSE if 'Prisma' in prompt else recorded_responses.SQL_SCHEMA_RESPONSE
+    return response.format(table=get_table_name(table_match.group(1) if table_match else 'table'))
+
+def get_table_name(name : str) -> str:
+    """
+        Table name with tb_ prefix
+    """
+    return name if name.startswith('tb_') else f"tb_{name}"
+
+class FakeChatModel(BaseChatModel):
+    """
+        Chat model that returns recorded response for the prompt kind after simulated latency
+    """
+    latency_seconds : float = 0.0
+    model_name : str = "fake-model"
+    calls : int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def get_response(self, messages : list[BaseMessage]) -> ChatResult:
+        """
+            Recorded response with token usage
+        """
+        self.calls += 1
+        prompt = "\n".join(str(m.content) for m in messages)
+        content = get_recorded_response(prompt)
+
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        token_usage = {"prompt_tokens" : prompt_tokens, "completion_tokens" : completion_tokens, "total_tokens" : prompt_tokens + completion_tokens}
+        return ChatResult(
+            generations = [ChatGeneration(message=AIMessage(content=content))],
+            llm_output  = {"token_usage" : token_usage, "model_name" : self.model_name}
+        )
+
+    def _generate(self, messages : list[BaseMessage], stop : list[str] = None, run_manager : Any = None, **kwargs : Any) -> ChatResult:
+        time.sleep(self.latency_seconds)
+        return self.get_response(messages)
+
+    async def _agenerate(self, messages : list[BaseMessage], stop : list[str] = None, run_manager : Any = None, **kwargs : Any) -> ChatResult:
+        await asyncio.sleep(self.latency_seconds)
+        return self.get_response(messages)
+
+class FakeLLMCore(LLMCore):
+    """
+        LLMCore with fake chat model instead of OpenAI
+    """
+    latency_seconds = 0.0
+
+    def init_llm_environment(self, all_secrets : dict[str, Any]):
+        self.openai_api_type = 'fake'
+        self.openai_api_deployment = None
+
+    def create_llm(self, max_tokens : int, model_name : str) -> BaseChatModel:
+        return FakeChatModel(latency_seconds=self.latency_seconds)
+
+def create_fake_llm_core(latency_seconds : float = 0.0, llm_cache_backend : str = 'none') -> FakeLLMCore:
+    """
+        Create LLMCore with fake LLM, LLM cache is off by default to measure full path
+    """
+    FakeLLMCore.latency_seconds = latency_seconds
+    return FakeLLMCore({"llm_cache" : {"BACKEND" : llm_cache_backend}})
@@ -0,0 +1,108 @@
+"""
+    Recorded LLM responses used by the fake LLM, {table} is replaced by table name
+"""
+
+SQL_SCHEMA_RESPONSE = """```xml
+<output>
+    <table name="{table}">
+        <field name="id" type="SERIAL" primary_key="true" />
+        <field name="name" type="VARCHAR(100)" not_null="true" />
+        <field name="email" type="VARCHAR(255)" unique="true" />
+        <field name="last_login_time" type="TIMESTAMP" />
+        <field name="is_daily_subscription" type="BOOLEAN" />
+        <field name="is_weekly_subscription" type="BOOLEAN" />
+        <field name="is_locked" type="BOOLEAN" />
+        <field name="created_by" type="INT" foreign_key="tb_user(id)" />
+    </table>
+</output>
+```"""
+
+SQL_SCHEMA_PACKED_TABLE = """
+    <table id="{id}" name="{table}">
+        <field name="id" type="SERIAL" primary_key="true" />
+        <field name="name" type="VARCHAR(100)" not_null="true" />
+        <field name="email" type="VARCHAR(255)" unique="true" />
+        <field name="last_login_time" type="TIMESTAMP" />
+        <field name="created_by" type="INT" foreign_key="tb_user(id)" />
+    </table>"""
+
+PRISMA_SCHEMA_RESPONSE = """```xml
+<output>
+ <table name="{table}">
+  <prisma>
+model {table} {{
+  id         Int      @id @default(autoincrement())
+  name       String   @db.VarChar(100)
+  email      String?  @unique
+  created_by Int?
+}}
+  </prisma>
+ </table>
+</output>
+```"""
+
+SQL_RESPONSE = """```xml
+<output>
+ <created_tables>
+     <table>{table}</table>
+ </created_tables>
+ <foregn_key_tables>
+     <table>tb_user</table>
+ </foregn_key_tables>
+ <sql_script_text>
+-- Create table
+CREATE TABLE {table} (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    email VARCHAR(255) UNIQUE,
+    last_login_time TIMESTAMP,
+    is_daily_subscription BOOLEAN,
+    is_weekly_subscription BOOLEAN,
+    is_locked BOOLEAN,
+    created_by INT,
+    CONSTRAINT fk_{table}_created_by FOREIGN KEY (created_by) REFERENCES tb_user(id)
+);
+
+-- Create procedure
+CREATE OR REPLACE FUNCTION {table}_create(p_name VARCHAR, p_email VARCHAR) RETURNS INT AS $$
+DECLARE new_id INT;
+BEGIN
+    INSERT INTO {table} (name, email) VALUES (p_name, p_email) RETURNING id INTO new_id;
+    RETURN new_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Update procedure
+CREATE OR REPLACE FUNCTION {table}_update(p_id INT, p_name VARCHAR, p_email VARCHAR) RETURNS BOOLEAN AS $$
+BEGIN
+    UPDATE {table} SET name = p_name, email = p_email WHERE id = p_id;
+    RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Delete procedure
+CREATE OR REPLACE FUNCTION {table}_delete(p_id INT) RETURNS BOOLEAN AS $$
+BEGIN
+    DELETE FROM {table} WHERE id = p_id;
+    RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql;
+
+-- View
+CREATE VIEW v_{table} AS SELECT id, name, email, last_login_time FROM {table} WHERE id &gt; 0;
+ </sql_script_text>
+</output>
+```"""
+
+SQL_PART_RESPONSE = """```xml
+<output>
+ <sql_script_text>
+-- Get procedure
+CREATE OR REPLACE FUNCTION {table}_get(p_id INT) RETURNS SETOF {table} AS $$
+BEGIN
+    RETURN QUERY SELECT id, name, email FROM {table} WHERE id = p_id;
+END;
+$$ LANGUAGE plpgsql;
+ </sql_script_text>
+</output>
+```"""
@@ -0,0 +1,177 @@
+"""
+    Offline benchmarks with deterministic fake LLM
+
+    python -m benchmarks.run_benchmarks --tables 1 10 100 1000 --latency-ms 0
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from benchmarks.fake_llm import create_fake_llm_core, FakeLLMCore
+from benchmarks import recorded_responses
+
+DB_NAME = "Postgres"
+
+def get_table_descriptions(count : int) -> list[str]:
+    """
+        Unique table descriptions
+    """
+    return [f"Table bench_{i} has id, name (not empty, string, maximum 100 chars), e-mail (unique) and last login time." for i in range(count)]
+
+def get_table_schemas(count : int) -> list[str]:
+    """
+        Unique table schemas
+    """
+    return [
+        f'<table name="tb_bench_{i}"><field name="id" type="SERIAL" primary_key="true" /><field name="name" type="VARCHAR(100)" not_null="true" /></table>'
+        for i in range(count)
+    ]
+
+def percentile(values : list[float], p : float) -> float:
+    """
+        Percentile with linear interpolation
+    """
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[int(p) - 1]
+
+def report(name : str, count : int, total_seconds : float, latencies : list[float]):
+    """
+        Print throughput and latency percentiles
+    """
+    latencies = sorted(latencies)
+    print(
+        f"{name:<22} tables={count:<5} "
+        f"throughput={count / total_seconds:>10.1f}/s "
+        f"p50={percentile(latencies, 50) * 1000:>8.3f}ms "
+        f"p95={percentile(latencies, 95) * 1000:>8.3f}ms "
+        f"p99={percentile(latencies, 99) * 1000:>8.3f}ms"
+    )
+
+def measure(calls : list[Callable]) -> tuple[float, list[float]]:
+    """
+        Run calls one by one, returns total time and latency of each call
+    """
+    latencies = []
+    start = time.perf_counter()
+    for call in calls:
+        call_start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - call_start)
+    return time.perf_counter() - start, latencies
+
+def measure_concurrent(calls : list[Callable], workers : int) -> tuple[float, list[float]]:
+    """
+        Run calls in thread pool, returns total time and latency of each call
+    """
+    def timed(call : Callable) -> float:
+        call_start = time.perf_counter()
+        call()
+        return time.perf_counter() - call_start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = list(executor.map(timed, calls))
+    return time.perf_counter() - start, latencies
+
+def bench_parsing(llm_core : FakeLLMCore, count : int):
+    """
+        Local overhead only: extraction, XML parsing and FK validation of recorded responses
+    """
+    schema_responses = [recorded_responses.SQL_SCHEMA_RESPONSE.format(table=f"tb_bench_{i}") for i in range(count)]
+    sql_responses = [recorded_responses.SQL_RESPONSE.format(table=f"tb_bench_{i}") for i in range(count)]
+    report("parse_sql_schema", count, *measure([lambda r=r: llm_core.parse_sql_schema(r) for r in schema_responses]))
+    report("parse_sql", count, *measure([lambda r=r: llm_core.parse_sql(r, ['tb_user']) for r in sql_responses]))
+
+def bench_prompts(llm_core : FakeLLMCore, count : int):
+    """
+        Prompt formatting overhead
+    """
+    prompt = llm_core.chain_generate_sql_schema.first
+    inputs = [llm_core.get_schema_inputs(DB_NAME, d, None, ['tb_user']) for d in get_table_descriptions(count)]
+    report("format_schema_prompt", count, *measure([lambda i=i: prompt.invoke(i) for i in inputs]))
+
+def bench_single(llm_core : FakeLLMCore, count : int):
+    """
+        Sequential end-to-end calls
+    """
+    descriptions = get_table_descriptions(count)
+    report("generate_sql_schema", count, *measure([lambda d=d: llm_core.generate_sql_schema(DB_NAME, d) for d in descriptions]))
+    schemas = get_table_schemas(count)
+    report("generate_sql", count, *measure([lambda s=s: llm_core.generate_sql(DB_NAME, s, None, ['tb_user']) for s in schemas]))
+
+def bench_batch(llm_core : FakeLLMCore, count : int, concurrency : int):
+    """
+        Batch API, latency is time of whole batch divided by number of tables
+    """
+    descriptions = get_table_descriptions(count)
+    start = time.perf_counter()
+    llm_core.generate_sql_schema_batch(DB_NAME, descriptions, max_concurrency=concurrency)
+    total_seconds = time.perf_counter() - start
+    report("generate_schema_batch", count, total_seconds, [total_seconds / count] * count)
+
+def bench_packed(llm_core : FakeLLMCore, count : int, concurrency : int):
+    """
+        Batch API with several table descriptions per prompt, compared by tokens and LLM calls per table
+    """
+    descriptions = get_table_descriptions(count)
+    for packed in (False, True):
+        llm_core._PACK_SCHEMA_GENERATION = packed # pylint: disable=W0212
+        calls_before = llm_core.llm.calls
+        start = time.perf_counter()
+        results = llm_core.generate_sql_schema_batch(DB_NAME, descriptions, max_concurrency=concurrency)
+        total_seconds = time.perf_counter() - start
+        name = "schema_batch_packed" if packed else "schema_batch_single"
+        report(name, count, total_seconds, [total_seconds / count] * count)
+        print(f"{'':<22} tokens/table={sum(r.tokens_used for r in results) / count:>8.1f} calls/table={(llm_core.llm.calls - calls_before) / count:.2f} errors={sum(1 for r in results if r.error)}")
+    llm_core._PACK_SCHEMA_GENERATION = False # pylint: disable=W0212
+
+def bench_local_ddl(llm_core : FakeLLMCore, count : int):
+    """
+        Sql generation with table script generated by LLM and locally from schema, compared by tokens and LLM calls per table
+    """
+    schemas = get_table_schemas(count)
+    for local_ddl in (False, True):
+        llm_core._LOCAL_DDL = local_ddl # pylint: disable=W0212
+        calls_before = llm_core.llm.calls
+        results = []
+        name = "generate_sql_local_ddl" if local_ddl else "generate_sql_llm_ddl"
+        report(name, count, *measure([lambda s=s: results.append(llm_core.generate_sql(DB_NAME, s, None, ['tb_user'])) for s in schemas]))
+        print(f"{'':<22} tokens/table={sum(r[3] for r in results) / count:>8.1f} calls/table={(llm_core.llm.calls - calls_before) / count:.2f} errors={sum(len(r[2]) for r in results)}")
+    llm_core._LOCAL_DDL = True # pylint: disable=W0212
+
+def bench_concurrent(llm_core : FakeLLMCore, count : int, concurrency : int):
+    """
+        Independent calls from many threads, like many Streamlit sessions
+    """
+    schemas = get_table_schemas(count)
+    report("generate_sql_threads", count, *measure_concurrent([lambda s=s: llm_core.generate_sql(DB_NAME, s, None, ['tb_user']) for s in schemas], concurrency))
+
+def main(argv : list[str] = None):
+    """
+        Run all benchmarks
+    """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run_benchmarks', description='Offline benchmarks with fake LLM')
+    parser.add_argument('--tables', type=int, nargs='+', default=[1, 10, 100, 1000], help='number of tables per workload')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='simulated LLM latency')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrency of batch and threaded workloads')
+    parser.add_argument('--llm-cache', default='none', choices=['none', 'memory', 'sqlite', 'sharded'], help='LLM cache backend')
+    args = parser.parse_args(argv)
+
+    llm_core = create_fake_llm_core(args.latency_ms / 1000, args.llm_cache)
+    print(f"latency={args.latency_ms}ms concurrency={args.concurrency} llm_cache={args.llm_cache}")
+    for count in args.tables:
+        bench_prompts(llm_core, count)
+        bench_parsing(llm_core, count)
+        bench_single(llm_core, count)
+        bench_batch(llm_core, count, args.concurrency)
+        bench_packed(llm_core, count, args.concurrency)
+        bench_local_ddl(llm_core, count)
+        bench_concurrent(llm_core, count, args.concurrency)
+
+if __name__ == '__main__':
+    main()
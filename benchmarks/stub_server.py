@@ -0,0 +1,167 @@
+"""
+    Local OpenAI compatible stub server replaying recorded responses
+
+    python -m benchmarks.stub_server --port 8001 --latency-ms 100 --rate-limit-rate 0.2 --server-error-rate 0.05
+
+    Serves /v1/chat/completions (OpenAI) and /openai/deployments/{deployment}/chat/completions (Azure),
+    with optional streaming, so LLM router failover and rate limiting can be tested without real endpoints.
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.fake_llm import get_recorded_response
+
+logger : logging.Logger = logging.getLogger()
+
+_STREAM_CHUNK_SIZE = 64
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """
+        Chat completions endpoint, settings are taken from the server
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args): # pylint: disable=W0622
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def send_json(self, status : int, body : dict, headers : dict[str, str] = None):
+        """
+            JSON response
+        """
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_response(self, status : int, message : str, headers : dict[str, str] = None):
+        """
+            Error in OpenAI format
+        """
+        self.server.stats["errors"] += 1
+        self.send_json(status, {"error" : {"message" : message, "type" : "stub_error", "code" : str(status)}}, headers)
+
+    def send_stream(self, completion_id : str, model : str, content : str):
+        """
+            Server-sent events with content split into chunks
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunks = [content[i:i + _STREAM_CHUNK_SIZE] for i in range(0, len(content), _STREAM_CHUNK_SIZE)]
+        for i, text in enumerate(chunks + [None]):
+            delta = {"role" : "assistant", "content" : text} if i == 0 else ({"content" : text} if text is not None else {})
+            body = {
+                "id" : completion_id, "object" : "chat.completion.chunk", "created" : int(time.time()), "model" : model,
+                "choices" : [{"index" : 0, "delta" : delta, "finish_reason" : None if text is not None else "stop"}]
+            }
+            self.write_chunk(f"data: {json.dumps(body)}\n\n")
+        self.write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, text : str):
+        """
+            One chunk of chunked transfer encoding
+        """
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+
+    def do_POST(self): # pylint: disable=C0116
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.stats["requests"] += 1
+
+        if not self.path.endswith("/chat/completions"):
+            self.send_error_response(404, f"Unknown path {self.path}")
+            return
+
+        time.sleep(self.server.latency_seconds)
+        roll = random.random()
+        if roll < self.server.rate_limit_rate:
+            self.send_error_response(429, "Rate limit is exceeded", {"Retry-After" : str(self.server.retry_after_seconds)})
+            return
+        if roll < self.server.rate_limit_rate + self.server.server_error_rate:
+            self.send_error_response(500, "Internal server error")
+            return
+
+        prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+        content = get_recorded_response(prompt)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request.get("model", "stub-model")
+        if request.get("stream"):
+            self.send_stream(completion_id, model, content)
+            return
+
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        self.send_json(200, {
+            "id" : completion_id, "object" : "chat.completion", "created" : int(time.time()), "model" : model,
+            "choices" : [{"index" : 0, "message" : {"role" : "assistant", "content" : content}, "finish_reason" : "stop"}],
+            "usage" : {"prompt_tokens" : prompt_tokens, "completion_tokens" : completion_tokens, "total_tokens" : prompt_tokens + completion_tokens}
+        })
+
+class StubServer(ThreadingHTTPServer):
+    """
+        Threading HTTP server with simulated latency and error rates
+    """
+    daemon_threads = True
+
+    def __init__(self, port : int = 0, latency_seconds : float = 0.0, rate_limit_rate : float = 0.0, server_error_rate : float = 0.0, retry_after_seconds : float = 1.0):
+        super().__init__(("127.0.0.1", port), StubRequestHandler)
+        self.latency_seconds = latency_seconds
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.stats = {"requests" : 0, "errors" : 0}
+
+    @property
+    def base_url(self) -> str:
+        """
+            Base URL for OpenAI client
+        """
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> threading.Thread:
+        """
+            Serve in background thread
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+def main():
+    """
+        Run stub server
+    """
+    parser = argparse.ArgumentParser(description="OpenAI compatible stub server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of 429 responses, seconds")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = StubServer(args.port, args.latency_ms / 1000, args.rate_limit_rate, args.server_error_rate, args.retry_after)
+    logger.info(f"Stub server on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,14 @@
 
 import streamlit as st
 import logging
+import queue
+import time
 
 from utils_streamlit import streamlit_hack_remove_top_space, hide_header_footer
 from utils.app_logger import init_streamlit_logger
 
 from backend.core import Core
+from backend.jobs import Job, JobProgress, get_shared_job_queue, JOB_FAILED
 from backend import prompts
 import strings
 
@@ -19,19 +22,36 @@ init_streamlit_logger()
 logger : logging.Logger = logging.getLogger()
 
 # ------------------------------- Session
+all_secrets = {s[0]:s[1] for s in st.secrets.items()}
 if 'core' not in st.session_state:
-    all_secrets = {s[0]:s[1] for s in st.secrets.items()}
     st.session_state.core = Core(all_secrets)
+# job id is kept in URL, so result of the job is shown after page reload
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = st.query_params.get('job')
 if 'tokens' not in st.session_state:
     st.session_state.tokens = 0
 if 'generated_schema' not in st.session_state:
     st.session_state.generated_schema = ''
 if 'generated_sql' not in st.session_state:
     st.session_state.generated_sql = ''
+if 'generated_sql_schema' not in st.session_state:
+    st.session_state.generated_sql_schema = ''
+if 'generated_sql_context' not in st.session_state:
+    st.session_state.generated_sql_context = ''
+if 'generated_migration' not in st.session_state:
+    st.session_state.generated_migration = ''
+if 'generated_dialects' not in st.session_state:
+    st.session_state.generated_dialects = []
+if 'generated_procedures' not in st.session_state:
+    st.session_state.generated_procedures = ''
+if 'procedure_errors' not in st.session_state:
+    st.session_state.procedure_errors = []
 if 'operation_done' not in st.session_state:
     st.session_state.operation_done = None
 if 'operation_errors' not in st.session_state:
     st.session_state.operation_errors = None
+if 'trimmed_tables' not in st.session_state:
+    st.session_state.trimmed_tables = []
 if 'tokens_currently_used' not in st.session_state:
     st.session_state.tokens_currently_used = 0
 if 'tokens_total_used' not in st.session_state:
@@ -40,6 +60,113 @@ if 'table_rules' not in st.session_state or st.session_state.table_rules is None
     st.session_state.table_rules = prompts.GENERATE_SCHEMA_DEFAULT_RULES.strip()
 if 'table_script_definition' not in st.session_state or st.session_state.table_script_definition is None or st.session_state.table_script_definition.strip() == '':
     st.session_state.table_script_definition = prompts.GENERATE_SQL_DEFAULT_CRUD.strip()
+if 'procedure_spec' not in st.session_state or st.session_state.procedure_spec is None or st.session_state.procedure_spec.strip() == '':
+    st.session_state.procedure_spec = prompts.GENERATE_PROCEDURES_DEFAULT_SPEC.strip()
+
+job_queue = get_shared_job_queue(all_secrets)
+job_active = st.session_state.job_id is not None
+
+# ------------------------------- Jobs
+JOB_DONE_MESSAGES = {
+    'schema' : "Schema generated",
+    'prisma' : "Prisma schema generated",
+    'sql'    : "SQL generated",
+    'procedures' : "Procedures generated"
+}
+
+def run_generate_schema(progress : JobProgress, core : Core, db_name : str, table_description : str, table_rules : str, existed_tables_str : str) -> tuple[str, int]:
+    """Job: generate XML schema"""
+    progress.update("Generating schema...")
+    return core.generate_sql_schema(db_name, table_description, table_rules, existed_tables_str)
+
+def run_generate_prisma(progress : JobProgress, core : Core, db_name : str, table_description : str, table_rules : str, existed_tables_str : str) -> tuple[str, int]:
+    """Job: generate Prisma schema"""
+    progress.update("Generating Prisma schema...")
+    return core.generate_prisma_schema(db_name, table_description, table_rules, existed_tables_str)
+
+def run_generate_sql(progress : JobProgress, core : Core, db_name : str, old_table_schema : str, table_schema : str, old_sql : str, old_context : str, script_definition : str, existed_tables_str : str, incremental : bool, force : bool, stream : bool, target_db_names : list[str]) -> tuple[dict, int]:
+    """Job: generate SQL incrementally, in streaming mode or at once, then transpile it to other databases"""
+    migration_script = ''
+    context = core.get_sql_generation_context(db_name, script_definition, existed_tables_str)
+    if incremental and not force and old_table_schema and old_sql and old_context == context:
+        progress.update("Regenerating changed scripts...")
+        incremental_result, tokens_used = core.generate_sql_incremental(db_name, old_table_schema, table_schema, old_sql, script_definition, existed_tables_str, old_context)
+        sql_script, migration_script = incremental_result.sql_script, incremental_result.migration_script
+    elif stream:
+        progress.update("Streaming SQL...")
+        sql_stream = core.generate_sql_stream(db_name, table_schema, script_definition, existed_tables_str)
+        streamed_sql = ''
+        for sql_chunk in sql_stream:
+            streamed_sql += sql_chunk
+            progress.update(partial_result=streamed_sql)
+        sql_script, tokens_used = sql_stream.sql_script, sql_stream.tokens_used
+    else:
+        progress.update("Generating SQL...")
+        sql_script, tokens_used = core.generate_sql(db_name, table_schema, script_definition, existed_tables_str)
+    dialects = []
+    if target_db_names and sql_script:
+        progress.update("Transpiling SQL...")
+        dialect_results, transpile_tokens = core.transpile_sql(db_name, sql_script, target_db_names)
+        tokens_used += transpile_tokens
+        dialects = [{"db_name" : r.db_name, "sql_script" : r.sql_script, "errors" : r.local_errors} for r in dialect_results]
+    return {"sql_script" : sql_script, "migration_script" : migration_script, "table_schema" : table_schema, "context" : context, "dialects" : dialects}, tokens_used
+
+def run_generate_procedures(progress : JobProgress, core : Core, db_name : str, table_schemas : str, catalog_tables : list[str], procedure_spec : str, existed_tables_str : str) -> tuple[dict, int]:
+    """Job: generate procedures for many tables"""
+    progress.update("Generating procedures...")
+    procedures_result, tokens_used = core.generate_procedures(db_name, table_schemas, catalog_tables, procedure_spec, existed_tables_str)
+    return {"sql_script" : procedures_result.sql_script, "errors" : procedures_result.errors}, tokens_used
+
+def submit_job(kind : str, func, *args):
+    """Queue job and remember its id in session and URL"""
+    try:
+        job_id = job_queue.submit(kind, func, *args)
+    except queue.Full:
+        st.session_state.operation_errors = "Too many requests in progress, please try again later"
+        return
+    st.session_state.job_id = job_id
+    st.query_params['job'] = job_id
+
+def apply_job_result(job : Job):
+    """Show result of finished job"""
+    st.session_state.job_id = None
+    st.query_params.pop('job', None)
+    if job is None:
+        return
+    if job.status == JOB_FAILED:
+        st.session_state.operation_errors = f"Generation failed: {job.error}"
+        return
+    if job.kind in ('schema', 'prisma'):
+        st.session_state.generated_schema = job.result
+    elif job.kind == 'sql':
+        st.session_state.generated_sql = job.result['sql_script']
+        st.session_state.generated_migration = job.result['migration_script']
+        st.session_state.generated_sql_schema = job.result['table_schema']
+        st.session_state.generated_sql_context = job.result['context']
+        st.session_state.generated_dialects = job.result['dialects']
+    elif job.kind == 'procedures':
+        st.session_state.generated_procedures = job.result['sql_script']
+        st.session_state.procedure_errors = job.result['errors']
+    update_used_tokens(job.tokens_used)
+    st.session_state.trimmed_tables = st.session_state.core.trimmed_tables
+    st.session_state.operation_done = JOB_DONE_MESSAGES.get(job.kind, "Done")
+
+@st.fragment(run_every=1.0)
+def show_job_status():
+    """Poll the job, rerun the app when it is finished"""
+    job = job_queue.get(st.session_state.job_id)
+    if job is None or job.is_finished:
+        apply_job_result(job)
+        st.rerun()
+    elapsed = time.time() - (job.started or job.created)
+    st.info(f"{job.message or 'Waiting in queue...'} ({job.status}, {elapsed:.0f}s)")
+    if job.partial_result:
+        st.code(job.partial_result, language="sql")
+
+def update_used_tokens(currently_used = 0):
+    """Update token counters"""
+    st.session_state.tokens_currently_used = currently_used
+    st.session_state.tokens_total_used += currently_used
 
 # ------------------------------- UI
 st.set_page_config(page_title= "Sql Generator", layout="wide")
@@ -54,12 +181,19 @@ if st.session_state.operation_done:
     st.success(st.session_state.operation_done)
     st.session_state.operation_done = None
 
+if st.session_state.trimmed_tables:
+    st.warning(f"Existed tables not included into prompt by token budget: {', '.join(st.session_state.trimmed_tables)}")
+    st.session_state.trimmed_tables = []
+
 if st.session_state.operation_errors:
     st.error(st.session_state.operation_errors)
     st.session_state.operation_errors = None
 
 db_name = st.text_input("Database Name:", value="Postgres")
 
+if job_active:
+    show_job_status()
+
 tab_tables, tab_procedures = st.tabs(["Generate Tables", "Generate Procedures"])
 
 with tab_tables:
@@ -70,22 +204,37 @@ with tab_tables:
     table_description = table_generate_columns[0].text_area("Table Description:", height=200, placeholder= "See Examples above")
     table_rules = table_generate_columns[1].text_area("Table Rules for schema generation:", st.session_state.table_rules, height=200, placeholder= "See Examples above")
     button_generate_columns = st.columns(8)
-    button_generate_schema = button_generate_columns[0].button("Generate XML schema")
-    button_generate_prisma = button_generate_columns[1].button("Generate Prisma schema")
+    button_generate_schema = button_generate_columns[0].button("Generate XML schema", disabled=job_active)
+    button_generate_prisma = button_generate_columns[1].button("Generate Prisma schema", disabled=job_active)
 
     table_sql_columns = st.columns(2)
     table_schema = table_sql_columns[0].text_area("Table Schema:", st.session_state.generated_schema, height=200, placeholder= "See Examples above")
     table_schema_script_definition = table_sql_columns[1].text_area("Script Definition for SQL generation:", st.session_state.table_script_definition, height=200, placeholder= "See Examples above")
-    button_generate_sql = st.button("Generate SQL")
+    button_sql_columns = st.columns(8)
+    button_generate_sql = button_sql_columns[0].button("Generate SQL", disabled=job_active)
+    stream_sql = button_sql_columns[1].checkbox("Stream SQL", value=True)
+    incremental_sql = button_sql_columns[2].checkbox("Incremental", value=True, help="Regenerate only scripts affected by changes of table schema, unchanged schema is regenerated completely")
+    button_schema_to_prisma = button_sql_columns[3].button("XML to Prisma", disabled=job_active, help="Prisma model from XML table schema, without LLM")
+    transpile_db_names = st.text_input("Transpile to (comma separated):", placeholder="MySQL, SQL Server", help="SQL is generated once and translated locally, only procedural code is sent to LLM")
     table_sql = st.text_area("Sql:", st.session_state.generated_sql, height=200)
+    if st.session_state.generated_migration:
+        st.text_area("Migration from previous schema:", st.session_state.generated_migration, height=100)
+    for dialect in st.session_state.generated_dialects:
+        for dialect_error in dialect['errors']:
+            st.warning(f"{dialect['db_name']}: {dialect_error}")
+        st.text_area(f"Sql for {dialect['db_name']}:", dialect['sql_script'], height=200)
 
 with tab_procedures:
-    st.info("TBD")
-
-def update_used_tokens(currently_used = 0):
-    """Update token counters"""
-    st.session_state.tokens_currently_used = currently_used
-    st.session_state.tokens_total_used += currently_used
+    procedure_columns = st.columns(2)
+    procedure_table_schemas = procedure_columns[0].text_area("Table Schemas (XML tables or Prisma models):", height=200, placeholder= "<table name=...>...</table> for each table")
+    procedure_spec = procedure_columns[1].text_area("Procedure Definition:", st.session_state.procedure_spec, height=200)
+    catalog_table_names = st.session_state.core.get_catalog_table_names()
+    procedure_catalog_tables = st.multiselect("Tables from database:", catalog_table_names) if catalog_table_names else []
+    button_procedure_columns = st.columns(8)
+    button_generate_procedures = button_procedure_columns[0].button("Generate Procedures", disabled=job_active)
+    for procedure_error in st.session_state.procedure_errors:
+        st.warning(procedure_error)
+    st.text_area("Procedures Sql:", st.session_state.generated_procedures, height=300)
 
 update_used_tokens()
 
@@ -94,9 +243,7 @@ if button_generate_schema:
         st.session_state.operation_errors = "Please enter database name, table description and rules"
     else:
         existed_tables_str = ""
-        st.session_state.generated_schema, tokens_used = st.session_state.core.generate_sql_schema(db_name, table_description, table_rules, existed_tables_str)
-        update_used_tokens(tokens_used)
-        st.session_state.operation_done = "Schema generated"
+        submit_job('schema', run_generate_schema, st.session_state.core, db_name, table_description, table_rules, existed_tables_str)
     st.rerun()
 
 if button_generate_prisma:
@@ -104,9 +251,7 @@ if button_generate_prisma:
         st.session_state.operation_errors = "Please enter database name, table description and rules"
     else:
         existed_tables_str = ""
-        st.session_state.generated_schema, tokens_used = st.session_state.core.generate_prisma_schema(db_name, table_description, table_rules, existed_tables_str)
-        update_used_tokens(tokens_used)
-        st.session_state.operation_done = "Prisma schema generated"
+        submit_job('prisma', run_generate_prisma, st.session_state.core, db_name, table_description, table_rules, existed_tables_str)
     st.rerun()
 
 if button_generate_sql:
@@ -114,7 +259,29 @@ if button_generate_sql:
         st.session_state.operation_errors = "Please enter database name, table schema and script definition"
     else:
         existed_tables_str = ""
-        st.session_state.generated_sql, tokens_used = st.session_state.core.generate_sql(db_name, table_schema, st.session_state.table_script_definition, existed_tables_str)
-        update_used_tokens(tokens_used)
-        st.session_state.operation_done = "SQL generated"
+        st.session_state.generated_migration = ''
+        st.session_state.generated_dialects = []
+        target_db_names = [t.strip() for t in transpile_db_names.split(',') if t.strip()]
+        # Generate with unchanged schema means the user wants a fresh script
+        force_sql = table_schema == st.session_state.generated_sql_schema
+        submit_job('sql', run_generate_sql, st.session_state.core, db_name, st.session_state.generated_sql_schema, table_schema, table_sql, st.session_state.generated_sql_context, st.session_state.table_script_definition, existed_tables_str, incremental_sql, force_sql, stream_sql, target_db_names)
+    st.rerun()
+
+if button_schema_to_prisma:
+    prisma_schema = st.session_state.core.generate_prisma_from_schema(table_schema)
+    if not prisma_schema:
+        st.session_state.operation_errors = "Please enter XML table schema"
+    else:
+        st.session_state.generated_schema = prisma_schema
+        st.session_state.operation_done = "Prisma schema generated"
+    st.rerun()
+
+if button_generate_procedures:
+    if not db_name or not (procedure_table_schemas.strip() or procedure_catalog_tables) or not procedure_spec:
+        st.session_state.operation_errors = "Please enter database name, table schemas and procedure definition"
+    else:
+        existed_tables_str = ""
+        st.session_state.procedure_spec = procedure_spec
+        st.session_state.procedure_errors = []
+        submit_job('procedures', run_generate_procedures, st.session_state.core, db_name, procedure_table_schemas, procedure_catalog_tables, procedure_spec, existed_tables_str)
     st.rerun()
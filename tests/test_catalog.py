@@ -0,0 +1,155 @@
+"""
+    Tests of database catalog
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203,C0116
+
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from backend import core_base
+from backend.async_core import AsyncCore
+from backend.catalog import DatabaseCatalog, SQLiteCatalogLoader, TableInfo
+from backend.core import Core
+from benchmarks.fake_llm import create_fake_llm_core
+
+@pytest.fixture(name="database_path")
+def fixture_database_path(tmp_path) -> str:
+    """
+        SQLite database with two related tables
+    """
+    database_path = str(tmp_path / "catalog.db")
+    with sqlite3.connect(database_path) as connection:
+        connection.executescript("""
+            CREATE TABLE tb_org (id INTEGER PRIMARY KEY, code TEXT NOT NULL UNIQUE);
+            CREATE TABLE tb_user (id INTEGER PRIMARY KEY, org_id INTEGER REFERENCES tb_org(id), email TEXT, name TEXT, UNIQUE (org_id, email));
+        """)
+    return database_path
+
+class CountingLoader(SQLiteCatalogLoader):
+    """
+        SQLite loader counting loaded tables, fingerprints of all tables must not be needed
+    """
+
+    def __init__(self, database_path : str):
+        super().__init__(database_path)
+        self.loaded = []
+        self.blocked = threading.Event()
+        self.blocked.set()
+
+    def get_schema_version(self):
+        self.blocked.wait(10)
+        return super().get_schema_version()
+
+    def get_fingerprints(self) -> dict[str, str]:
+        raise AssertionError("full inspection")
+
+    def load_table(self, table_name : str) -> TableInfo:
+        self.loaded.append(table_name)
+        return super().load_table(table_name)
+
+def rebuild_user_table(database_path : str, definition : str):
+    with sqlite3.connect(database_path) as connection:
+        connection.executescript(f"DROP TABLE tb_user; CREATE TABLE tb_user ({definition});")
+
+def test_load_table(database_path : str):
+    catalog = DatabaseCatalog(SQLiteCatalogLoader(database_path))
+    assert sorted(catalog.refresh()) == ['tb_org', 'tb_user']
+    table = catalog.get_table('TB_USER')
+    assert table.primary_key == ['id']
+    assert [(fk.columns, fk.referred_table, fk.referred_columns) for fk in table.foreign_keys] == [(['org_id'], 'tb_org', ['id'])]
+    assert table.unique_constraints == [['org_id', 'email']]
+    assert catalog.find_tables_by_column('ID') == {'tb_org', 'tb_user'}
+
+def test_table_schema(database_path : str):
+    catalog = DatabaseCatalog(SQLiteCatalogLoader(database_path))
+    catalog.refresh()
+    assert catalog.get_table_schema('tb_org').get_field('code').unique
+    schema = catalog.get_table_schema('tb_user')
+    assert schema.dependencies == {'tb_org'}
+    assert schema.unique_constraints == [('org_id', 'email')]
+
+@pytest.mark.parametrize("definition", [
+    "id INTEGER, org_id INTEGER REFERENCES tb_org(id), email TEXT, name TEXT, PRIMARY KEY (id, org_id), UNIQUE (org_id, email)",
+    "id INTEGER PRIMARY KEY, org_id INTEGER REFERENCES tb_org(code), email TEXT, name TEXT, UNIQUE (org_id, email)",
+    "id INTEGER PRIMARY KEY, org_id INTEGER REFERENCES tb_org(id), email TEXT, name TEXT, UNIQUE (org_id, name)",
+    "id INTEGER PRIMARY KEY, org_id INTEGER REFERENCES tb_org(id), email TEXT, name TEXT",
+])
+def test_constraint_change_reloads_table(database_path : str, definition : str):
+    catalog = DatabaseCatalog(SQLiteCatalogLoader(database_path))
+    catalog.refresh()
+    rebuild_user_table(database_path, definition)
+    assert catalog.refresh() == ['tb_user']
+
+def test_same_structure_is_not_reloaded(database_path : str):
+    catalog = DatabaseCatalog(SQLiteCatalogLoader(database_path))
+    catalog.refresh()
+    rebuild_user_table(database_path, "id INTEGER PRIMARY KEY, org_id INTEGER REFERENCES tb_org(id), email TEXT, name TEXT, UNIQUE (org_id, email)")
+    assert catalog.refresh() == []
+
+def test_existed_tables_match_ignores_case():
+    sql_xml = '<output><created_tables><table>tb_user</table></created_tables><foregn_key_tables><table>TB_ORG</table><table>tb_missing</table></foregn_key_tables><sql_script_text>SELECT 1;</sql_script_text></output>'
+    _, _, local_errors = create_fake_llm_core().parse_sql(sql_xml, ['tb_org'])
+    assert local_errors == ["Table tb_missing doesn't exist"]
+
+def test_catalog_from_url(database_path : str):
+    catalog = DatabaseCatalog.from_url(f"sqlite:///{database_path}")
+    catalog.refresh()
+    table = catalog.get_table('tb_user')
+    assert table.unique_constraints == [['org_id', 'email']]
+    rebuild_user_table(database_path, "id INTEGER PRIMARY KEY, org_id INTEGER REFERENCES tb_org(code), email TEXT, name TEXT, UNIQUE (org_id, email)")
+    assert catalog.refresh() == ['tb_user']
+
+def test_refresh_loads_only_changed_tables(database_path : str):
+    loader = CountingLoader(database_path)
+    catalog = DatabaseCatalog(loader)
+    catalog.refresh()
+    with sqlite3.connect(database_path) as connection:
+        connection.executescript("CREATE TABLE tb_role (id INTEGER PRIMARY KEY, name TEXT); CREATE INDEX ix_org_code ON tb_org (code);")
+    loader.loaded.clear()
+    assert catalog.refresh() == ['tb_role']
+    # index changes the signal of tb_org, its structure in catalog is the same
+    assert sorted(loader.loaded) == ['tb_org', 'tb_role']
+
+def test_refresh_runs_in_background(database_path : str):
+    loader = CountingLoader(database_path)
+    catalog = DatabaseCatalog(loader, refresh_seconds=0)
+    catalog.refresh_if_due()
+    assert sorted(catalog.table_names()) == ['tb_org', 'tb_user']
+
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("DROP TABLE tb_user")
+    loader.blocked.clear()
+    catalog.refresh_if_due()
+    # request thread is not blocked by running refresh
+    assert sorted(catalog.table_names()) == ['tb_org', 'tb_user']
+    loader.blocked.set()
+    catalog.refresh_thread.join(10)
+    assert catalog.table_names() == ['tb_org']
+
+def test_sqlalchemy_signals_from_information_schema(tmp_path):
+    pytest.importorskip("duckdb_engine")
+    catalog = DatabaseCatalog.from_url(f"duckdb:///{tmp_path / 'catalog.duckdb'}")
+    with catalog.loader.engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE tb_org (id INTEGER PRIMARY KEY, code TEXT UNIQUE)")
+        connection.exec_driver_sql("CREATE TABLE tb_user (id INTEGER PRIMARY KEY, org_id INTEGER REFERENCES tb_org(id))")
+    signals = catalog.loader.get_change_signals()
+    assert sorted(signals) == ['tb_org', 'tb_user']
+    with catalog.loader.engine.begin() as connection:
+        connection.exec_driver_sql("ALTER TABLE tb_user ADD COLUMN email TEXT")
+    new_signals = catalog.loader.get_change_signals()
+    assert new_signals['tb_org'] == signals['tb_org'] and new_signals['tb_user'] != signals['tb_user']
+
+def test_core_and_async_core_merge_catalog_tables(database_path : str, monkeypatch):
+    llm_core = create_fake_llm_core()
+    catalog = DatabaseCatalog(SQLiteCatalogLoader(database_path))
+    monkeypatch.setattr(core_base, 'get_shared_llm_core', lambda _ : llm_core)
+    monkeypatch.setattr(core_base, 'get_shared_catalog', lambda _ : catalog)
+    for core_class in (Core, AsyncCore):
+        assert core_class({}).get_existed_tables("tb_role tb_org") == ['tb_role', 'tb_org', 'tb_user']
+
+    async_core = AsyncCore({})
+    table_schema, tokens_used = asyncio.run(async_core.generate_sql_schema('Postgres', "Table user has id", "", "tb_role"))
+    assert 'tb_user' in table_schema and async_core.tokens_total_used == tokens_used > 0
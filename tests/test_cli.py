@@ -0,0 +1,75 @@
+"""
+    Tests of headless command line interface
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203,C0116
+
+import os
+import pytest
+
+from backend import core_base
+from backend.__main__ import main
+from benchmarks.fake_llm import FakeLLMCore, create_fake_llm_core
+
+@pytest.fixture(name="llm_core")
+def fixture_llm_core(monkeypatch) -> FakeLLMCore:
+    """
+        CLI core with fake LLM and without database catalog
+    """
+    llm_core = create_fake_llm_core()
+    monkeypatch.setattr(core_base, 'get_shared_llm_core', lambda _ : llm_core)
+    monkeypatch.setattr(core_base, 'get_shared_catalog', lambda _ : None)
+    return llm_core
+
+def write_descriptions(path : str, names : list[str]):
+    os.makedirs(path, exist_ok=True)
+    for name in names:
+        with open(os.path.join(path, f"{name}.txt"), 'w', encoding='utf-8') as f:
+            f.write(f"Table {name} has id, name and email")
+
+def run_cli(tmp_path, *extra_args : str) -> int:
+    return main(['--input', str(tmp_path / 'in'), '--output', str(tmp_path / 'out'), '--secrets', str(tmp_path / 'secrets.toml'), *extra_args])
+
+def read_migration(tmp_path) -> str:
+    with open(tmp_path / 'out' / 'migration.sql', encoding='utf-8') as f:
+        return f.read()
+
+def test_resumed_run_keeps_all_tables_in_migration(tmp_path, llm_core):
+    write_descriptions(tmp_path / 'in', ['order'])
+    assert run_cli(tmp_path) == 0
+    write_descriptions(tmp_path / 'in', ['user'])
+    assert run_cli(tmp_path) == 0
+    migration = read_migration(tmp_path)
+    # tb_order references tb_user, so it goes after it
+    assert 0 <= migration.index('-- tb_user') < migration.index('-- tb_order')
+
+    os.remove(tmp_path / 'out' / 'migration.sql')
+    calls = llm_core.llm.calls
+    assert run_cli(tmp_path) == 0
+    assert llm_core.llm.calls == calls
+    assert read_migration(tmp_path) == migration
+
+def test_prisma_failure_is_reported_per_table(tmp_path, llm_core, monkeypatch):
+    write_descriptions(tmp_path / 'in', ['order', 'user'])
+    generate_prisma_schema = llm_core.generate_prisma_schema
+    def generate_prisma_schema_failing(db_name : str, table_description : str, *args) -> tuple[str, str, int]:
+        if 'order' in table_description:
+            raise TimeoutError("timeout")
+        return generate_prisma_schema(db_name, table_description, *args)
+    monkeypatch.setattr(llm_core, 'generate_prisma_schema', generate_prisma_schema_failing)
+    assert run_cli(tmp_path, '--prisma') == 1
+    assert os.path.exists(tmp_path / 'out' / 'user.prisma')
+    assert not os.path.exists(tmp_path / 'out' / 'order.prisma')
+    assert os.path.exists(tmp_path / 'out' / 'order.sql')
+
+    # table without Prisma output is generated again on resume
+    monkeypatch.setattr(llm_core, 'generate_prisma_schema', generate_prisma_schema)
+    assert run_cli(tmp_path, '--prisma') == 0
+    assert os.path.exists(tmp_path / 'out' / 'order.prisma')
+
+def test_trimmed_tables_are_reported(tmp_path, llm_core, caplog):
+    llm_core._EXISTED_TABLES_MAX_TOKENS = 10 # pylint: disable=W0212
+    write_descriptions(tmp_path / 'in', [f"table{i}" for i in range(6)])
+    assert run_cli(tmp_path) == 0
+    write_descriptions(tmp_path / 'in', ['org'])
+    assert run_cli(tmp_path) == 0
+    assert any('not included into prompts by token budget' in r.message for r in caplog.records)
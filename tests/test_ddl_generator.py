@@ -0,0 +1,78 @@
+"""
+    Tests of local table DDL and Prisma model generation
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203,C0116
+
+import pytest
+
+from backend import ddl_generator
+from backend.schema_model import TableSchema, parse_table_schema
+from benchmarks.fake_llm import create_fake_llm_core
+
+ORDER_XML = """<table name="tb_order">
+    <field name="id" type="SERIAL" primary_key="true" />
+    <field name="user_id" type="INT" not_null="true" foreign_key="tb_user(id)" />
+    <field name="code" type="VARCHAR(20)" unique="true" />
+    <field name="total" type="DECIMAL(10,2)" default="0" />
+    <unique fields="user_id,code" />
+</table>"""
+
+@pytest.fixture(name="table")
+def fixture_table() -> TableSchema:
+    """
+        Table with primary, foreign and unique keys
+    """
+    return parse_table_schema(ORDER_XML)
+
+@pytest.mark.parametrize("db_name, id_column", [
+    ('Postgres', 'id SERIAL'),
+    ('SQL Server', 'id INT IDENTITY(1,1)'),
+    ('MySQL', 'id INT AUTO_INCREMENT'),
+])
+def test_table_sql_per_dialect(table : TableSchema, db_name : str, id_column : str):
+    sql = ddl_generator.generate_table_sql(table, db_name)
+    assert sql.startswith('-- Create table\nCREATE TABLE tb_order (')
+    assert f'    {id_column},' in sql
+    assert 'CONSTRAINT pk_tb_order PRIMARY KEY (id)' in sql
+    assert 'CONSTRAINT uq_tb_order_user_id_code UNIQUE (user_id, code)' in sql
+    assert 'CONSTRAINT fk_tb_order_user_id FOREIGN KEY (user_id) REFERENCES tb_user(id)' in sql
+    assert sql.endswith(');')
+
+def test_prisma_model(table : TableSchema):
+    model = ddl_generator.generate_prisma_model(table)
+    assert model.startswith('model tb_order {')
+    assert '@id @default(autoincrement())' in model
+    assert 'user    tb_user  @relation(fields: [user_id], references: [id])' in model
+    assert '@@unique([user_id, code])' in model
+    assert str(parse_table_schema(model).get_field('user_id').foreign_key) == 'tb_user(id)'
+
+def test_local_table_for_default_definition():
+    llm_core = create_fake_llm_core()
+    assert llm_core.get_local_table('Postgres', ORDER_XML).name == 'tb_order'
+    assert llm_core.get_local_table('Postgres', ORDER_XML, '1. create table script.\n2. View to get all items').name == 'tb_order'
+
+def test_custom_table_item_goes_to_llm():
+    llm_core = create_fake_llm_core()
+    assert llm_core.get_local_table('Postgres', ORDER_XML, '1. CREATE TABLE script with comments on columns\n2. View to get all items') is None
+    assert llm_core.get_local_table('Postgres', 'not a schema') is None
+
+def test_stream_after_local_table():
+    llm_core = create_fake_llm_core()
+    sql_stream = llm_core.generate_sql_stream('Postgres', ORDER_XML, None, ['tb_user'])
+    chunks = list(sql_stream)
+    assert chunks[0] == ddl_generator.generate_table_sql(parse_table_schema(ORDER_XML), 'Postgres')
+    assert len(chunks) > 1 and chunks[1].startswith('\n\n')
+    assert "".join(chunks).strip() == sql_stream.sql_script
+    assert sql_stream.new_tables == ['tb_order'] and sql_stream.local_errors == []
+    assert llm_core.llm.calls == 1 and sql_stream.tokens_used > 0
+
+def test_batch_with_local_tables():
+    llm_core = create_fake_llm_core()
+    user_xml = '<table name="tb_user"><field name="id" type="SERIAL" primary_key="true" /></table>'
+    results = llm_core.generate_sql_batch('Postgres', [user_xml, ORDER_XML, 'Table without schema'], None, [])
+    assert [r.new_tables for r in results[:2]] == [['tb_user'], ['tb_order']]
+    assert results[1].sql_script.startswith(ddl_generator.generate_table_sql(parse_table_schema(ORDER_XML), 'Postgres'))
+    assert results[1].local_errors == ["Table tb_user doesn't exist"]
+    assert all(r.error is None and r.tokens_used > 0 for r in results)
+    # one call of other scripts per local table, one full call for the table that can't be parsed
+    assert llm_core.llm.calls == 3
@@ -0,0 +1,85 @@
+"""
+    Tests of incremental sql regeneration
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203,C0116
+
+import pytest
+
+from backend.incremental_sql import IncrementalSqlGenerator, diff_table_schemas, get_affected_artifacts, get_generation_context, build_migration_script
+from benchmarks.fake_llm import create_fake_llm_core
+
+OLD_SCHEMA = '<table name="tb_user"><field name="id" type="SERIAL" primary_key="true" /><field name="name" type="VARCHAR(100)" /></table>'
+NEW_SCHEMA = '<table name="tb_user"><field name="id" type="SERIAL" primary_key="true" /><field name="name" type="VARCHAR(100)" /><field name="email" type="VARCHAR(255)" unique="true" /></table>'
+
+@pytest.fixture(name="generator")
+def fixture_generator() -> IncrementalSqlGenerator:
+    """
+        Generator with fake LLM
+    """
+    return IncrementalSqlGenerator(create_fake_llm_core())
+
+def test_diff_added_field():
+    diff = diff_table_schemas(OLD_SCHEMA, NEW_SCHEMA)
+    assert [f['name'] for f in diff.added] == ['email']
+    assert not diff.removed and not diff.changed
+    assert get_affected_artifacts(diff) == ['table', 'create', 'update', 'get', 'get_all']
+
+def test_diff_constraint_only():
+    schema = NEW_SCHEMA.replace(' unique="true"', '')
+    diff = diff_table_schemas(schema, NEW_SCHEMA)
+    assert [new['name'] for _, new in diff.changed] == ['email']
+    assert get_affected_artifacts(diff) == ['table']
+
+def test_diff_primary_key_change_needs_full_regeneration():
+    schema = OLD_SCHEMA.replace('name="name" type="VARCHAR(100)"', 'name="name" type="VARCHAR(100)" primary_key="true"')
+    assert get_affected_artifacts(diff_table_schemas(OLD_SCHEMA, schema)) is None
+
+def test_diff_renamed_table_needs_full_regeneration():
+    assert get_affected_artifacts(diff_table_schemas(OLD_SCHEMA, NEW_SCHEMA.replace('tb_user', 'tb_person'))) is None
+
+def test_migration_script_per_dialect():
+    diff = diff_table_schemas(OLD_SCHEMA, NEW_SCHEMA)
+    assert build_migration_script('Postgres', diff) == "ALTER TABLE tb_user ADD COLUMN email VARCHAR(255) UNIQUE;"
+    assert build_migration_script('SQL Server', diff) == "ALTER TABLE tb_user ADD email VARCHAR(255) UNIQUE;"
+
+def test_generation_context():
+    assert get_generation_context('Postgres', None, ['tb_a', 'TB_B']) == get_generation_context(' postgres', None, ['tb_b', 'tb_a'])
+    assert get_generation_context('Postgres') != get_generation_context('SQL Server')
+    assert get_generation_context('Postgres', '1. CREATE TABLE script') != get_generation_context('Postgres')
+    assert get_generation_context('Postgres', None, ['tb_a']) != get_generation_context('Postgres')
+
+def test_unchanged_schema_and_context_reuses_script(generator : IncrementalSqlGenerator):
+    context = get_generation_context('Postgres', None, ['tb_user'])
+    result = generator.run('Postgres', OLD_SCHEMA, OLD_SCHEMA, 'old sql', None, ['tb_user'], context)
+    assert result.sql_script == 'old sql'
+    assert result.regenerated == [] and result.tokens_used == 0
+    assert result.context == context
+
+def test_changed_database_regenerates_all(generator : IncrementalSqlGenerator):
+    context = get_generation_context('Postgres', None, ['tb_user'])
+    result = generator.run('SQL Server', OLD_SCHEMA, OLD_SCHEMA, 'old sql', None, ['tb_user'], context)
+    assert result.full_regeneration
+    assert result.sql_script != 'old sql' and result.tokens_used > 0
+    assert result.context == get_generation_context('SQL Server', None, ['tb_user'])
+
+def test_changed_existed_tables_regenerates_all(generator : IncrementalSqlGenerator):
+    context = get_generation_context('Postgres', None, [])
+    result = generator.run('Postgres', OLD_SCHEMA, OLD_SCHEMA, 'old sql', None, ['tb_user'], context)
+    assert result.full_regeneration
+
+def test_missing_context_regenerates_all(generator : IncrementalSqlGenerator):
+    result = generator.run('Postgres', OLD_SCHEMA, OLD_SCHEMA, 'old sql', None, ['tb_user'])
+    assert result.full_regeneration
+
+def test_force_regenerates_all(generator : IncrementalSqlGenerator):
+    context = get_generation_context('Postgres', None, ['tb_user'])
+    result = generator.run('Postgres', OLD_SCHEMA, OLD_SCHEMA, 'old sql', None, ['tb_user'], context, force=True)
+    assert result.full_regeneration and result.sql_script != 'old sql'
+
+def test_changed_field_regenerates_affected_scripts(generator : IncrementalSqlGenerator):
+    context = get_generation_context('Postgres', None, ['tb_user'])
+    old_sql = generator.run('Postgres', None, OLD_SCHEMA, None, None, ['tb_user'], context).sql_script
+    result = generator.run('Postgres', OLD_SCHEMA, NEW_SCHEMA, old_sql, None, ['tb_user'], context)
+    assert not result.full_regeneration
+    assert result.regenerated == ['table', 'create', 'update', 'get', 'get_all']
+    assert 'ADD COLUMN email' in result.migration_script
@@ -0,0 +1,95 @@
+"""
+    Tests of LLM cache backends
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203,C0116
+
+import pytest
+
+from langchain_core.outputs import Generation
+
+from backend import llm_cache, prompts
+from backend.llm_cache import MemoryLRUCache, ShardedSQLiteCache, SQLiteWALCache, create_llm_cache
+from backend.metrics import track_cache_lookups
+
+class FakeClock:
+    """
+        Wall clock moved by test
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch) -> FakeClock:
+    """
+        Clock used by cache backends
+    """
+    clock = FakeClock()
+    monkeypatch.setattr(llm_cache.time, 'time', clock)
+    return clock
+
+def create_caches(tmp_path, max_size : int = 100, ttl_seconds : float = None) -> list:
+    return [
+        MemoryLRUCache(max_size, ttl_seconds),
+        SQLiteWALCache(str(tmp_path / "cache.db"), max_size, ttl_seconds),
+        ShardedSQLiteCache(str(tmp_path / "shards"), 2, max_size, ttl_seconds)
+    ]
+
+def test_lookup_and_update(tmp_path):
+    for cache in create_caches(tmp_path):
+        assert cache.lookup("prompt", "llm") is None
+        cache.update("prompt", "llm", [Generation(text="answer")])
+        assert [g.text for g in cache.lookup("prompt", "llm")] == ["answer"]
+        assert cache.lookup("prompt", "other llm") is None
+        cache.clear()
+        assert cache.lookup("prompt", "llm") is None
+
+def test_ttl(tmp_path, clock : FakeClock):
+    for cache in create_caches(tmp_path, ttl_seconds=60):
+        cache.update("prompt", "llm", [Generation(text="answer")])
+        clock.now += 30
+        assert cache.lookup("prompt", "llm") is not None
+        clock.now += 60
+        assert cache.lookup("prompt", "llm") is None
+
+def test_memory_lru_eviction():
+    cache = MemoryLRUCache(max_size=2)
+    cache.update("a", "llm", [Generation(text="a")])
+    cache.update("b", "llm", [Generation(text="b")])
+    cache.lookup("a", "llm")
+    cache.update("c", "llm", [Generation(text="c")])
+    assert cache.lookup("b", "llm") is None
+    assert cache.lookup("a", "llm") is not None and cache.lookup("c", "llm") is not None
+
+def test_sqlite_eviction_keeps_newest(tmp_path, clock : FakeClock):
+    cache = SQLiteWALCache(str(tmp_path / "cache.db"), max_size=2)
+    for prompt in ("a", "b", "c"):
+        clock.now += 1
+        cache.update(prompt, "llm", [Generation(text=prompt)])
+    cache.evict()
+    assert cache.lookup("a", "llm") is None
+    assert cache.lookup("b", "llm") is not None and cache.lookup("c", "llm") is not None
+
+def test_prompt_version_changes_key(tmp_path, monkeypatch):
+    cache = SQLiteWALCache(str(tmp_path / "cache.db"))
+    cache.update("prompt", "llm", [Generation(text="answer")])
+    monkeypatch.setattr(prompts, 'PROMPT_VERSION', prompts.PROMPT_VERSION + '-next')
+    assert cache.lookup("prompt", "llm") is None
+
+def test_lookups_are_reported():
+    cache = MemoryLRUCache()
+    cache.update("prompt", "llm", [Generation(text="answer")])
+    with track_cache_lookups() as lookups:
+        cache.lookup("prompt", "llm")
+        cache.lookup("other", "llm")
+    assert lookups == {"hits" : 1, "misses" : 1}
+
+def test_create_from_secrets(tmp_path):
+    assert create_llm_cache({"BACKEND" : "none"}) is None
+    assert isinstance(create_llm_cache({"BACKEND" : "memory", "MAX_SIZE" : 5}), MemoryLRUCache)
+    cache = create_llm_cache({"BACKEND" : "sharded", "PATH" : str(tmp_path / "shards"), "SHARDS" : 3, "TTL_SECONDS" : 10})
+    assert len(cache.shards) == 3 and cache.shards[0].ttl_seconds == 10.0
+    assert create_llm_cache({"BACKEND" : "redis"}) is None
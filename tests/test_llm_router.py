@@ -0,0 +1,224 @@
+"""
+    Tests of LLM router failover and release of deployments
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203,C0116
+
+import asyncio
+from typing import Any, AsyncIterator, Iterator
+
+import httpx
+import openai
+import pytest
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from backend import llm_router
+from backend.llm_core import UsageCallbackHandler
+from backend.llm_router import Deployment, LLMRouter, create_llm_router
+from benchmarks.stub_server import StubServer
+
+class ScriptedChatModel(BaseChatModel):
+    """
+        Chat model that fails with the given error or answers with chunks
+    """
+    error : Any = None
+    chunks : list[str] = ["a", "b", "c"]
+    calls : int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-chat-model"
+
+    def _generate(self, messages : list[BaseMessage], stop : list[str] = None, run_manager : Any = None, **kwargs : Any) -> ChatResult:
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(self.chunks)))], llm_output={"token_usage" : {"total_tokens" : 10}})
+
+    def _stream(self, messages : list[BaseMessage], stop : list[str] = None, run_manager : Any = None, **kwargs : Any) -> Iterator[ChatGenerationChunk]:
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        for chunk in self.chunks:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+
+    async def _astream(self, messages : list[BaseMessage], stop : list[str] = None, run_manager : Any = None, **kwargs : Any) -> AsyncIterator[ChatGenerationChunk]:
+        for chunk in self._stream(messages, stop, run_manager, **kwargs):
+            yield chunk
+
+class FakeTime:
+    """
+        Clock of the router moved by sleep, so bucket waits and cooldowns are measured without waiting
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds : float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def create_router(*errors : Exception) -> LLMRouter:
+    deployments = [Deployment(f"d{i}", ScriptedChatModel(error=error)) for i, error in enumerate(errors)]
+    return LLMRouter(deployments=deployments, backoff_seconds=0.0, max_attempts=len(deployments))
+
+def get_outstanding(router : LLMRouter) -> list[int]:
+    return [d.outstanding for d in router.deployments]
+
+@pytest.fixture(autouse=True)
+def fixture_ordered_candidates(monkeypatch):
+    """
+        Deployments that did not fail are tried in the order of the list
+    """
+    monkeypatch.setattr(LLMRouter, 'get_candidates', lambda self, excluded: [d for d in self.deployments if d.name not in excluded] + [d for d in self.deployments if d.name in excluded])
+
+@pytest.fixture(name="fake_time")
+def fixture_fake_time(monkeypatch) -> FakeTime:
+    """
+        Fake clock of the router, stub servers keep real time
+    """
+    fake_time = FakeTime()
+    monkeypatch.setattr(llm_router, 'time', fake_time)
+    return fake_time
+
+@pytest.fixture(name="start_stub_server")
+def fixture_start_stub_server():
+    """
+        Start stub servers, they are shut down after the test
+    """
+    servers = []
+    def start(**kwargs : Any) -> StubServer:
+        server = StubServer(**kwargs)
+        server.start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def create_stub_router(*deployments : tuple[StubServer, dict[str, Any]]) -> LLMRouter:
+    router_secrets = {"DEPLOYMENTS" : [{"NAME" : f"d{i}", "API_KEY" : "key", "BASE_URL" : server.base_url, **limits} for i, (server, limits) in enumerate(deployments)]}
+    return create_llm_router(router_secrets, 100, "gpt-4o")
+
+def test_failover_on_retryable_error():
+    router = create_router(httpx.ConnectError("down"), None)
+    result = router.invoke("hello")
+    assert result.content == "abc"
+    assert [d.requests for d in router.deployments] == [1, 1]
+    assert [d.failures for d in router.deployments] == [1, 0]
+    assert get_outstanding(router) == [0, 0]
+
+def test_not_retryable_error_is_raised():
+    router = create_router(ValueError("bad request"), None)
+    with pytest.raises(ValueError):
+        router.invoke("hello")
+    assert router.deployments[1].llm.calls == 0
+    assert get_outstanding(router) == [0, 0]
+
+def test_stream_failover_before_first_chunk():
+    router = create_router(httpx.ConnectError("down"), None)
+    assert "".join(c.content for c in router.stream("hello")) == "abc"
+    assert get_outstanding(router) == [0, 0]
+
+def test_stream_stopped_early_releases_deployment():
+    router = create_router(None)
+    stream = router.stream("hello")
+    assert next(stream).content == "a"
+    assert get_outstanding(router) == [1]
+    stream.close()
+    assert get_outstanding(router) == [0]
+
+def test_astream_stopped_early_releases_deployment():
+    router = create_router(None)
+
+    async def read_first_chunk():
+        stream = router.astream("hello")
+        chunk = await stream.__anext__()
+        await stream.aclose()
+        return chunk
+
+    assert asyncio.run(read_first_chunk()).content == "a"
+    assert get_outstanding(router) == [0]
+
+def test_cancelled_astream_releases_deployment():
+    router = create_router(None)
+    router.deployments[0].llm.chunks = ["a", "b"]
+
+    async def cancel_after_first_chunk():
+        started = asyncio.Event()
+
+        async def consume():
+            async for _ in router.astream("hello"):
+                started.set()
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(consume())
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_after_first_chunk())
+    assert get_outstanding(router) == [0]
+
+def test_stream_reports_deployment():
+    router = create_router(httpx.ConnectError("down"), None)
+    handler = UsageCallbackHandler()
+    assert "".join(c.content for c in router.stream("hello", config={"callbacks" : [handler]})) == "abc"
+    assert handler.deployment == "d1"
+
+def test_stub_rate_limit_puts_deployment_into_cooldown(fake_time, start_stub_server):
+    limited = start_stub_server(rate_limit_rate=1.0, retry_after_seconds=30)
+    healthy = start_stub_server()
+    router = create_stub_router((limited, {}), (healthy, {}))
+
+    handler = UsageCallbackHandler()
+    assert router.invoke("Table definition: Table user", config={"callbacks" : [handler]}).content
+    assert handler.deployment == "d1"
+    assert (limited.stats["errors"], healthy.stats["requests"]) == (1, 1)
+    assert router.deployments[0].cooldown_until == fake_time.now + 30
+    assert [d.failures for d in router.deployments] == [1, 0]
+
+    # deployment in cooldown is not called till Retry-After passes
+    router.invoke("Table definition: Table user")
+    assert (limited.stats["requests"], healthy.stats["requests"]) == (1, 2)
+    assert fake_time.sleeps == []
+
+    limited.rate_limit_rate = 0.0
+    fake_time.now += 30
+    handler = UsageCallbackHandler()
+    router.invoke("Table definition: Table user", config={"callbacks" : [handler]})
+    assert handler.deployment == "d0"
+    assert limited.stats["requests"] == 2
+
+def test_stub_rate_limit_of_all_deployments_waits_for_retry_after(fake_time, start_stub_server):
+    limited = start_stub_server(rate_limit_rate=1.0, retry_after_seconds=20)
+    router = create_stub_router((limited, {}))
+    router.max_attempts = 3
+    with pytest.raises(openai.RateLimitError):
+        router.invoke("Table definition: Table user")
+    # failed deployment is retried only after Retry-After
+    assert fake_time.sleeps == [20.0, 20.0]
+    assert limited.stats["requests"] == 3
+
+def test_stub_requests_bucket_fails_over_then_waits(fake_time, start_stub_server):
+    first = start_stub_server()
+    second = start_stub_server()
+    router = create_stub_router((first, {"RPM" : 2}), (second, {"RPM" : 1}))
+
+    for _ in range(3):
+        router.invoke("Table definition: Table user")
+    assert (first.stats["requests"], second.stats["requests"]) == (2, 1)
+    assert fake_time.sleeps == []
+
+    # both buckets are empty: wait for the first one to refill one request
+    router.invoke("Table definition: Table user")
+    assert fake_time.sleeps == [pytest.approx(30.0)]
+    assert (first.stats["requests"], second.stats["requests"]) == (3, 1)
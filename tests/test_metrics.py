@@ -0,0 +1,57 @@
+"""
+    Tests of call metrics and metrics sinks
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203,C0116
+
+import pytest
+
+from backend.llm_router import Deployment, LLMRouter
+from backend.metrics import CallMetrics, MetricsSink, PrometheusMetricsSink
+from benchmarks.fake_llm import FakeChatModel, FakeLLMCore
+
+class RecordingSink(MetricsSink):
+    """
+        Sink keeping recorded call metrics in list
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def record(self, call_metrics : CallMetrics):
+        self.calls.append(call_metrics)
+
+def test_sink_must_implement_record():
+    with pytest.raises(TypeError):
+        MetricsSink() # pylint: disable=E0110
+
+def test_prometheus_metadata():
+    sink = PrometheusMetricsSink()
+    sink.record(CallMetrics('generate_sql', 'gpt', 'd0', total_tokens=10, error='TimeoutError'))
+    sink.record(CallMetrics('generate_sql_schema', 'gpt', 'd1', total_tokens=5))
+    lines = sink.render().splitlines()
+    assert lines.count('# TYPE llm_total_tokens_total counter') == 1
+    assert lines.count('# TYPE llm_call_seconds histogram') == 1
+    assert '# HELP llm_errors_total Failed LLM calls' in lines
+    for i, line in enumerate(lines):
+        if line.startswith('# TYPE'):
+            name = line.split()[2]
+            assert lines[i - 1].startswith(f'# HELP {name} ')
+            assert lines[i + 1].startswith(name)
+    assert 'llm_total_tokens_total{operation="generate_sql",model="gpt",deployment="d0"} 10' in lines
+
+class RouterLLMCore(FakeLLMCore):
+    """
+        LLMCore with router of one fake deployment
+    """
+
+    def create_llm(self, max_tokens : int, model_name : str) -> LLMRouter:
+        return LLMRouter(deployments=[Deployment("east", FakeChatModel())])
+
+def test_deployment_of_router_call():
+    llm_core = RouterLLMCore({"llm_cache" : {"BACKEND" : "none"}})
+    sink = RecordingSink()
+    llm_core.metrics_sinks = [sink]
+    llm_core.generate_sql_schema('Postgres', 'Table user has id and name')
+    llm_core.generate_sql_schema_batch('Postgres', ['Table user has id and name', 'Table order has id and user'])
+    assert len(sink.calls) == 3
+    assert all(c.deployment == 'east' and c.total_tokens > 0 for c in sink.calls)
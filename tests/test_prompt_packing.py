@@ -0,0 +1,128 @@
+"""
+    Tests of packing several table descriptions into one prompt
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203,C0116
+
+from langchain_core.runnables import RunnableLambda
+
+from backend import prompt_budget, prompt_packing
+from backend.metrics import CallMetrics, MetricsSink
+from backend.prompt_packing import PackSizer, format_packed_descriptions
+from benchmarks.fake_llm import create_fake_llm_core
+
+class FakeClock:
+    """
+        Monotonic clock moved by test
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class RecordingSink(MetricsSink):
+    """
+        Sink keeping recorded call metrics in list
+    """
+
+    def __init__(self, calls : list[CallMetrics]):
+        self.calls = calls
+
+    def record(self, call_metrics : CallMetrics):
+        self.calls.append(call_metrics)
+
+def test_format_packed_descriptions():
+    assert format_packed_descriptions([' Table a ', 'Table b']) == '<table_definition id="1">\nTable a\n</table_definition>\n<table_definition id="2">\nTable b\n</table_definition>'
+
+def test_build_packs_by_table_limit():
+    sizer = PackSizer(max_tables=3, max_input_tokens=10000)
+    assert sizer.build_packs(['Table a'] * 7) == [[0, 1, 2], [3, 4, 5], [6]]
+
+def test_build_packs_by_input_tokens():
+    sizer = PackSizer(max_tables=8, max_input_tokens=30)
+    packs = sizer.build_packs(['word ' * 20, 'word ' * 20, 'short'])
+    assert packs == [[0], [1, 2]]
+
+def test_table_limit_by_output_tokens():
+    sizer = PackSizer(max_tables=8, max_output_tokens=1000, output_tokens_per_table=400)
+    assert sizer.get_table_limit() == 2
+
+def test_dropped_tables_shrink_packs():
+    sizer = PackSizer(max_tables=8, failure_half_life_seconds=0)
+    for _ in range(10):
+        sizer.record(8, 8, 0)
+    assert sizer.get_table_limit() == 1
+    for _ in range(20):
+        sizer.record(2, 0, 0)
+    assert sizer.get_table_limit() > 1
+
+def test_failure_rate_decays_with_time(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(prompt_packing.time, 'monotonic', clock)
+    sizer = PackSizer(max_tables=8, max_output_tokens=10000, failure_half_life_seconds=60)
+    for _ in range(20):
+        sizer.record(8, 8, 0)
+    assert sizer.get_table_limit() == 1
+    clock.now += 600
+    assert sizer.get_table_limit() == 8
+
+def test_failed_calls_do_not_shrink_packs():
+    llm_core = create_fake_llm_core()
+    llm_core._PACK_SCHEMA_GENERATION = True # pylint: disable=W0212
+    def fail(_ : dict) -> str:
+        raise TimeoutError("timeout")
+    llm_core.chain_generate_sql_schema_packed = RunnableLambda(fail)
+    for _ in range(3):
+        results = llm_core.generate_sql_schema_batch('Postgres', [f"Table t{i} has id and name" for i in range(8)])
+        # failed packs fall back to one call per table
+        assert all(r.table_name for r in results)
+    assert llm_core.schema_pack_sizer.failure_rate == 0.0
+
+def test_dropped_tables_are_recorded():
+    llm_core = create_fake_llm_core()
+    llm_core._PACK_SCHEMA_GENERATION = True # pylint: disable=W0212
+    llm_core.chain_generate_sql_schema_packed = RunnableLambda(lambda _ : '<output><table id="1" name="tb_t0"><field name="id" type="INT" /></table></output>')
+    results = llm_core.generate_sql_schema_batch('Postgres', [f"Table t{i} has id and name" for i in range(4)])
+    assert all(r.table_name for r in results)
+    assert llm_core.schema_pack_sizer.failure_rate > 0.0
+
+def test_split_tokens_keeps_sum():
+    assert prompt_budget.split_tokens(10, 3) == [3, 3, 4]
+    assert prompt_budget.split_tokens(2, 4) == [0, 0, 0, 2]
+    assert prompt_budget.split_tokens(5, 0) == []
+
+def test_packed_tokens_are_not_lost():
+    llm_core = create_fake_llm_core()
+    llm_core._PACK_SCHEMA_GENERATION = True # pylint: disable=W0212
+    descriptions = [f"Table t{i} has id and name" for i in range(3)]
+    calls = []
+    llm_core.metrics_sinks = [RecordingSink(calls)]
+    results = llm_core.generate_sql_schema_batch('Postgres', descriptions)
+    assert all(r.table_name for r in results)
+    assert sum(r.tokens_used for r in results) == sum(c.total_tokens for c in calls)
+
+def test_pack_id_is_not_stored_in_schema():
+    llm_core = create_fake_llm_core()
+    llm_core._PACK_SCHEMA_GENERATION = True # pylint: disable=W0212
+    llm_core.chain_generate_sql_schema_packed = RunnableLambda(lambda _ : '<output><table id="1" name="tb_t0" comment="people"><field name="id" type="INT" /></table><table id="2" name="tb_t1"><field name="id" type="INT" /></table></output>')
+    results = llm_core.generate_sql_schema_batch('Postgres', ["Table t0 has id", "Table t1 has id"])
+    assert [r.table_name for r in results] == ['tb_t0', 'tb_t1']
+    assert all(' id=' not in r.table_schema for r in results)
+    assert 'comment="people"' in results[0].table_schema
+
+def test_pack_id_is_not_stored_in_recorded_schemas():
+    llm_core = create_fake_llm_core()
+    llm_core._PACK_SCHEMA_GENERATION = True # pylint: disable=W0212
+    results = llm_core.generate_sql_schema_batch('Postgres', [f"Table t{i} has id and name" for i in range(3)])
+    assert all(r.table_schema and ' id=' not in r.table_schema for r in results)
+
+def test_trimmed_tables_are_reported():
+    llm_core = create_fake_llm_core()
+    llm_core._EXISTED_TABLES_MAX_TOKENS = 30 # pylint: disable=W0212
+    existed_tables = [f"tb_other_{i}" for i in range(20)] + ['tb_org']
+    with prompt_budget.track_trimmed_tables() as trimmed_tables:
+        results = llm_core.generate_sql_schema_batch('Postgres', ["Table user has id and org"], existed_tables=existed_tables)
+    assert results[0].table_name
+    assert trimmed_tables and 'tb_org' not in trimmed_tables
+    assert set(trimmed_tables) < set(existed_tables)
@@ -0,0 +1,78 @@
+"""
+    Tests of table schema model
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203,C0116
+
+from backend.schema_model import ForeignKeyRef, TableSchema, normalize_table_schema, parse_table_schema, parse_table_schemas
+
+ORDER_XML = """<table name="tb_order">
+    <field name="id" type="SERIAL" primary_key="true" />
+    <field name="user_id" type="INT" not_null="true" foreign_key="tb_user(id)" />
+    <field name="code" type="VARCHAR(20)" unique="true" />
+    <field name="total" type="DECIMAL(10,2)" default="0" />
+    <unique fields="user_id,code" />
+</table>"""
+
+ORDER_PRISMA = """model tb_order {
+  id      Int     @id @default(autoincrement())
+  user_id Int
+  code    String? @unique @db.VarChar(20)
+  user    tb_user @relation(fields: [user_id], references: [id])
+  @@unique([user_id, code])
+}"""
+
+def test_parse_xml():
+    table = parse_table_schema(ORDER_XML)
+    assert table.name == 'tb_order'
+    assert [f.name for f in table.fields] == ['id', 'user_id', 'code', 'total']
+    assert table.primary_key == ['id']
+    assert table.dependencies == {'tb_user'}
+    assert table.unique_constraints == [('user_id', 'code')]
+    assert table.get_field('USER_ID').not_null
+
+def test_xml_round_trip():
+    table = parse_table_schema(ORDER_XML)
+    assert TableSchema.from_xml(table.to_xml()).to_xml() == table.to_xml()
+    assert normalize_table_schema(ORDER_XML) == ORDER_XML
+
+def test_normalize_keeps_user_attributes():
+    schema = '<table name="tb_person" comment="people"><field name="id" type="INT" primary_key="true" description="Person id" /><field name="age" type="INT" check="age &gt; 0" /><index fields="age" /></table>'
+    normalized = normalize_table_schema(schema)
+    assert 'comment="people"' in normalized
+    assert 'description="Person id"' in normalized
+    assert 'check="age &gt; 0"' in normalized
+    assert '<index fields="age" />' in normalized
+    assert parse_table_schema(normalized).get_field('age').extra == {'check' : 'age > 0'}
+
+def test_normalize_keeps_text_that_is_not_schema():
+    assert normalize_table_schema('just text') == 'just text'
+
+def test_parse_prisma():
+    table = parse_table_schema(ORDER_PRISMA)
+    assert table.name == 'tb_order'
+    assert table.get_field('id').type == 'SERIAL'
+    assert table.get_field('code').type == 'VARCHAR(20)' and table.get_field('code').unique
+    assert str(table.get_field('user_id').foreign_key) == 'tb_user(id)'
+    assert table.unique_constraints == [('user_id', 'code')]
+    assert table.get_field('user') is None
+
+def test_parse_several_tables():
+    tables = parse_table_schemas(ORDER_XML + '\n<table name="tb_user"><field name="id" type="INT" /></table>')
+    assert [t.name for t in tables] == ['tb_order', 'tb_user']
+
+def test_parse_foreign_key():
+    assert str(ForeignKeyRef.parse('tb_user')) == 'tb_user(id)'
+    assert str(ForeignKeyRef.parse('tb_user(uid)')) == 'tb_user(uid)'
+    assert str(ForeignKeyRef.parse('tb_user.uid')) == 'tb_user(uid)'
+    assert str(ForeignKeyRef.parse(' tb_user ( uid ) ')) == 'tb_user(uid)'
+    assert ForeignKeyRef.parse('true') is None
+    assert ForeignKeyRef.parse('false') is None
+    assert ForeignKeyRef.parse(None) is None
+
+def test_parse_schema_qualified_foreign_key():
+    reference = ForeignKeyRef.parse('public.tb_org(id)')
+    assert (reference.table, reference.column) == ('public.tb_org', 'id')
+    reference = ForeignKeyRef.parse('public.tb_org.code')
+    assert (reference.table, reference.column) == ('public.tb_org', 'code')
+    table = parse_table_schema('<table name="tb_user"><field name="org_id" type="INT" foreign_key="public.tb_org(id)" /></table>')
+    assert table.dependencies == {'public.tb_org'}
@@ -0,0 +1,42 @@
+"""
+    Tests of multi-table SQL pipeline
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203,C0116
+
+from backend.sql_pipeline import SqlPipeline, build_dependency_levels, get_table_dependencies, get_unqualified_name
+from benchmarks.fake_llm import create_fake_llm_core
+
+ORG_XML = '<table name="tb_org"><field name="id" type="SERIAL" primary_key="true" /></table>'
+USER_XML = '<table name="tb_user"><field name="id" type="SERIAL" primary_key="true" /><field name="org_id" type="INT" foreign_key="tb_org(id)" /></table>'
+ORDER_XML = '<table name="tb_order"><field name="id" type="SERIAL" primary_key="true" /><field name="user_id" type="INT" foreign_key="tb_user(id)" /><field name="org_id" type="INT" foreign_key="tb_org(id)" /></table>'
+
+def test_unqualified_name():
+    assert get_unqualified_name('public."TB_Org"') == 'tb_org'
+    assert get_unqualified_name('[dbo].[tb_user]') == 'tb_user'
+    assert get_unqualified_name('tb_order') == 'tb_order'
+
+def test_table_dependencies():
+    assert get_table_dependencies(ORDER_XML) == ('tb_order', {'tb_user', 'tb_org'})
+    assert get_table_dependencies('not a schema') == (None, set())
+
+def test_dependency_levels():
+    levels = build_dependency_levels({'tb_order' : {'tb_user', 'tb_org'}, 'tb_user' : {'tb_org'}, 'tb_org' : set(), 'tb_tag' : set()})
+    assert levels == [['tb_org', 'tb_tag'], ['tb_user'], ['tb_order']]
+
+def test_dependency_levels_match_qualified_names():
+    levels = build_dependency_levels({'tb_user' : {'public.TB_ORG', 'tb_user'}, 'public.tb_org' : {'tb_external'}})
+    assert levels == [['public.tb_org'], ['tb_user']]
+
+def test_cyclic_dependencies_go_last():
+    levels = build_dependency_levels({'tb_a' : {'tb_b'}, 'tb_b' : {'tb_a'}, 'tb_c' : set()})
+    assert levels == [['tb_c'], ['tb_a', 'tb_b']]
+
+def test_pipeline_orders_script_and_passes_new_tables():
+    pipeline = SqlPipeline(create_fake_llm_core())
+    result = pipeline.run('Postgres', [ORDER_XML, USER_XML, ORG_XML, 'not a schema'])
+    assert result.levels == [['tb_org'], ['tb_user'], ['tb_order']]
+    positions = [result.sql_script.find(f"-- {t}\n") for t in ('tb_org', 'tb_user', 'tb_order')]
+    assert positions[0] == 0 and positions == sorted(positions)
+    # tables of previous levels are known, so references are not reported as missing
+    assert result.errors == ["Could not find table name in table schema"]
+    assert result.tokens_used == sum(t.tokens_used for t in result.tables.values())
@@ -0,0 +1,54 @@
+"""
+    Tests of local validation and repair of generated SQL
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203,C0116
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from backend.sql_validator import SqlValidator, get_sqlglot_dialect, replace_statements, split_sql_statements, strip_statement_delimiter
+from benchmarks.fake_llm import create_fake_llm_core
+
+SCRIPT = """CREATE TABLE tb_a (id INT PRIMARY KEY, name VARCHAR(10));
+CREATE INDEX ix_a ON tb_a (missing);
+CREATE TABLE tb_b (id INT, a_id INT REFERENCES tb_x(id));
+SELEC * FROM tb_a;
+CREATE OR REPLACE FUNCTION f() RETURNS int AS $$ BEGIN RETURN 1; END; $$ LANGUAGE plpgsql;"""
+
+def test_dialects():
+    assert get_sqlglot_dialect('SQL Server') == 'tsql'
+    assert get_sqlglot_dialect('PostgreSQL') == 'postgres'
+    assert get_sqlglot_dialect('MySQL') == 'mysql'
+    assert get_sqlglot_dialect('unknown') is None
+
+def test_split_keeps_bodies_whole():
+    statements = split_sql_statements(SCRIPT)
+    assert len(statements) == 5
+    assert statements[4].text.endswith('LANGUAGE plpgsql') and statements[4].line == 5
+    statements = split_sql_statements("DELIMITER //\nCREATE PROCEDURE p() BEGIN SELECT 1; SELECT 2; END //\nDELIMITER ;\nSELECT 'a;b';")
+    assert [s.text for s in statements] == ["CREATE PROCEDURE p() BEGIN SELECT 1; SELECT 2; END", "SELECT 'a;b'"]
+    statements = split_sql_statements("CREATE TABLE t (id INT)\nGO\nCREATE PROCEDURE p AS BEGIN SELECT 1; END\nGO")
+    assert [s.text for s in statements] == ["CREATE TABLE t (id INT)", "CREATE PROCEDURE p AS BEGIN SELECT 1; END"]
+
+def test_replace_statements():
+    statements = split_sql_statements("SELECT 1;\nSELECT 2;")
+    assert replace_statements("SELECT 1;\nSELECT 2;", statements, {1 : "SELECT 3"}) == "SELECT 1;\nSELECT 3;"
+    assert strip_statement_delimiter("```sql\nSELECT 3;\n```") == "SELECT 3"
+
+def test_validate_reports_parse_and_execute_errors():
+    _, errors = SqlValidator().validate(SCRIPT, 'Postgres')
+    assert [(e.statement_index, e.line, e.stage) for e in errors] == [(1, 2, 'execute'), (3, 4, 'parse')]
+    assert errors[0].message == 'no such column: missing'
+
+def test_validate_unknown_dialect_is_skipped():
+    assert SqlValidator().validate("SELEC", 'unknown')[1] == []
+
+def test_only_failing_statements_are_repaired():
+    llm_core = create_fake_llm_core()
+    llm_core.sql_validator = SqlValidator()
+    llm_core.llm = FakeListChatModel(responses=["CREATE INDEX ix_a ON tb_a (name);", "SELECT * FROM tb_a;"])
+    llm_core._MAX_CONCURRENCY = 1 # pylint: disable=W0212
+    sql_script, errors, _ = llm_core.validate_sql('Postgres', SCRIPT)
+    assert errors == []
+    statements = split_sql_statements(sql_script)
+    assert [s.text for s in statements[1:4:2]] == ["CREATE INDEX ix_a ON tb_a (name)", "SELECT * FROM tb_a"]
+    assert statements[0].text == split_sql_statements(SCRIPT)[0].text
@@ -0,0 +1,69 @@
+"""
+    Tests of tolerant parsing of LLM generated XML
+"""
+# pylint: disable=C0301,C0103,C0303,C0411,W1203,C0116
+
+import pytest
+import xml.etree.ElementTree as ET
+from typing import Any
+
+from langchain_core.runnables import RunnableLambda
+
+from backend import xml_utils
+from benchmarks.fake_llm import create_fake_llm_core
+
+def test_parse_valid_xml():
+    x = xml_utils.parse_llm_xml('```xml\n<output><sql_script_text>SELECT 1;</sql_script_text></output>\n```')
+    assert xml_utils.get_text_by_xpath(x, './/sql_script_text') == 'SELECT 1;'
+
+def test_repair_free_text_and_ampersand():
+    x = xml_utils.parse_llm_xml('Here it is: <output><table name="tb_a &amp; b"><prisma>a < b && c</prisma></table><sql_script_text>SELECT * FROM tb_a WHERE a < 1 & 2;</sql_script_text></output> done')
+    assert xml_utils.get_text_by_xpath(x, './/prisma') == 'a < b && c'
+    assert xml_utils.get_text_by_xpath(x, './/sql_script_text') == 'SELECT * FROM tb_a WHERE a < 1 & 2;'
+
+def test_repair_closes_truncated_output():
+    x = xml_utils.parse_llm_xml('<output><table name="tb_a"><field name="id" type="INT" />')
+    assert [t.attrib['name'] for t in x.iter('table')] == ['tb_a']
+
+def test_regex_fallback():
+    x = xml_utils.parse_llm_xml('<output><table name="tb_a"><field name="id" type="INT"></table><table name="tb_b"></output>')
+    assert [t.attrib['name'] for t in x.iter('table')] == ['tb_a', 'tb_b']
+
+def test_not_xml_raises():
+    with pytest.raises(ET.ParseError):
+        xml_utils.parse_llm_xml('no xml here')
+    assert xml_utils.try_parse_llm_xml('no xml here') is None
+
+def test_is_truncated():
+    assert xml_utils.is_truncated('<output><sql_script_text>CREATE TABLE tb_a (id int')
+    assert xml_utils.is_truncated('<output><sql_script_text>CREATE TABLE tb_a (id int);</sql_script_text>')
+    assert not xml_utils.is_truncated('<output><sql_script_text>CREATE TABLE tb_a (id int);</sql_script_text></output>')
+    assert not xml_utils.is_truncated('<output><sql_script_text /></output>')
+
+def test_truncated_sql_is_reported():
+    llm_core = create_fake_llm_core()
+    sql_xml = '<output><created_tables><table>tb_a</table></created_tables><sql_script_text>CREATE TABLE tb_a (id int'
+    repaired, tokens_used = llm_core.repair_llm_xml(sql_xml)
+    assert (repaired, tokens_used) == (sql_xml, 0)
+    assert llm_core.llm.calls == 0
+    new_tables, sql_script, local_errors = llm_core.parse_sql(repaired, [])
+    assert new_tables == ['tb_a'] and sql_script.startswith('CREATE TABLE tb_a')
+    assert any('truncated' in e for e in local_errors)
+
+def test_complete_sql_has_no_errors():
+    _, _, local_errors = create_fake_llm_core().parse_sql('<output><sql_script_text>CREATE TABLE tb_a (id int);</sql_script_text></output>', [])
+    assert local_errors == []
+
+def test_failed_repair_call_fails_only_its_item():
+    llm_core = create_fake_llm_core()
+    def generate(inputs : dict) -> str:
+        if 'broken' in inputs["table_description"]:
+            return 'no xml here'
+        return '<output><table name="tb_a"><field name="id" type="INT" /></table></output>'
+    def fail(_ : Any) -> str:
+        raise TimeoutError("timeout")
+    llm_core.chain_generate_sql_schema = RunnableLambda(generate)
+    llm_core.get_fix_xml_chain = lambda _ : RunnableLambda(lambda x : x) | RunnableLambda(fail) | RunnableLambda(lambda x : x)
+    results = llm_core.generate_sql_schema_batch('Postgres', ["Table a has id", "Table broken has id", "Table a has id"])
+    assert [r.table_name for r in results] == ['tb_a', None, 'tb_a']
+    assert 'timeout' in results[1].error
@@ -3,39 +3,138 @@
 """
 # pylint: disable=C0301,C0103,C0303,C0304,C0305,C0411,E1121
 
-import os
+import atexit
+import contextvars
+import json
 import logging
-from datetime import datetime
+import logging.handlers
+import os
+import queue
+import threading
+import uuid
 
 import streamlit as st
 
 from utils.colored_console_formatter import ColoredConsoleFormatter
 
 LOG_FOLDER = '.logs'
+LOG_FILE = 'app.log'
+FILE_FORMAT = "%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s (%(filename)s:%(lineno)d)"
 
-def init_streamlit_logger():
-    """Init logger for streamlit"""
-    SESSION_LOGGER   = 'logger'
-    if SESSION_LOGGER not in st.session_state:
-        st.session_state[SESSION_LOGGER] = None
+_request_id : contextvars.ContextVar[str] = contextvars.ContextVar('request_id', default='-')
+_queue_listener : logging.handlers.QueueListener = None
+_queue_listener_lock = threading.Lock()
+
+def set_request_id(request_id : str = None) -> str:
+    """Set request id of the current context (thread or task), new id is generated if not provided"""
+    request_id = request_id or uuid.uuid4().hex[:12]
+    _request_id.set(request_id)
+    return request_id
+
+def get_request_id() -> str:
+    """Request id of the current context"""
+    return _request_id.get()
+
+class RequestContextFilter(logging.Filter):
+    """Add request id to the record and apply per-module levels, runs on the request thread"""
+
+    def __init__(self, default_level : int = logging.NOTSET, module_levels : dict[str, int] = None):
+        super().__init__()
+        self.default_level = default_level
+        self.module_levels = module_levels or {}
+
+    def filter(self, record : logging.LogRecord) -> bool:
+        level = self.module_levels.get(record.module, self.default_level)
+        if record.levelno < level:
+            return False
+        record.request_id = _request_id.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
 
-    logger : logging.Logger = st.session_state[SESSION_LOGGER]
-    if not logger:
-        logger = init_root_logger()
-        st.session_state[SESSION_LOGGER] = logger
+    def format(self, record : logging.LogRecord) -> str:
+        item = {
+            "time"       : self.formatTime(record),
+            "level"      : record.levelname,
+            "request_id" : getattr(record, 'request_id', '-'),
+            "thread"     : record.threadName,
+            "module"     : record.module,
+            "line"       : record.lineno,
+            "message"    : record.getMessage()
+        }
+        if record.exc_info:
+            item["exception"] = self.formatException(record.exc_info)
+        return json.dumps(item, ensure_ascii=False)
 
+def get_level(level : str, default : int = logging.INFO) -> int:
+    """Level by name or number, default if level is not set or unknown"""
+    if level is None:
+        return default
+    if isinstance(level, int) or str(level).isdigit():
+        return int(level)
+    level_number = logging.getLevelName(str(level).upper())
+    return level_number if isinstance(level_number, int) else default
 
-def init_root_logger():
-    """Init root logger"""
+def create_file_handler(log_secrets : dict) -> logging.Handler:
+    """Rotating file handler: by time if ROTATE_WHEN is set (e.g. midnight), otherwise by size"""
+    log_folder = log_secrets.get('FOLDER', LOG_FOLDER)
+    os.makedirs(log_folder, exist_ok=True)
+    log_path = os.path.join(log_folder, log_secrets.get('FILE', LOG_FILE))
+    backup_count = int(log_secrets.get('BACKUP_COUNT', 7))
+    rotate_when = log_secrets.get('ROTATE_WHEN')
+    if rotate_when:
+        return logging.handlers.TimedRotatingFileHandler(log_path, when=rotate_when, backupCount=backup_count, encoding='utf-8')
+    max_bytes = int(log_secrets.get('MAX_BYTES', 10 * 1024 * 1024))
+    return logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
 
+def init_streamlit_logger():
+    """Init logger for streamlit, each session gets own request id"""
+    SESSION_ID = 'logger_session_id'
+    if SESSION_ID not in st.session_state:
+        st.session_state[SESSION_ID] = uuid.uuid4().hex[:12]
+    try:
+        log_secrets = st.secrets.get('logging')
+    except FileNotFoundError:
+        log_secrets = None
+    init_root_logger(log_secrets)
+    set_request_id(st.session_state[SESSION_ID])
+
+
+def init_root_logger(log_secrets : dict = None) -> logging.Logger:
+    """
+    Init root logger once per process: request threads only put records into a queue,
+    a background listener writes them to console and rotating file.
+    [logging] secrets: LEVEL, CONSOLE_LEVEL, FILE_LEVEL, MODULE_LEVELS (module -> level),
+    FORMAT (text or json), FOLDER, FILE, MAX_BYTES, ROTATE_WHEN, BACKUP_COUNT
+    """
+    global _queue_listener # pylint: disable=W0603
     logger = logging.getLogger()
-    logger.handlers.clear()
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(ColoredConsoleFormatter())
-    logger.addHandler(stream_handler)
-    os.makedirs(LOG_FOLDER, exist_ok=True)
-    file_handler = logging.FileHandler(rf'{LOG_FOLDER}\log{datetime.now().strftime("%Y-%m-%d")}.log')
-    logger.addHandler(file_handler)
-    logger.setLevel(logging.DEBUG)
+    with _queue_listener_lock:
+        if _queue_listener is not None:
+            return logger
+
+        log_secrets = log_secrets or {}
+        level = get_level(log_secrets.get('LEVEL'))
+        module_levels = {m : get_level(l) for m, l in (log_secrets.get('MODULE_LEVELS') or {}).items()}
+
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(ColoredConsoleFormatter())
+        stream_handler.setLevel(get_level(log_secrets.get('CONSOLE_LEVEL'), logging.NOTSET))
+        file_handler = create_file_handler(log_secrets)
+        file_handler.setFormatter(JsonFormatter() if log_secrets.get('FORMAT') == 'json' else logging.Formatter(FILE_FORMAT))
+        file_handler.setLevel(get_level(log_secrets.get('FILE_LEVEL'), logging.NOTSET))
+
+        queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(RequestContextFilter(level, module_levels))
+
+        logger.handlers.clear()
+        logger.addHandler(queue_handler)
+        # root level lets through records of modules configured with lower level, filter drops the rest
+        logger.setLevel(min([level] + list(module_levels.values())))
+
+        _queue_listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler, file_handler, respect_handler_level=True)
+        _queue_listener.start()
+        atexit.register(_queue_listener.stop)
 
     return logger
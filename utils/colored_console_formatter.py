@@ -12,7 +12,7 @@ class ColoredConsoleFormatter(logging.Formatter):
     red = "\x1b[31;20m"
     bold_red = "\x1b[31;1m"
     reset = "\x1b[0m"
-    format_str = "%(asctime)s - %(levelname)s - %(message)s (%(filename)s:%(lineno)d)"
+    format_str = "%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s (%(filename)s:%(lineno)d)"
 
     FORMATS = {
         logging.DEBUG: grey + format_str + reset,
@@ -24,5 +24,5 @@ class ColoredConsoleFormatter(logging.Formatter):
 
     def format(self, record : any):
         log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
+        formatter = logging.Formatter(log_fmt, defaults={'request_id' : '-'})
         return formatter.format(record)